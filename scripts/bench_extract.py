@@ -0,0 +1,114 @@
+#!/usr/bin/env -S uv run python
+"""Measure osmium extract passes of increasing size, to set tm_configs.py's defaults.
+
+    bench_extract.py data/tm/_filtered-*.osm.pbf
+    bench_extract.py planet.osm.pbf --polygons data/tm --sizes 10,50,200
+
+Each size is one `osmium extract --strategy complete_ways` pass over the source
+with that many project polygons, the `<id>.geojson` files `tm_configs.py --extract`
+leaves next to the project PBFs, reused round-robin when there are fewer. Every
+pass records its wall time and peak RSS. The memory per extract is the slope of
+peak RSS over extract count, and the batch size recommended is the one with the
+most extracts per second among those whose pass fits the memory given. Copy the
+printed EXTRACT_BATCH and EXTRACT_MB into tm_configs.py.
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from host import host_memory_gb
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SIZES = (10, 25, 50, 100, 200)
+
+
+def run_pass(source: Path, polygons: list[Path], size: int, scratch: Path) -> dict:
+    """One pass with `size` extracts: its wall time and peak RSS in MB."""
+    out_dir = scratch / str(size)
+    out_dir.mkdir()
+    extracts = [
+        {
+            "output": f"{index}.osm.pbf",
+            "polygon": {"file_name": str(polygons[index % len(polygons)]), "file_type": "geojson"},
+        }
+        for index in range(size)
+    ]
+    config = out_dir / "extracts.json"
+    config.write_text(json.dumps({"directory": str(out_dir), "extracts": extracts}), "utf-8")
+    command = ["osmium", "extract", "--config", str(config), "--strategy", "complete_ways"]
+    started = time.monotonic()
+    process = subprocess.Popen([*command, "--overwrite", str(source)])
+    _, status, usage = os.wait4(process.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(
+            f"osmium extract of {size} failed: rc={os.waitstatus_to_exitcode(status)}"
+        )
+    return {"size": size, "seconds": time.monotonic() - started, "peak_mb": usage.ru_maxrss / 1024}
+
+
+def recommend(results: list[dict], memory_gb: float) -> tuple[int, int]:
+    """(batch size, MB per extract) from the passes. The slope is a least-squares fit
+    of peak RSS over size, rounded up; a single pass is divided by its size."""
+    sizes = [r["size"] for r in results]
+    peaks = [r["peak_mb"] for r in results]
+    if len(results) > 1:
+        mean_size, mean_peak = sum(sizes) / len(sizes), sum(peaks) / len(peaks)
+        spread = sum((s - mean_size) ** 2 for s in sizes)
+        slope = sum((s - mean_size) * (p - mean_peak) for s, p in zip(sizes, peaks, strict=True))
+        per_extract = slope / spread if spread else peaks[0] / sizes[0]
+    else:
+        per_extract = peaks[0] / sizes[0]
+    per_extract = max(1, math.ceil(round(per_extract, 6)))
+    fitting = [r for r in results if r["peak_mb"] <= memory_gb * 1024] or results[:1]
+    best = max(fitting, key=lambda r: r["size"] / r["seconds"])
+    return best["size"], per_extract
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("source", type=Path, help="the PBF the passes read")
+    parser.add_argument("--polygons", type=Path, default=REPO_ROOT / "data" / "tm")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, SIZES)),
+        help=f"extracts per pass to try (default {','.join(map(str, SIZES))})",
+    )
+    parser.add_argument(
+        "--memory-gb",
+        type=float,
+        help="memory a pass may use (default half the host's, as tm_configs.py assumes)",
+    )
+    args = parser.parse_args()
+
+    polygons = sorted(args.polygons.glob("*.geojson"))
+    if not polygons:
+        print(f"bench: no *.geojson polygons in {args.polygons}", file=sys.stderr)
+        return 2
+    sizes = sorted({int(size) for size in args.sizes.split(",")})
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench-extract-") as scratch:
+        for size in sizes:
+            result = run_pass(args.source, polygons, size, Path(scratch))
+            print(
+                f"{size:>5} extracts: {result['seconds']:8.1f}s "
+                f"{result['peak_mb']:8.0f} MB peak {size / result['seconds']:8.2f} extracts/s",
+                flush=True,
+            )
+            results.append(result)
+    batch, per_extract = recommend(results, args.memory_gb or host_memory_gb() / 2)
+    print(f"EXTRACT_BATCH = {batch}\nEXTRACT_MB = {per_extract}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+#!/usr/bin/env -S uv run python
+"""A local, versioned store of country boundaries, so jobs do not fetch their own.
+
+    boundaries.py refresh              fetch the boundaries again, if any has changed
+    boundaries.py refresh NPL          only this country's
+    boundaries.py refresh --force      fetch them again regardless
+    boundaries.py show NPL             what the store holds for one country
+
+Every country job would otherwise resolve its boundary from geoBoundaries at run
+time: the same download about 280 times a month, and a network blip fails the job.
+The store is one SQLite file. It holds the boundaries oex itself would fetch, gbOpen
+at base.yaml's `geoboundaries_level`, one country at a time, under the version they
+were fetched at. sweep.py's country_config() inlines a country's boundary into
+`.sweep/merged/<ISO3>.yaml` as stored, buffered by `buffer_meters` as oex would
+buffer it, and that buffered form is computed once per version, not once per job.
+
+The sweep refreshes the store before it resolves the schedule, for the countries it
+is about to run and only those not checked in the last CHECK_AFTER_SECONDS. A check
+is one metadata call per country, several at a time, and a country is downloaded
+again only when its build date has changed. A country whose call fails keeps the
+build and boundary already stored; the others move to a new version that carries it
+over. `boundaries.py refresh` checks every scheduled country regardless of age.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import shapely
+import yaml
+from pyproj import CRS, Transformer
+from shapely.geometry import mapping, shape
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+BASE_CONFIG = REPO_ROOT / "configs" / "base.yaml"
+SCHEDULE_FILE = REPO_ROOT / "scripts" / "schedule.yaml"
+# The release oex.boundary resolves from. An inlined boundary must be the one oex
+# would have fetched, or every export's footprint moves with it.
+RELEASE = "gbOpen"
+API_URL = "https://www.geoboundaries.org/api/current/{release}/{iso3}/{level}/"
+HTTP_TIMEOUT_SECONDS = 300
+# A metadata call is a few hundred bytes; one that takes longer is not coming.
+METADATA_TIMEOUT_SECONDS = 30
+WORKERS = 8
+# A sweep checks a country again once its last check is this old. geoBoundaries
+# rebuilds a country a few times a year.
+CHECK_AFTER_SECONDS = 7 * 24 * 60 * 60
+# Versions kept per level: the current one and the one before it.
+KEEP_VERSIONS = 2
+LOCK_WAIT_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    release TEXT, level TEXT, version TEXT, fetched REAL, countries INTEGER,
+    PRIMARY KEY (release, level, version)
+);
+CREATE TABLE IF NOT EXISTS boundaries (
+    release TEXT, level TEXT, version TEXT, iso3 TEXT, geojson TEXT,
+    PRIMARY KEY (release, level, version, iso3)
+);
+CREATE TABLE IF NOT EXISTS buffered (
+    release TEXT, level TEXT, version TEXT, iso3 TEXT, buffer_m REAL, geojson TEXT,
+    PRIMARY KEY (release, level, version, iso3, buffer_m)
+);
+CREATE TABLE IF NOT EXISTS builds (
+    release TEXT, level TEXT, version TEXT, iso3 TEXT, build TEXT, checked REAL,
+    PRIMARY KEY (release, level, version, iso3)
+);
+"""
+
+
+class BoundaryError(Exception):
+    """A release could not be fetched."""
+
+
+def default_store() -> Path:
+    """Next to the other data, under OEX_DATA_DIR as base.yaml puts it."""
+    return Path(os.environ.get("OEX_DATA_DIR", REPO_ROOT)) / "data" / "boundaries.sqlite"
+
+
+def connect(path: Path, read_only: bool = False) -> sqlite3.Connection:
+    """The store, created if missing, or opened read-only, as a rehearsal wants it.
+    A writer waits up to LOCK_WAIT_SECONDS for another, such as a second shard's."""
+    if read_only:
+        return sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=LOCK_WAIT_SECONDS)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def current_version(conn: sqlite3.Connection, release: str, level: str) -> str | None:
+    row = conn.execute(
+        "SELECT version FROM versions WHERE release = ? AND level = ? "
+        "ORDER BY fetched DESC LIMIT 1",
+        (release, level),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def stored_builds(
+    conn: sqlite3.Connection, release: str, level: str, version: str
+) -> dict[str, tuple[str, float]]:
+    """(build date, time last checked) of each country a version holds."""
+    rows = conn.execute(
+        "SELECT iso3, build, checked FROM builds WHERE release = ? AND level = ? AND version = ?",
+        (release, level, version),
+    )
+    return {iso3: (build, checked) for iso3, build, checked in rows}
+
+
+def store_release(
+    conn: sqlite3.Connection,
+    release: str,
+    level: str,
+    version: str,
+    geometries: dict[str, dict],
+    builds: dict[str, tuple[str, float]] | None = None,
+    carry: str | None = None,
+) -> None:
+    """Add a version and make it current, dropping versions beyond KEEP_VERSIONS.
+    With carry, the countries of that version not in geometries come over unchanged,
+    their buffered forms with them."""
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?)",
+            (release, level, version, time.time(), len(geometries)),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO boundaries VALUES (?, ?, ?, ?, ?)",
+            [
+                (release, level, version, iso3.upper(), json.dumps(geometry))
+                for iso3, geometry in geometries.items()
+            ],
+        )
+        if carry is not None and carry != version:
+            fresh = [iso3.upper() for iso3 in geometries]
+            marks = ", ".join("?" * len(fresh))
+            for table, columns in (
+                ("boundaries", "iso3, geojson"),
+                ("buffered", "iso3, buffer_m, geojson"),
+            ):
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {table} SELECT release, level, ?, {columns} "
+                    f"FROM {table} WHERE release = ? AND level = ? AND version = ? "
+                    f"AND iso3 NOT IN ({marks})",
+                    (version, release, level, carry, *fresh),
+                )
+            conn.execute(
+                "UPDATE versions SET countries = (SELECT count(*) FROM boundaries "
+                "WHERE release = ? AND level = ? AND version = ?) "
+                "WHERE release = ? AND level = ? AND version = ?",
+                (release, level, version) * 2,
+            )
+        conn.executemany(
+            "INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (release, level, version, iso3, build, checked)
+                for iso3, (build, checked) in (builds or {}).items()
+            ],
+        )
+        stale = [
+            row[0]
+            for row in conn.execute(
+                "SELECT version FROM versions WHERE release = ? AND level = ? "
+                "ORDER BY fetched DESC LIMIT -1 OFFSET ?",
+                (release, level, KEEP_VERSIONS),
+            )
+        ]
+        for old in stale:
+            for table in ("versions", "boundaries", "buffered", "builds"):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE release = ? AND level = ? AND version = ?",
+                    (release, level, old),
+                )
+
+
+def _get(url: str, method: str = "GET", timeout: float = HTTP_TIMEOUT_SECONDS):
+    import requests
+
+    try:
+        response = requests.request(method, url, timeout=timeout, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException as error:
+        raise BoundaryError(f"{url}: {error}") from error
+    return response
+
+
+def _json(url: str, timeout: float = HTTP_TIMEOUT_SECONDS):
+    try:
+        return _get(url, timeout=timeout).json()
+    except ValueError as error:
+        raise BoundaryError(f"{url}: not JSON: {error}") from error
+
+
+def check_country(
+    release: str, level: str, iso3: str, stored: str | None
+) -> tuple[str, dict | None]:
+    """(build date, geometry) from one metadata call, downloading the boundary only
+    when the build is not the stored one; the geometry is None when it is."""
+    meta = _json(API_URL.format(release=release, iso3=iso3, level=level), METADATA_TIMEOUT_SECONDS)
+    build = str(meta.get("buildDate", ""))
+    if build == stored:
+        return build, None
+    url = meta.get("gjDownloadURL") or meta.get("simplifiedGeometryGeoJSON")
+    if not url:
+        raise BoundaryError(f"{iso3}: no download URL in the metadata")
+    return build, as_geometry(_json(url))
+
+
+def as_geometry(payload: dict) -> dict:
+    """A geoBoundaries download as the one geometry oex makes of it: the single
+    feature's, or a GeometryCollection of several."""
+    if payload.get("type") != "FeatureCollection":
+        return payload
+    geometries = [f["geometry"] for f in payload.get("features", []) if f.get("geometry")]
+    if len(geometries) == 1:
+        return geometries[0]
+    return {"type": "GeometryCollection", "geometries": geometries}
+
+
+def refresh(
+    path: Path, level: str, countries: list[str], force: bool = False, max_age: float = 0
+) -> bool:
+    """Check the countries not checked in the last max_age seconds and store a new
+    version if any build changed. True if one did. A country whose check fails keeps
+    what is stored for it; with force, every country is downloaded again."""
+    conn = connect(path)
+    stored = current_version(conn, RELEASE, level)
+    known = stored_builds(conn, RELEASE, level, stored) if stored else {}
+    now = time.time()
+    due = [
+        iso3
+        for iso3 in dict.fromkeys(iso3.upper() for iso3 in countries)
+        if force or iso3 not in known or now - known[iso3][1] >= max_age
+    ]
+    if not due:
+        return False
+
+    def guarded(iso3: str) -> tuple[str, dict | None] | BoundaryError:
+        build = None if force or iso3 not in known else known[iso3][0]
+        try:
+            return check_country(RELEASE, level, iso3, build)
+        except BoundaryError as error:
+            return error
+
+    builds, geometries, checked = dict(known), {}, []
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for iso3, result in zip(due, pool.map(guarded, due), strict=True):
+            if isinstance(result, BoundaryError):
+                print(f"boundaries: {iso3}: {result}", file=sys.stderr)
+                continue
+            build, geometry = result
+            builds[iso3] = (build, now)
+            checked.append(iso3)
+            if geometry is not None:
+                geometries[iso3] = geometry
+    if not geometries:
+        if stored is None:
+            raise BoundaryError(f"{RELEASE} {level}: no boundaries fetched")
+        with conn:
+            conn.executemany(
+                "UPDATE builds SET checked = ? WHERE release = ? AND level = ? "
+                "AND version = ? AND iso3 = ?",
+                [(now, RELEASE, level, stored, iso3) for iso3 in checked],
+            )
+        return False
+    digest = "\n".join(sorted(f"{iso3}:{build}" for iso3, (build, _) in builds.items()))
+    version = hashlib.sha256(digest.encode()).hexdigest()[:16]
+    store_release(conn, RELEASE, level, version, geometries, builds, carry=stored)
+    print(f"boundaries: {RELEASE} {level} version {version}, {len(geometries)} fetched")
+    return True
+
+
+def buffered(geometry: dict, metres: float) -> dict:
+    """Grown by `metres` in an azimuthal equidistant projection centred on the shape,
+    which keeps the distance true at any latitude, as oex itself does."""
+    if metres <= 0:
+        return geometry
+    geom = shape(geometry)
+    centre = geom.centroid
+    local = CRS.from_proj4(
+        f"+proj=aeqd +lat_0={centre.y} +lon_0={centre.x} +datum=WGS84 +units=m +no_defs"
+    )
+    to_local = Transformer.from_crs(4326, local, always_xy=True).transform
+    to_wgs84 = Transformer.from_crs(local, 4326, always_xy=True).transform
+    local_geom = shapely.transform(geom, lambda xy: np.column_stack(to_local(*xy.T)))
+    grown = local_geom.buffer(metres)
+    return mapping(shapely.transform(grown, lambda xy: np.column_stack(to_wgs84(*xy.T))))
+
+
+def prepared_boundary(
+    path: Path, level: str, iso3: str, buffer_m: float, read_only: bool = False
+) -> str | None:
+    """The country's current boundary as GeoJSON text, buffered, or None when the
+    store does not hold it or cannot be read. Buffered once, then read back; with
+    read_only, a buffer not stored yet is computed and not kept."""
+    if not path.is_file():
+        return None
+    try:
+        return _prepared(connect(path, read_only), level, iso3, buffer_m, read_only)
+    except sqlite3.Error as error:
+        print(f"boundaries: {iso3}: store not read ({error}), oex fetches it", file=sys.stderr)
+        return None
+
+
+def _prepared(
+    conn: sqlite3.Connection, level: str, iso3: str, buffer_m: float, read_only: bool
+) -> str | None:
+    version = current_version(conn, RELEASE, level)
+    if version is None:
+        return None
+    key = (RELEASE, level, version, iso3.upper(), float(buffer_m))
+    if buffer_m:
+        row = conn.execute(
+            "SELECT geojson FROM buffered WHERE release = ? AND level = ? AND version = ? "
+            "AND iso3 = ? AND buffer_m = ?",
+            key,
+        ).fetchone()
+        if row:
+            return row[0]
+    raw = conn.execute(
+        "SELECT geojson FROM boundaries WHERE release = ? AND level = ? AND version = ? "
+        "AND iso3 = ?",
+        key[:4],
+    ).fetchone()
+    if raw is None or not buffer_m:
+        return None if raw is None else raw[0]
+    text = json.dumps(buffered(json.loads(raw[0]), buffer_m), separators=(",", ":"))
+    if not read_only:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO buffered VALUES (?, ?, ?, ?, ?, ?)", (*key, text))
+    return text
+
+
+def base_level() -> str:
+    """The geoBoundaries level base.yaml asks for."""
+    boundary = (yaml.safe_load(BASE_CONFIG.read_text(encoding="utf-8")) or {}).get("boundary") or {}
+    return boundary.get("geoboundaries_level", "ADM0")
+
+
+def scheduled_countries() -> list[str]:
+    schedule = yaml.safe_load(SCHEDULE_FILE.read_text(encoding="utf-8")) or {}
+    countries = []
+    for name in schedule.get("groups") or []:
+        countries += list((schedule.get(name) or {}).get("countries") or {})
+    return sorted(set(countries))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("refresh", "show"))
+    parser.add_argument("iso3", nargs="?")
+    parser.add_argument("--store", type=Path, default=None, help="default under OEX_DATA_DIR")
+    parser.add_argument("--force", action="store_true", help="download every country again")
+    args = parser.parse_args()
+    store = args.store or default_store()
+    release, level = RELEASE, base_level()
+
+    if args.command == "refresh":
+        try:
+            countries = [args.iso3] if args.iso3 else scheduled_countries()
+            changed = refresh(store, level, countries, args.force)
+        except BoundaryError as error:
+            print(f"boundaries: {error}", file=sys.stderr)
+            return 1
+        if not changed:
+            print(f"boundaries: {release} {level} unchanged")
+        return 0
+
+    if not args.iso3:
+        parser.error("show needs an ISO3")
+    conn = connect(store)
+    version = current_version(conn, release, level)
+    row = conn.execute(
+        "SELECT length(geojson) FROM boundaries WHERE release = ? AND level = ? "
+        "AND version = ? AND iso3 = ?",
+        (release, level, version, args.iso3.upper()),
+    ).fetchone()
+    if row is None:
+        print(f"boundaries: {args.iso3} not in {release} {level} version {version}")
+        return 1
+    print(f"{args.iso3.upper()}: {release} {level} version {version}, {row[0]:,} bytes of GeoJSON")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""Structured event log shared by the scripts: one JSON object per line.
+
+A span writes a `start` line and an `end` line. `ts` is CLOCK_MONOTONIC, which is
+host-wide on Linux, so logs from the sweep, tm_configs.py and sync_hdx_frequency.py
+line up with each other and a clock step never yields a negative duration. `wall` is
+there for people. Spans nest through `parent`, and `phase` names the stage the time
+belongs to: resolve, download, osmium_extract, node_count, export, and so on.
+
+summarise() turns one or many logs back into where the time went.
+"""
+
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+
+def default_path(work_dir: Path, script: str) -> Path:
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    return work_dir / "events" / f"{script}-{stamp}-{os.getpid()}.jsonl"
+
+
+class EventLog:
+    """Appends events to a JSONL file. No path records nothing."""
+
+    def __init__(self, path: Path | None, script: str):
+        self.path = path
+        self.script = script
+        self._stack: list[str] = []
+        self._open: dict[str, tuple[float, str, str]] = {}
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+    def emit(self, event: str, **fields) -> None:
+        if self.path is None:
+            return
+        line = {
+            "ts": time.monotonic(),
+            "wall": time.time(),
+            "script": self.script,
+            "pid": os.getpid(),
+            "event": event,
+            **fields,
+        }
+        with self.path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(line, default=str) + "\n")
+
+    def start(self, name: str, phase: str, **attrs) -> str:
+        """Open a span under whichever span is innermost, and return its id."""
+        span = uuid.uuid4().hex[:16]
+        parent = self._stack[-1] if self._stack else None
+        self._open[span] = (time.monotonic(), name, phase)
+        self.emit("start", span=span, parent=parent, name=name, phase=phase, attrs=attrs)
+        return span
+
+    def end(self, span: str, ok: bool = True, **attrs) -> None:
+        started, name, phase = self._open.pop(span)
+        self.emit(
+            "end",
+            span=span,
+            name=name,
+            phase=phase,
+            ok=ok,
+            seconds=time.monotonic() - started,
+            attrs=attrs,
+        )
+
+    @contextmanager
+    def span(self, name: str, phase: str, **attrs) -> Iterator[dict]:
+        """A span around a block. Whatever the block puts in the yielded dict is
+        recorded on the end line; an exception ends the span as failed."""
+        span = self.start(name, phase, **attrs)
+        self._stack.append(span)
+        extra: dict = {}
+        try:
+            yield extra
+        except BaseException as error:
+            self._stack.pop()
+            self.end(span, ok=False, error=repr(error), **extra)
+            raise
+        self._stack.pop()
+        self.end(span, ok=extra.pop("ok", True), **extra)
+
+
+@dataclass
+class Span:
+    id: str
+    name: str
+    phase: str
+    script: str
+    parent: str | None
+    start: float
+    end: float | None = None
+    ok: bool | None = None
+    attrs: dict = field(default_factory=dict)
+    children: int = 0
+
+    @property
+    def seconds(self) -> float:
+        return (self.end or self.start) - self.start
+
+
+def load(paths: Iterable[Path]) -> list[Span]:
+    """Spans from every log, in start order. A span without an end, from a run that
+    died, is kept and reads as zero seconds long."""
+    spans: dict[str, Span] = {}
+    for path in paths:
+        for raw in path.read_text(encoding="utf-8").splitlines():
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            if line.get("event") == "start":
+                spans[line["span"]] = Span(
+                    line["span"],
+                    line["name"],
+                    line["phase"],
+                    line.get("script", ""),
+                    line.get("parent"),
+                    line["ts"],
+                    attrs=dict(line.get("attrs") or {}),
+                )
+            elif line.get("event") == "end" and line.get("span") in spans:
+                span = spans[line["span"]]
+                span.end, span.ok = line["ts"], line.get("ok")
+                span.attrs.update(line.get("attrs") or {})
+    for span in spans.values():
+        if span.parent in spans:
+            spans[span.parent].children += 1
+    return sorted(spans.values(), key=lambda s: s.start)
+
+
+def max_concurrency(spans: list[Span]) -> int:
+    edges = sorted([(s.start, 1) for s in spans] + [(s.end or s.start, -1) for s in spans])
+    running = peak = 0
+    for _, step in edges:
+        running += step
+        peak = max(peak, running)
+    return peak
+
+
+def critical_path(leaves: list[Span]) -> list[Span]:
+    """The chain of work that ends last, walked backwards: each link is the leaf that
+    finished latest before the next one started. Shortening anything off it does not
+    shorten the run."""
+    if not leaves:
+        return []
+    path = [max(leaves, key=lambda s: s.end or s.start)]
+    while True:
+        earlier = [s for s in leaves if (s.end or s.start) <= path[-1].start]
+        if not earlier:
+            return path[::-1]
+        path.append(max(earlier, key=lambda s: s.end or s.start))
+
+
+def summarise(spans: list[Span]) -> str:
+    """Per-phase totals, per-group wall time, the critical path and worker utilisation.
+
+    Totals count leaf spans only, so a job and the download inside it are not counted
+    twice. Utilisation is busy leaf time over wall time times the peak concurrency.
+    """
+    if not spans:
+        return "no spans\n"
+    leaves = [s for s in spans if s.children == 0]
+    wall = max(s.end or s.start for s in spans) - min(s.start for s in spans)
+    lines = [f"{len(spans)} span(s), wall {wall:.1f}s", "", "phase totals:"]
+
+    phases: dict[str, list[float]] = defaultdict(list)
+    for span in leaves:
+        phases[span.phase].append(span.seconds)
+    busy = sum(sum(values) for values in phases.values())
+    for phase, values in sorted(phases.items(), key=lambda item: -sum(item[1])):
+        share = sum(values) / busy if busy else 0.0
+        lines.append(f"  {phase:<16} {sum(values):>10.1f}s  {len(values):>5}x  {share:6.1%}")
+
+    groups: dict[str, list[Span]] = defaultdict(list)
+    for span in spans:
+        if "group" in span.attrs:
+            groups[span.attrs["group"]].append(span)
+    if groups:
+        lines += ["", "group wall time:"]
+        for group, members in groups.items():
+            first = min(s.start for s in members)
+            last = max(s.end or s.start for s in members)
+            lines.append(f"  {group:<24} {last - first:>10.1f}s  {len(members):>5} span(s)")
+
+    lines += ["", "critical path:"]
+    for span in critical_path(leaves):
+        lines.append(f"  {span.seconds:>10.1f}s  {span.phase:<16} {span.name}")
+
+    workers = max_concurrency(leaves)
+    utilisation = busy / (wall * workers) if wall and workers else 0.0
+    lines += ["", f"workers: peak {workers}, utilisation {utilisation:.1%} of {wall:.1f}s"]
+    failed = [s for s in spans if s.ok is False]
+    if failed:
+        lines.append(f"failed: {', '.join(s.name for s in failed)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,32 @@
+#!/usr/bin/env -S uv run python
+"""A stand-in for oex-cli that sleeps and holds memory instead of exporting.
+
+    FAKE_OEX_SECONDS=2 FAKE_OEX_RSS=104857600 fake_oex.py osm --config X --iso3 NPL
+
+It takes any arguments oex-cli or tile_country.py would, touches FAKE_OEX_RSS bytes
+so they count towards its peak RSS, sleeps FAKE_OEX_SECONDS, and exits with
+FAKE_OEX_EXIT (default 0). sweep.py --simulate --fake sets those per job from the
+cost model, to load-test the scheduler end to end without oex, data or network.
+"""
+
+import os
+import sys
+import time
+
+PAGE = 4096
+
+
+def main() -> int:
+    seconds = float(os.environ.get("FAKE_OEX_SECONDS", "0"))
+    rss = int(os.environ.get("FAKE_OEX_RSS", "0"))
+    # Zeroed pages are not resident until written, so write one byte in each.
+    held = bytearray(rss)
+    held[::PAGE] = b"\x01" * len(range(0, rss, PAGE))
+    print(f"fake oex-cli {' '.join(sys.argv[1:])}: {seconds:.1f}s, {rss / 1024**2:.0f} MB")
+    time.sleep(seconds)
+    del held
+    return int(os.environ.get("FAKE_OEX_EXIT", "0"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+"""What the host the scripts run on has to give them.
+
+The sweep, tm_configs.py, tile_country.py and the profiling scripts size their work
+against the same figures, read here.
+"""
+
+import os
+
+
+def host_memory_gb() -> float:
+    """Physical memory, in GiB."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**3
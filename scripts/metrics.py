@@ -0,0 +1,91 @@
+"""Prometheus textfile metrics, for node-exporter's textfile collector.
+
+The whole file is rewritten and renamed into place on every update, so the collector
+never scrapes half of it. Timestamps that must outlive one run, such as the last
+success of each dataset, are kept in a JSON file next to it and re-emitted.
+"""
+
+import json
+import os
+from pathlib import Path
+
+KINDS = ("counter", "gauge")
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _key(labels: dict) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Counters and gauges with labels, written as one textfile. No path writes nothing."""
+
+    def __init__(self, path: Path | None):
+        self.path = path
+        self._help: dict[str, tuple[str, str]] = {}
+        self._samples: dict[str, dict[tuple[tuple[str, str], ...], float]] = {}
+
+    def declare(self, name: str, kind: str, help: str) -> None:
+        if kind not in KINDS:
+            raise ValueError(f"{name}: kind must be one of {KINDS}, got {kind!r}")
+        self._help[name] = (kind, help)
+        self._samples.setdefault(name, {})
+
+    def _series(self, name: str) -> dict:
+        if name not in self._help:
+            raise KeyError(f"{name} was never declared")
+        return self._samples[name]
+
+    def set(self, name: str, value: float, **labels: object) -> None:
+        self._series(name)[_key(labels)] = value
+
+    def inc(self, name: str, amount: float = 1, **labels: object) -> None:
+        series = self._series(name)
+        key = _key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def get(self, name: str, **labels: object) -> float | None:
+        return self._series(name).get(_key(labels))
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help) in self._help.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in sorted(self._samples[name].items()):
+                inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(
+                    f"{name}{{{inner}}} {_format(value)}" if inner else f"{name} {_format(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        partial.write_text(self.render(), encoding="utf-8")
+        os.replace(partial, self.path)
+
+
+def load_timestamps(path: Path) -> dict[str, float]:
+    """Last-success times by dataset, as written by save_timestamps. Missing means none yet."""
+    if not path.is_file():
+        return {}
+    try:
+        return {str(k): float(v) for k, v in json.loads(path.read_text(encoding="utf-8")).items()}
+    except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+        return {}
+
+
+def save_timestamps(path: Path, stamps: dict[str, float]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    partial.write_text(json.dumps(stamps, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(partial, path)
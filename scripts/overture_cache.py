@@ -0,0 +1,307 @@
+#!/usr/bin/env -S uv run python
+"""A local copy of the Overture subsets the sweep's jobs read, one per release.
+
+    overture_cache.py warm                   pull what the scheduled Overture jobs need
+    overture_cache.py show                   the cached entries
+    overture_cache.py overture --config X    oex-cli overture, reading the cache
+
+oex reads every Overture category straight from the release's GeoParquet on S3, so
+the event configs that ask for the same theme over the same area each pull it again.
+The warm-up reads each theme and type once per release for the area the jobs cover,
+and writes it to `data/overture/<release>/<theme>/<type>/<bbox>.parquet`. An entry
+serves any job whose bounding box it contains, so one pull over an event's full AOI
+also serves the configs for a smaller area inside it. When a new release is warmed,
+the entries of older ones are removed.
+
+sweep.py runs an Overture job through this script's `overture` command when the
+cache holds something for it. That command is oex-cli overture with the category's
+S3 read pointed at the local file; a category the cache does not cover, or a
+release it does not hold, reads S3 as before.
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+import yaml
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_BUCKET = "overturemaps-us-west-2"
+DEFAULT_REGION = "us-west-2"
+# Degrees a bbox is rounded outward to, so near-identical areas share one entry.
+GRID = 1e-4
+
+Bbox = tuple[float, float, float, float]
+
+
+class OvertureCacheError(Exception):
+    """The cache could not be brought up to date."""
+
+
+@dataclass(frozen=True)
+class Need:
+    """One theme and type of one release, over one area."""
+
+    bucket: str
+    region: str
+    release: str
+    theme: str
+    feature_type: str
+    bbox: Bbox
+
+    def path(self, root: Path) -> Path:
+        name = "_".join(f"{value:.4f}" for value in self.bbox)
+        return root / self.release / self.theme / self.feature_type / f"{name}.parquet"
+
+
+def default_root() -> Path:
+    return Path(os.environ.get("OEX_DATA_DIR", REPO_ROOT)) / "data" / "overture"
+
+
+def _outward(bbox: Bbox) -> Bbox:
+    # Rounded to the digits an entry's file name keeps, so it reads back equal.
+    minx, miny, maxx, maxy = bbox
+    return (
+        round(math.floor(minx / GRID) * GRID, 4),
+        round(math.floor(miny / GRID) * GRID, 4),
+        round(math.ceil(maxx / GRID) * GRID, 4),
+        round(math.ceil(maxy / GRID) * GRID, 4),
+    )
+
+
+def config_needs(config: Path) -> dict[str, Need]:
+    """What each category of an Overture config reads, by category name, with the
+    release as written, `latest` included. Nothing for a config without an inline
+    boundary to take a bbox from."""
+    from boundaries import buffered
+    from shapely.geometry import shape
+
+    raw = yaml.safe_load(config.read_text(encoding="utf-8")) or {}
+    overture = (raw.get("source") or {}).get("overture") or {}
+    geom = (raw.get("boundary") or {}).get("geom")
+    if not overture.get("enabled", True) or not geom:
+        return {}
+    # Buffered as oex buffers it, so the bbox is the one its query filters on at any
+    # latitude, where a fixed number of degrees falls short of it towards the poles.
+    buffer_m = (raw.get("boundary") or {}).get("buffer_meters") or 0
+    boundary = shape(buffered(json.loads(geom), buffer_m))
+    bbox = _outward(boundary.bounds)
+    needs = {}
+    for category in raw.get("categories") or []:
+        spec = category.get("overture") or {}
+        if not spec.get("enabled", True) or not spec.get("theme") or not spec.get("feature_type"):
+            continue
+        needs[category["name"]] = Need(
+            bucket=overture.get("s3_bucket", DEFAULT_BUCKET),
+            region=overture.get("s3_region", DEFAULT_REGION),
+            release=str(overture.get("release", "latest")),
+            theme=spec["theme"],
+            feature_type=spec["feature_type"],
+            bbox=bbox,
+        )
+    return needs
+
+
+def contains(outer: Bbox, inner: Bbox) -> bool:
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and outer[2] >= inner[2]
+        and outer[3] >= inner[3]
+    )
+
+
+def entries(root: Path, release: str, theme: str, feature_type: str) -> list[tuple[Bbox, Path]]:
+    """The cached areas of one theme and type of a release."""
+    found = []
+    for path in sorted((root / release / theme / feature_type).glob("*.parquet")):
+        try:
+            minx, miny, maxx, maxy = (float(part) for part in path.stem.split("_"))
+        except ValueError:
+            continue
+        found.append(((minx, miny, maxx, maxy), path))
+    return found
+
+
+def lookup(root: Path, need: Need) -> Path | None:
+    """The smallest cached entry that covers the need, if any."""
+    covering = [
+        (bbox, path)
+        for bbox, path in entries(root, need.release, need.theme, need.feature_type)
+        if contains(bbox, need.bbox)
+    ]
+    if not covering:
+        return None
+    return min(covering, key=lambda item: (item[0][2] - item[0][0]) * (item[0][3] - item[0][1]))[1]
+
+
+def cached(root: Path, config: Path) -> bool:
+    """Whether any release the cache holds covers a category of the config."""
+    releases = [path.name for path in root.iterdir() if path.is_dir()] if root.is_dir() else []
+    return any(
+        lookup(root, replace(need, release=release))
+        for need in config_needs(config).values()
+        for release in releases
+    )
+
+
+def s3_glob(need: Need) -> str:
+    return (
+        f"s3://{need.bucket}/release/{need.release}/theme={need.theme}/type={need.feature_type}/*"
+    )
+
+
+def fetch(need: Need, target: Path) -> None:
+    """The need's rows, every column, written to target through a partial file."""
+    from oex.duckdb_session import connect
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_name(f".{target.name}.partial")
+    minx, miny, maxx, maxy = need.bbox
+    conn = connect(
+        path=":memory:",
+        s3_region=need.region,
+        anonymous_s3_bucket=need.bucket,
+    )
+    try:
+        conn.execute(
+            f"COPY (SELECT * FROM read_parquet('{s3_glob(need)}', hive_partitioning=1) "
+            f"WHERE bbox.xmin <= {maxx} AND bbox.xmax >= {minx} "
+            f"AND bbox.ymin <= {maxy} AND bbox.ymax >= {miny}) "
+            f"TO '{partial}' (FORMAT parquet, COMPRESSION zstd)"
+        )
+    finally:
+        conn.close()
+    os.replace(partial, target)
+
+
+def plan(needs: list[Need], root: Path) -> list[Need]:
+    """The needs to fetch: largest area first, each unless the cache or an earlier
+    one in the plan already covers it."""
+    planned: list[Need] = []
+    for need in sorted(
+        set(needs), key=lambda n: -(n.bbox[2] - n.bbox[0]) * (n.bbox[3] - n.bbox[1])
+    ):
+        if lookup(root, need) is not None:
+            continue
+        if any(
+            (p.release, p.theme, p.feature_type) == (need.release, need.theme, need.feature_type)
+            and contains(p.bbox, need.bbox)
+            for p in planned
+        ):
+            continue
+        planned.append(need)
+    return planned
+
+
+def resolved(needs: list[Need]) -> list[Need]:
+    """`latest` resolved to the release it names today, once per bucket."""
+    from oex.overture.runner import resolve_release
+
+    releases: dict[tuple[str, str], str] = {}
+    out = []
+    for need in needs:
+        key = (need.bucket, need.release)
+        if key not in releases:
+            releases[key] = resolve_release(need.release, bucket=need.bucket)
+        out.append(replace(need, release=releases[key]))
+    return out
+
+
+def evict(root: Path, keep: set[str]) -> list[str]:
+    """Remove every release's entries but those kept. Returns the releases removed."""
+    removed = []
+    if not root.is_dir():
+        return removed
+    for release_dir in sorted(root.iterdir()):
+        if release_dir.is_dir() and release_dir.name not in keep:
+            shutil.rmtree(release_dir)
+            removed.append(release_dir.name)
+    return removed
+
+
+def warm(configs: list[Path], root: Path) -> tuple[list[Need], list[str]]:
+    """Fetch what the configs read and the cache does not cover, then evict older
+    releases. Returns the needs fetched and the releases evicted."""
+    needs = [need for config in configs for need in config_needs(config).values()]
+    if not needs:
+        return [], []
+    try:
+        needs = resolved(needs)
+        fetched = []
+        for need in plan(needs, root):
+            print(f"overture: {need.release} {need.theme}/{need.feature_type} {need.bbox}")
+            fetch(need, need.path(root))
+            fetched.append(need)
+    except Exception as error:
+        # Release listing, S3 or DuckDB: the jobs then read S3 themselves.
+        raise OvertureCacheError(str(error)) from error
+    return fetched, evict(root, {need.release for need in needs})
+
+
+def serve_from_cache(root: Path, config: Path) -> None:
+    """Point oex's Overture reads at the cache for the categories it covers."""
+    import oex.overture.runner
+
+    by_category = config_needs(config)
+    original = oex.overture.runner.OvertureRunner.query_for
+
+    def query_for(self, cfg, category):
+        query = original(self, cfg, category)
+        need = by_category.get(category.name)
+        if need is None:
+            return query
+        local = lookup(root, replace(need, release=self._release))
+        if local is None:
+            return query
+        print(f"overture: {category.name} from {local}", file=sys.stderr)
+        return replace(
+            query, source_expr=f"read_parquet('{local}', filename=true, hive_partitioning=1)"
+        )
+
+    oex.overture.runner.OvertureRunner.query_for = query_for
+
+
+def main() -> int:
+    argv = sys.argv[1:]
+    if argv[:1] == ["overture"]:
+        parser = argparse.ArgumentParser(prog="overture_cache.py overture", add_help=False)
+        parser.add_argument("--config", type=Path, required=True)
+        known, _ = parser.parse_known_args(argv[1:])
+        serve_from_cache(default_root(), known.config)
+
+        from oex.cli import app
+
+        sys.argv = ["oex-cli", *argv]
+        try:
+            app()
+        except SystemExit as exit:
+            return exit.code if isinstance(exit.code, int) else int(exit.code is not None)
+        return 0
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("warm", "show"))
+    parser.add_argument("configs", nargs="*", type=Path, help="default: configs/events/*.yaml")
+    args = parser.parse_args(argv)
+    root = default_root()
+    if args.command == "show":
+        for path in sorted(root.glob("*/*/*/*.parquet")):
+            print(f"{path.relative_to(root)}  {path.stat().st_size / 1e6:.1f} MB")
+        return 0
+    configs = args.configs or sorted((REPO_ROOT / "configs" / "events").glob("*.yaml"))
+    try:
+        fetched, evicted = warm(configs, root)
+    except OvertureCacheError as error:
+        print(f"overture: {error}", file=sys.stderr)
+        return 1
+    print(f"overture: {len(fetched)} subset(s) fetched, {len(evicted)} old release(s) removed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
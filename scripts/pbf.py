@@ -0,0 +1,136 @@
+"""Reading the block structure of an OSM PBF without decoding its features.
+
+A PBF is a run of blobs, each a 4-byte length, a BlobHeader naming the blob's type
+and size, and the blob. tm_configs.py hashes the data blobs; stats() counts them by
+what they hold, which for a sorted file is a cheap estimate of its nodes and ways.
+"""
+
+import zlib
+from collections import Counter
+from collections.abc import Iterator
+from pathlib import Path
+
+# Entities osmium, and so Geofabrik, writes to a full block.
+BLOCK_ENTITIES = 8000
+# Compressed bytes read at a time while looking for a block's first group.
+CHUNK = 4096
+# PrimitiveGroup fields: nodes, dense nodes, ways, relations.
+GROUP_KINDS = {1: "nodes", 2: "nodes", 3: "ways", 4: "relations"}
+
+
+def varint(data: bytes, at: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[at]
+        value |= (byte & 0x7F) << shift
+        at += 1
+        if byte < 0x80:
+            return value, at
+        shift += 7
+
+
+def blob_header(data: bytes) -> tuple[bytes, int]:
+    """(type, datasize) from a PBF BlobHeader: fields 1 and 3 of the protobuf."""
+    kind, size, at = b"", 0, 0
+    while at < len(data):
+        key, at = varint(data, at)
+        if key & 7 == 2:
+            length, at = varint(data, at)
+            if key >> 3 == 1:
+                kind = data[at : at + length]
+            at += length
+        else:
+            value, at = varint(data, at)
+            if key >> 3 == 3:
+                size = value
+    return kind, size
+
+
+def _fields(data: bytes) -> Iterator[tuple[int, bytes | int]]:
+    """(number, value) for each field, stopping at the first that does not fit. A
+    length-delimited field cut short is yielded with what there is of it."""
+    at = 0
+    try:
+        while at < len(data):
+            key, at = varint(data, at)
+            if key & 7 == 2:
+                length, at = varint(data, at)
+                yield key >> 3, data[at : at + length]
+                if at + length > len(data):
+                    return
+                at += length
+            elif key & 7 == 0:
+                value, at = varint(data, at)
+                yield key >> 3, value
+            else:
+                return
+    except IndexError:
+        return
+
+
+def group_kind(block: bytes) -> str | None:
+    """What the first group of a PrimitiveBlock holds, or None if block is too short
+    to tell. The string table comes first, so it has to be read past."""
+    for number, value in _fields(block):
+        if number == 2 and isinstance(value, bytes):
+            for inner, _ in _fields(value):
+                return GROUP_KINDS.get(inner)
+            return None
+    return None
+
+
+def block_kind(handle, size: int) -> str | None:
+    """What the data blob at the handle holds, inflating only as much of it as that
+    takes. Leaves the handle at the end of the blob."""
+    start = handle.tell()
+    head = handle.read(min(size, 32))
+    # Blob: raw_size (2) and then the data, raw (1) or zlib (3); only its offset matters.
+    codec = data_at = None
+    at = 0
+    try:
+        while at < len(head) and codec is None:
+            key, at = varint(head, at)
+            if key & 7 == 2:
+                length, at = varint(head, at)
+                if key >> 3 in (1, 3):
+                    codec, data_at = key >> 3, at
+                at += length
+            else:
+                _, at = varint(head, at)
+    except IndexError:
+        pass
+    kind = None
+    if codec is not None:
+        handle.seek(start + data_at)
+        remaining = size - data_at
+        inflate = zlib.decompressobj() if codec == 3 else None
+        block = b""
+        while remaining > 0 and kind is None:
+            chunk = handle.read(min(CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            block += inflate.decompress(chunk) if inflate else chunk
+            kind = group_kind(block)
+    handle.seek(start + size)
+    return kind
+
+
+def stats(path: Path) -> dict:
+    """The file's size, and its nodes, ways and relations estimated as full blocks
+    of each. Blocks compressed other than zlib are counted as `other`."""
+    blocks: Counter[str] = Counter()
+    with path.open("rb") as handle:
+        while prefix := handle.read(4):
+            kind, size = blob_header(handle.read(int.from_bytes(prefix, "big")))
+            if kind == b"OSMData":
+                blocks[block_kind(handle, size) or "other"] += 1
+            else:
+                handle.seek(size, 1)
+    stat = path.stat()
+    return {
+        "bytes": stat.st_size,
+        "mtime": stat.st_mtime,
+        **{kind: blocks[kind] * BLOCK_ENTITIES for kind in ("nodes", "ways", "relations")},
+        "other_blocks": blocks["other"],
+    }
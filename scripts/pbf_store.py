@@ -0,0 +1,298 @@
+#!/usr/bin/env -S uv run python
+"""One copy of each source PBF, shared by the sweep and the Tasking Manager runs.
+
+    pbf_store.py fetch URL VIEW     download URL once, and link VIEW to it
+    pbf_store.py adopt PATH ...     move local PBFs into the store, linking them back
+    pbf_store.py show               each object and the views that link to it
+    pbf_store.py gc                 remove the objects no view links to any more
+
+The planet in data/osm/planet/, the TM_PBF copy in data/tm/ and the sandbox's in
+data/tm_sandbox/ can be the same ~80 GB file. The store, data/pbf/ under
+OEX_DATA_DIR, keeps each file once as objects/<sha256>.osm.pbf, and each path a
+config expects is a view of it: a hard link where the two share a filesystem, else
+a symlink. Objects are read-only, so no view can change what the others read.
+
+A remote source is known by its URL and ETag, or by its size and modification time
+where the server sends no ETag, so a source fetched before is linked without a
+download. A download is hashed as it arrives, and a file adopted from disk is hashed
+once and known after that by its inode, size and mtime, so two copies of the same
+bytes become one object whichever way they came in. index.json records the sources,
+files and views under the store's lock, which is held for moments: downloads, and
+the hashing and copying of an adopted file, happen outside it. Each source has
+a lock of its own besides, held through its download, which keeps a second fetch
+of it waiting for the first rather than downloading the same file again, while
+fetches of other sources go ahead. An object is removed once no view leads to it,
+as when every view of last week's planet has moved on to this week's.
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+CHUNK = 8 * 1024 * 1024
+
+
+class StoreError(Exception):
+    """A download did not match its checksum, or a path cannot be stored."""
+
+
+def default_root() -> Path:
+    return Path(os.environ.get("OEX_DATA_DIR", REPO_ROOT)) / "data" / "pbf"
+
+
+def object_path(root: Path, digest: str) -> Path:
+    return root / "objects" / f"{digest}.osm.pbf"
+
+
+def load_index(root: Path) -> dict[str, dict[str, str]]:
+    """Sources, files and views, each mapped to a digest. Missing means empty."""
+    index: dict = {}
+    try:
+        index = json.loads((root / "index.json").read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        pass
+    return {kind: dict(index.get(kind) or {}) for kind in ("sources", "files", "views")}
+
+
+def save_index(root: Path, index: dict) -> None:
+    partial = root / f".index.json.{os.getpid()}.tmp"
+    partial.write_text(json.dumps(index, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(partial, root / "index.json")
+
+
+@contextmanager
+def locked(root: Path) -> Iterator[dict]:
+    """The index, under the store's lock, saved on the way out."""
+    (root / "objects").mkdir(parents=True, exist_ok=True)
+    with (root / ".lock").open("w", encoding="utf-8") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        index = load_index(root)
+        yield index
+        save_index(root, index)
+
+
+@contextmanager
+def source_locked(root: Path, key: str) -> Iterator[None]:
+    """One source's lock, held while it downloads."""
+    locks = root / "locks"
+    locks.mkdir(parents=True, exist_ok=True)
+    name = hashlib.sha256(key.encode()).hexdigest()[:16]
+    with (locks / f"{name}.lock").open("w", encoding="utf-8") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+def source_key(url: str, info: dict) -> str:
+    etag = str(info.get("ETag") or info.get("etag") or "").strip('"')
+    if etag:
+        return f"{url} etag {etag}"
+    modified = info.get("LastModified") or info.get("last_modified") or info.get("mtime")
+    return f"{url} size {info.get('size')} modified {modified}"
+
+
+def file_key(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def link(target: Path, view: Path) -> str:
+    """Point view at target, replacing whatever was there: "hardlink" or "symlink"."""
+    view.parent.mkdir(parents=True, exist_ok=True)
+    partial = view.with_name(f".{view.name}.{os.getpid()}.link")
+    partial.unlink(missing_ok=True)
+    try:
+        os.link(target, partial)
+        kind = "hardlink"
+    except OSError:
+        os.symlink(target.resolve(), partial)
+        kind = "symlink"
+    os.replace(partial, view)
+    return kind
+
+
+def _seal(partial: Path, obj: Path) -> None:
+    """partial as the object, unless those bytes are stored already."""
+    if obj.exists():
+        partial.unlink()
+    else:
+        os.replace(partial, obj)
+        obj.chmod(0o444)
+
+
+def _view(root: Path, index: dict, digest: str, view: Path) -> None:
+    link(object_path(root, digest), view)
+    index["views"][str(view.absolute())] = digest
+    # The version this view had before, unless another still reads it.
+    collect(root, index)
+
+
+def fetch(url: str, view: Path, root: Path | None = None, md5_url: str | None = None):
+    """(view, bytes downloaded): view linked to url's object, downloading it unless the
+    store already has that version. With md5_url, a download must match it."""
+    from upath import UPath
+
+    root = root or default_root()
+    remote = UPath(url)
+    key = source_key(url, remote.fs.info(remote.path))
+    with source_locked(root, key):
+        with locked(root) as index:
+            digest = index["sources"].get(key)
+            if digest is not None and object_path(root, digest).is_file():
+                _view(root, index, digest, view)
+                return view, 0
+        name = hashlib.sha256(key.encode()).hexdigest()[:16]
+        partial = root / "objects" / f".{os.getpid()}.{name}.partial"
+        sha256, md5 = hashlib.sha256(), hashlib.md5()
+        downloaded = 0
+        print(f"pbf store: downloading {url}", flush=True)
+        try:
+            with remote.open("rb") as source, partial.open("wb") as out:
+                while chunk := source.read(CHUNK):
+                    sha256.update(chunk)
+                    md5.update(chunk)
+                    out.write(chunk)
+                    downloaded += len(chunk)
+            if md5_url:
+                expected = UPath(md5_url).read_text().split()[0]
+                if expected != md5.hexdigest():
+                    raise StoreError(f"{url}: md5 {md5.hexdigest()} is not {expected}")
+            digest = sha256.hexdigest()
+            with locked(root) as index:
+                _seal(partial, object_path(root, digest))
+                index["sources"][key] = digest
+                _view(root, index, digest, view)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+    return view, downloaded
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        while chunk := handle.read(CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def adopt(path: Path, root: Path | None = None) -> str:
+    """Bring a local file into the store and leave path a view of its object. A copy
+    of bytes stored already is replaced by a link, which frees its space. A file the
+    store takes in by hard link shares its inode with the object, so path becomes
+    read-only like every other view.
+
+    The file is hashed, and copied where it cannot be linked, outside the store's
+    lock, which is taken only to look it up and to record it."""
+    root = root or default_root()
+    with locked(root) as index:
+        digest = index["files"].get(file_key(path))
+        if digest is not None and not object_path(root, digest).is_file():
+            digest = None
+    digest = digest or hash_file(path)
+    obj = object_path(root, digest)
+    partial = None
+    try:
+        if not obj.exists():
+            partial = root / "objects" / f".{os.getpid()}.{digest[:16]}.partial"
+            partial.unlink(missing_ok=True)
+            try:
+                os.link(path, partial)
+            except OSError:
+                # copy2 keeps the mtime, which oex dates a planet snapshot by.
+                shutil.copy2(path, partial)
+        with locked(root) as index:
+            if partial is not None:
+                _seal(partial, obj)
+            if not path.samefile(obj):
+                link(obj, path)
+            index["files"][file_key(obj)] = digest
+            index["views"][str(path.absolute())] = digest
+            collect(root, index)
+    except BaseException:
+        if partial is not None:
+            partial.unlink(missing_ok=True)
+        raise
+    return digest
+
+
+def stored(path: Path, root: Path | None = None) -> bool:
+    """Whether path is already a view of an object."""
+    root = root or default_root()
+    digest = load_index(root)["views"].get(str(path.absolute()))
+    obj = object_path(root, digest) if digest else None
+    return obj is not None and path.exists() and obj.exists() and path.samefile(obj)
+
+
+def collect(root: Path, index: dict) -> list[Path]:
+    """Remove the objects no recorded view still leads to, and forget those views.
+    Called with the store locked."""
+    live = set()
+    for view, digest in list(index["views"].items()):
+        obj, path = object_path(root, digest), Path(view)
+        if path.exists() and obj.exists() and path.samefile(obj):
+            live.add(digest)
+        else:
+            del index["views"][view]
+    removed = []
+    for obj in sorted((root / "objects").glob("*.osm.pbf")):
+        if obj.name.removesuffix(".osm.pbf") not in live:
+            obj.unlink()
+            removed.append(obj)
+    for kind in ("sources", "files"):
+        index[kind] = {k: d for k, d in index[kind].items() if d in live}
+    return removed
+
+
+def gc(root: Path | None = None) -> list[Path]:
+    root = root or default_root()
+    with locked(root) as index:
+        return collect(root, index)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=("fetch", "adopt", "show", "gc"))
+    parser.add_argument("paths", nargs="*", help="fetch: URL VIEW; adopt: PATH ...")
+    parser.add_argument("--md5-url", help="with fetch, a checksum the download must match")
+    args = parser.parse_args()
+    root = default_root()
+    try:
+        if args.command == "fetch":
+            if len(args.paths) != 2:
+                parser.error("fetch takes URL VIEW")
+            view, downloaded = fetch(args.paths[0], Path(args.paths[1]), root, args.md5_url)
+            print(f"pbf store: {view}, {downloaded / 1e9:.1f} GB downloaded")
+        elif args.command == "adopt":
+            for path in args.paths:
+                print(f"pbf store: {path} -> {adopt(Path(path), root)[:12]}")
+        elif args.command == "gc":
+            removed = gc(root)
+            print(f"pbf store: {len(removed)} object(s) removed")
+        else:
+            views: dict[str, list[str]] = {}
+            for view, digest in load_index(root)["views"].items():
+                views.setdefault(digest, []).append(view)
+            for obj in sorted((root / "objects").glob("*.osm.pbf")):
+                digest = obj.name.removesuffix(".osm.pbf")
+                print(f"{digest[:12]}  {obj.stat().st_size / 1e9:>6.1f} GB")
+                for view in sorted(views.get(digest, [])):
+                    print(f"    {view}")
+    except (OSError, StoreError) as error:
+        print(f"pbf store: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env -S uv run python
+"""Per-country slices of the pcodes admin polygons, built once per fieldmaps release.
+
+    pcode_cache.py warm              bring every scheduled country up to the release
+    pcode_cache.py warm NPL SDN      only these
+
+oex tags each category of each job against the global fieldmaps parquets, one per
+admin level, selecting the country's polygons out of the whole world's every time:
+four scans of files that run to gigabytes, per category, and the first job of a
+release also downloads them while the others race it. The warm-up downloads them
+once, then writes each country its own slice under `<cache_dir>/countries/<ISO3>/`,
+in the layout and with the `meta.json` oex's cache expects, so a job pointed there
+finds it current and reads only its own polygons. sweep.py's country_config() points
+a country there only while its slice matches the release the fieldmaps manifest
+lists, which is what oex checks: against a slice from any other release, a job would
+download the world's files into it. After a release is published, countries tag
+against the shared files until the next warm-up has sliced it.
+
+The H3 index `h3_neighbor` joins against is still built inside each job: oex keeps it
+in the job's DuckDB session and has no way to read one in. Over a slice it covers one
+country's polygons instead of being cut from the world's, which is most of its cost.
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from omegaconf import OmegaConf
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+BASE_CONFIG = REPO_ROOT / "configs" / "base.yaml"
+# Slices are written side by side. Each holds one level of one country in memory, and
+# adm4 of a large country is a few hundred MB.
+WORKERS = 4
+MANIFEST_TIMEOUT_SECONDS = 60
+
+
+class PcodeCacheError(Exception):
+    """The shared cache could not be brought up to date."""
+
+
+def resolved_dir(value: str) -> Path | None:
+    """A cache_dir as oex sees it from the repo root, or None when it names an env var
+    that is unset."""
+    try:
+        resolved = OmegaConf.to_container(OmegaConf.create({"d": value}), resolve=True)["d"]
+    except Exception:  # noqa: BLE001 - an unresolved directory is just not warm
+        return None
+    return REPO_ROOT / resolved
+
+
+def settings_of(raw):
+    """A config's source.pcodes over oex's defaults, or None when tagging is off or a
+    setting names an env var that is unset."""
+    from oex.pcodes import resolve_pcodes_config
+
+    if raw is None:
+        return None
+    try:
+        resolved = OmegaConf.to_container(OmegaConf.create({"p": raw}), resolve=True)["p"]
+    except Exception:  # noqa: BLE001 - unresolved, so no slice can be trusted
+        return None
+    settings = resolve_pcodes_config({"pcodes": resolved})
+    return settings if settings.enabled else None
+
+
+def base_settings():
+    """base.yaml's source.pcodes over oex's defaults, or None when tagging is off."""
+    raw = OmegaConf.load(BASE_CONFIG).get("source", {}).get("pcodes")
+    return None if raw is None else settings_of(OmegaConf.to_container(raw, resolve=False))
+
+
+def country_dir(cache_dir: Path, iso3: str) -> Path:
+    return cache_dir / "countries" / iso3.upper()
+
+
+def _dates(cache_dir: Path) -> dict[str, str]:
+    try:
+        meta = json.loads((cache_dir / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return {level: entry.get("date") for level, entry in (meta.get("levels") or {}).items()}
+
+
+def is_warm(cache_dir: Path, iso3: str, levels: Iterable[int]) -> bool:
+    """Whether the country's slice covers every level, at the dates the shared cache
+    holds. A slice from an older release, or a partial one, is not."""
+    shared, own = _dates(cache_dir), _dates(country_dir(cache_dir, iso3))
+    return all(
+        shared.get(str(level)) and own.get(str(level)) == shared[str(level)] for level in levels
+    )
+
+
+@functools.cache
+def manifest_dates(url: str) -> dict[tuple[str, int], str] | None:
+    """The date of each (group, level) in the fieldmaps manifest, read once per run, or
+    None when it cannot be read."""
+    import requests
+
+    try:
+        response = requests.get(url, timeout=MANIFEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        entries = response.json()
+    except (requests.RequestException, ValueError) as error:
+        print(f"pcodes: {url}: {error}", file=sys.stderr)
+        return None
+    if not isinstance(entries, list):
+        return None
+    return {(e.get("grp"), e.get("adm")): str(e.get("date") or "") for e in entries}
+
+
+def is_current(cache_dir: Path, iso3: str, settings) -> bool:
+    """Whether oex, pointed at the country's slice, would find it current: every level
+    there, at the date the manifest lists now."""
+    target = country_dir(cache_dir, iso3)
+    own = _dates(target)
+    dates = manifest_dates(settings.manifest_url) if own else None
+    if dates is None:
+        return False
+    for level in settings.levels:
+        date = dates.get((settings.manifest_group, level))
+        if not date or own.get(str(level)) != date:
+            return False
+        if not (target / f"adm{level}_polygons.parquet").is_file():
+            return False
+    return True
+
+
+def write_slice(source: Path, iso3: str, target: Path) -> int:
+    """The country's rows of one admin level, with the file's schema and GeoParquet
+    metadata unchanged. Returns the row count; zero is a valid slice."""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(source, filters=[("iso_3", "=", iso3.upper())])
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_name(f".{target.name}.partial")
+    pq.write_table(table, partial)
+    os.replace(partial, target)
+    return table.num_rows
+
+
+def build_country(entries: dict, iso3: str, cache_dir: Path) -> int:
+    """Every level's slice for one country, then the meta.json that makes oex trust
+    them, written last so an interrupted build never reads as warm."""
+    target = country_dir(cache_dir, iso3)
+    meta: dict = {"levels": {}}
+    rows = 0
+    for level, entry in sorted(entries.items()):
+        path = target / entry.path.name
+        rows += write_slice(entry.path, iso3, path)
+        meta["levels"][str(level)] = {
+            "date": entry.upstream_date,
+            "url": entry.upstream_url,
+            "path": str(path),
+        }
+    shared = json.loads((cache_dir / "meta.json").read_text(encoding="utf-8"))
+    meta["manifest_url"] = shared.get("manifest_url")
+    meta["manifest_group"] = shared.get("manifest_group")
+    partial = target / ".meta.json.partial"
+    partial.write_text(json.dumps(meta, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(partial, target / "meta.json")
+    return rows
+
+
+def warm(settings, countries: Iterable[str], workers: int = WORKERS) -> tuple[list, list]:
+    """Bring the shared cache up to the current release, then slice it for every
+    country that is not warm yet. Returns (built, failed) country lists."""
+    from oex.pcodes import ensure_admin_parquets
+
+    cache_dir = resolved_dir(settings.cache_dir)
+    if cache_dir is None:
+        raise PcodeCacheError(f"source.pcodes.cache_dir {settings.cache_dir} does not resolve")
+    try:
+        entries = ensure_admin_parquets(
+            cache_dir=cache_dir,
+            levels=settings.levels,
+            manifest_url=settings.manifest_url,
+            parquet_url_template=settings.parquet_url_template,
+            manifest_group=settings.manifest_group,
+        )
+    except Exception as error:
+        # oex's own cache error, a filesystem one, or any of requests' network errors.
+        raise PcodeCacheError(f"{settings.manifest_url}: {error}") from error
+
+    unique = dict.fromkeys(iso3.upper() for iso3 in countries)
+    stale = [iso3 for iso3 in unique if not is_warm(cache_dir, iso3, settings.levels)]
+
+    def guarded(iso3: str) -> Exception | None:
+        try:
+            build_country(entries, iso3, cache_dir)
+        except Exception as error:  # noqa: BLE001 - that country's job reads the world instead
+            return error
+        return None
+
+    built, failed = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for iso3, error in zip(stale, pool.map(guarded, stale), strict=True):
+            if error is None:
+                built.append(iso3)
+            else:
+                print(f"pcodes: {iso3} not sliced: {error}", file=sys.stderr)
+                failed.append(iso3)
+    return built, failed
+
+
+def main() -> int:
+    from boundaries import scheduled_countries
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("warm",))
+    parser.add_argument("iso3", nargs="*", help="default: every scheduled country")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    settings = base_settings()
+    if settings is None:
+        print("pcodes: tagging is off in base.yaml, nothing to warm")
+        return 0
+    try:
+        built, failed = warm(settings, args.iso3 or scheduled_countries(), args.workers)
+    except PcodeCacheError as error:
+        print(f"pcodes: {error}", file=sys.stderr)
+        return 1
+    print(f"pcodes: {len(built)} country slice(s) built, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Checks run over every job of a sweep before any of them is dispatched.
+
+A broken input otherwise shows up only when its job is reached, hours in: a config
+oex rejects, an env var an interpolation needs, a PBF path that is not there, a
+country geoBoundaries does not publish (HKG, until it got an override), a disk too
+small for the export. check() returns every problem it finds in one config, and
+run() checks all of a sweep's configs concurrently, since most of the wait is on
+the network.
+"""
+
+import json
+import shutil
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+WORKERS = 16
+# Disk a job needs, as a multiple of its source PBF: the PBF, the parquet built
+# from it, and the zipped formats, which exist together until the upload.
+DISK_FACTOR = 3
+GEOBOUNDARIES_URL = "https://www.geoboundaries.org/api/current/gbOpen/{iso3}/{level}/"
+HTTP_TIMEOUT_SECONDS = 60
+
+
+def check_paths(cfg) -> list[str]:
+    """Every directory the export writes to, and a planet PBF it cannot download."""
+    from oex.preflight import PreflightError, check_writable_paths
+
+    problems = []
+    try:
+        check_writable_paths(cfg)
+    except PreflightError as error:
+        problems.append(str(error))
+    osm = cfg.source.get("osm")
+    if osm is not None and osm.enabled and osm.engine == "planet" and osm.pbf_path:
+        local = not urlparse(osm.pbf_path).scheme
+        if local and not Path(osm.pbf_path).is_file() and not osm.auto_download_planet:
+            problems.append(
+                f"source.osm.pbf_path {osm.pbf_path} does not exist and auto_download_planet is off"
+            )
+    return problems
+
+
+def check_boundary(cfg, iso3: str | None) -> list[str]:
+    """An inline geometry that parses, or a geoBoundaries entry for the country."""
+    import requests
+    from shapely.geometry import shape
+
+    geom = cfg.boundary.geom
+    if geom:
+        if geom.strip().lower() == "world":
+            return []
+        try:
+            parsed = json.loads(geom)
+            collection = parsed.get("type") == "FeatureCollection"
+            for feature in parsed["features"] if collection else [parsed]:
+                shape(feature.get("geometry", feature))
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            return [f"boundary.geom is not a GeoJSON geometry: {error}"]
+        return []
+    if not iso3:
+        return ["no iso3 and no boundary.geom, so there is no boundary to export within"]
+    level = cfg.boundary.geoboundaries_level
+    url = GEOBOUNDARIES_URL.format(iso3=iso3.upper(), level=level)
+    try:
+        response = requests.get(url, timeout=HTTP_TIMEOUT_SECONDS)
+        payload = response.json() if response.status_code == 200 else {}
+        found = bool(payload.get("gjDownloadURL") or payload.get("simplifiedGeometryGeoJSON"))
+    except (requests.RequestException, ValueError) as error:
+        return [f"geoBoundaries could not be reached for {iso3} {level}: {error}"]
+    if found:
+        return []
+    hint = f"set boundary.geom in configs/countries/{iso3.upper()}.yaml"
+    return [f"geoBoundaries publishes no {level} for {iso3} (HTTP {response.status_code}); {hint}"]
+
+
+def source_size(cfg, iso3: str | None, problems: list[str]) -> int | None:
+    """Bytes of the PBF the job will read, or None when that cannot be told up front.
+    A Geofabrik extract that does not exist is a problem unless the planet backs it."""
+    import requests
+
+    osm = cfg.source.get("osm")
+    if osm is None or not osm.enabled:
+        return None
+    if osm.engine == "geofabrik" and iso3:
+        from oex.osm.geofabrik import GeofabrikLookupError, lookup_country
+
+        try:
+            extract = lookup_country(iso3, index_url=osm.geofabrik_index_url)
+        except GeofabrikLookupError as error:
+            if not osm.planet_fallback:
+                problems.append(f"no Geofabrik extract and no planet fallback: {error}")
+                return None
+        except (requests.RequestException, RuntimeError) as error:
+            problems.append(f"Geofabrik index could not be read: {error}")
+            return None
+        else:
+            try:
+                head = requests.head(
+                    extract.pbf_url, timeout=HTTP_TIMEOUT_SECONDS, allow_redirects=True
+                )
+                return int(head.headers["Content-Length"])
+            except (requests.RequestException, KeyError, ValueError):
+                return None
+    if osm.pbf_path and not urlparse(osm.pbf_path).scheme and Path(osm.pbf_path).is_file():
+        return Path(osm.pbf_path).stat().st_size
+    return None
+
+
+def check_disk(cfg, size: int | None) -> list[str]:
+    """Free space on each filesystem the export writes to, against DISK_FACTOR times
+    its source PBF. Checked per job: jobs run one after another and clean up."""
+    if size is None:
+        return []
+    need = DISK_FACTOR * size
+    targets = [Path(cfg.output.dir)]
+    osm = cfg.source.get("osm")
+    if osm is not None and osm.enabled:
+        targets.append(Path(osm.cache_dir))
+    problems, seen = [], set()
+    for target in targets:
+        existing = target.resolve()
+        while not existing.exists():
+            existing = existing.parent
+        device = existing.stat().st_dev
+        if device in seen:
+            continue
+        seen.add(device)
+        free = shutil.disk_usage(existing).free
+        if free < need:
+            problems.append(
+                f"{free / 1024**3:.1f} GiB free under {target}, the export needs about "
+                f"{need / 1024**3:.1f} GiB ({DISK_FACTOR}x its {size / 1024**3:.1f} GiB PBF)"
+            )
+    return problems
+
+
+def check(config: Path, iso3: str | None) -> list[str]:
+    """Every problem preflight finds in one config; empty means it should run."""
+    from oex.config.loader import load_config
+
+    try:
+        # Merges over oex's defaults, resolves every interpolation and validates.
+        cfg = load_config(config)
+    except Exception as error:  # noqa: BLE001 - nothing else can be checked without it
+        return [f"config does not load: {error}"]
+    iso3 = iso3 or cfg.iso3 or None
+    problems = check_paths(cfg) + check_boundary(cfg, iso3)
+    size = source_size(cfg, iso3, problems)
+    return problems + check_disk(cfg, size)
+
+
+def run(
+    targets: Iterable[tuple[str, Path, str | None]], workers: int = WORKERS
+) -> dict[str, list[str]]:
+    """Problems by name for each (name, config, iso3), checked side by side. A config
+    checked under two names, such as the osm and overture jobs of one file, is
+    checked once."""
+    targets = list(targets)
+    unique = list(dict.fromkeys((config, iso3) for _, config, iso3 in targets))
+
+    def guarded(key: tuple[Path, str | None]) -> list[str]:
+        try:
+            return check(*key)
+        except Exception as error:  # noqa: BLE001 - a crash is one more finding
+            return [f"preflight crashed: {error!r}"]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        found = dict(zip(unique, pool.map(guarded, unique), strict=True))
+    return {name: found[(config, iso3)] for name, config, iso3 in targets}
@@ -0,0 +1,80 @@
+#!/usr/bin/env -S uv run python
+"""Run one oex-cli invocation with its DuckDB queries profiled, and optionally cProfile.
+
+    profile_job.py --cprofile OUT_DIR osm --config configs/base.yaml --iso3 NPL
+
+sweep.py --profile runs the jobs it matches through this. OUT_DIR receives
+`oex.prof` (for pstats or snakeviz) under --cprofile, and one DuckDB JSON profile
+per statement of each category's main query, `duckdb-<table>-<n>.json`. Under a
+sampling profiler the sampler wraps this script instead, and --cprofile is left off.
+"""
+
+import cProfile
+import sys
+from pathlib import Path
+
+
+class _ProfiledConnection:
+    """Gives each statement its own profiling_output, so the COUNT that follows the
+    CREATE in oex's materialise() does not overwrite the profile that matters."""
+
+    def __init__(self, conn, stem: Path):
+        self._conn = conn
+        self._stem = stem
+        self._statements = 0
+
+    def execute(self, sql: str, *args):
+        self._statements += 1
+        self._conn.execute(f"SET profiling_output='{self._stem}-{self._statements}.json'")
+        return self._conn.execute(sql, *args)
+
+
+def enable_duckdb_profiling(out_dir: Path) -> None:
+    """Profile the query that materialises each category, which is where a slow export
+    spends its time. oex has no switch for this, so its materialise() is wrapped."""
+    import oex.exporter
+
+    original = oex.exporter.materialise
+
+    def profiled(conn, table_name: str, *args):
+        conn.execute("PRAGMA enable_profiling='json'")
+        try:
+            proxy = _ProfiledConnection(conn, out_dir / f"duckdb-{table_name}")
+            return original(proxy, table_name, *args)
+        finally:
+            conn.execute("PRAGMA disable_profiling")
+
+    oex.exporter.materialise = profiled
+
+
+def main() -> int:
+    argv = sys.argv[1:]
+    use_cprofile = argv[:1] == ["--cprofile"]
+    if use_cprofile:
+        argv = argv[1:]
+    if len(argv) < 2:
+        print(__doc__, file=sys.stderr)
+        return 2
+    out_dir = Path(argv[0])
+    out_dir.mkdir(parents=True, exist_ok=True)
+    enable_duckdb_profiling(out_dir)
+
+    from oex.cli import app
+
+    sys.argv = ["oex-cli", *argv[1:]]
+    profiler = cProfile.Profile() if use_cprofile else None
+    try:
+        if profiler is not None:
+            profiler.runcall(app)
+        else:
+            app()
+    except SystemExit as exit:
+        return exit.code if isinstance(exit.code, int) else int(exit.code is not None)
+    finally:
+        if profiler is not None:
+            profiler.dump_stats(out_dir / "oex.prof")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+#!/usr/bin/env -S uv run python
+"""Publish only the categories whose features changed since they were last published.
+
+    publish_gate.py osm --config .sweep/merged/BVT.yaml --iso3 BVT
+
+sweep.py runs a country export in two steps. oex-cli builds every category with
+--no-hdx-push --no-s3, then this script publishes. It digests the features in each
+category's artifacts and compares them with `.published.json`, the manifest the last
+publish left next to oex's `.state.json`. Every unchanged category is marked uploaded
+in oex's resume state, under the HDX dataset it already has, and oex-cli runs once
+more with the config's own HDX and S3 settings: its resume path uploads the changed
+categories from the artifacts already built and skips the rest. When nothing
+changed, it does not run at all.
+
+oex resumes a category only at the snapshot it was built from, and with `latest` it
+asks Geofabrik or Overture which that is. Should upstream roll over between the two
+steps, the second run would rebuild and republish every category, so it runs from
+`<config>.publish.yaml`, a copy of the config pinned to the snapshot the build used.
+
+A digest covers the data files in each zip and nothing oex stamps into it: README.txt,
+config.yaml and metadata.json are left out, the date in a .dbf header is masked, and a
+GeoPackage is digested row by row rather than as a file. The feature count comes from
+the zip's metadata.json.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+import yaml
+
+MANIFEST_NAME = ".published.json"
+# Written by oex into every zip, with the time or the build's own details in them.
+STAMPED = frozenset({"README.txt", "config.yaml", "metadata.json"})
+CHUNK = 4 * 1024 * 1024
+# The setting each source resolves `latest` from.
+SNAPSHOT_KEYS = {"osm": "snapshot", "overture": "release"}
+
+
+def _gpkg_rows(path: Path, digest) -> None:
+    """Every feature table's rows in fid order. gpkg_contents carries last_change, and
+    SQLite's page layout can differ between identical tables, so the file is not it."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        tables = [
+            row[0]
+            for row in conn.execute(
+                "SELECT table_name FROM gpkg_contents WHERE data_type = 'features' "
+                "ORDER BY table_name"
+            )
+        ]
+        for table in tables:
+            digest.update(table.encode())
+            for row in conn.execute(f'SELECT * FROM "{table}" ORDER BY 1'):
+                digest.update(repr(row).encode())
+    finally:
+        conn.close()
+
+
+def artifact_digest(path: Path) -> str:
+    """SHA-256 over the features in one zip, stable across rebuilds of the same data."""
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(path) as bundle:
+        for info in sorted(bundle.infolist(), key=lambda i: i.filename):
+            name = info.filename
+            if info.is_dir() or Path(name).name in STAMPED:
+                continue
+            digest.update(name.encode())
+            if name.endswith(".gpkg"):
+                with tempfile.TemporaryDirectory() as scratch:
+                    local = Path(scratch) / "layer.gpkg"
+                    with bundle.open(info) as src, local.open("wb") as dst:
+                        shutil.copyfileobj(src, dst, CHUNK)
+                    _gpkg_rows(local, digest)
+                continue
+            with bundle.open(info) as member:
+                head = member.read(32)
+                if name.endswith(".dbf") and len(head) >= 4:
+                    # Bytes 1-3 are the date of the last update.
+                    head = head[:1] + b"\0\0\0" + head[4:]
+                digest.update(head)
+                while chunk := member.read(CHUNK):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def feature_count(path: Path) -> int | None:
+    """The row count oex recorded in the zip's metadata.json, when it wrote one."""
+    with zipfile.ZipFile(path) as bundle:
+        if "metadata.json" not in bundle.namelist():
+            return None
+        item = json.loads(bundle.read("metadata.json"))
+    return (item.get("properties") or {}).get("table:row_count")
+
+
+def category_record(zip_paths: list[str]) -> dict:
+    """Digest and feature count of one category, over all of its artifacts."""
+    paths = sorted(Path(p) for p in zip_paths)
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(f"{path.name}:{artifact_digest(path)}\n".encode())
+    counts = [feature_count(path) for path in paths]
+    return {
+        "digest": digest.hexdigest(),
+        "features": next((count for count in counts if count is not None), None),
+    }
+
+
+def read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json(path: Path, payload: dict) -> None:
+    partial = path.with_name(f".{path.name}.partial")
+    partial.write_text(json.dumps(payload, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(partial, path)
+
+
+def gate(
+    out_root: Path, iso3: str, source: str, remove_after_upload: bool
+) -> tuple[dict[str, dict], list[str]]:
+    """Mark every built category whose features match the manifest as uploaded.
+    Returns the records of those that changed, by slug, and the unchanged slugs."""
+    from oex.state import StateStore
+
+    state = StateStore(out_root / ".state.json", iso3=iso3, source=source)
+    built = read_json(out_root / ".state.json").get("categories") or {}
+    published = read_json(out_root / MANIFEST_NAME)
+    changed: dict[str, dict] = {}
+    unchanged: list[str] = []
+    for slug, entry in built.items():
+        if not entry.get("built_utc") or entry.get("uploaded_utc"):
+            continue
+        if not entry.get("zip_paths") or not all(Path(p).is_file() for p in entry["zip_paths"]):
+            continue
+        record = category_record(entry["zip_paths"])
+        last = published.get(slug) or {}
+        if last.get("digest") != record["digest"]:
+            changed[slug] = record
+            continue
+        state.mark_uploaded(slug, hdx_dataset=last.get("hdx_dataset"))
+        unchanged.append(slug)
+        if remove_after_upload:
+            # As oex would have after uploading them.
+            for path in [*entry["zip_paths"], entry.get("metadata_json_path")]:
+                if path:
+                    Path(path).unlink(missing_ok=True)
+    return changed, unchanged
+
+
+def record_published(out_root: Path, changed: dict[str, dict]) -> None:
+    """Add the categories the publish uploaded to the manifest."""
+    entries = read_json(out_root / ".state.json").get("categories") or {}
+    published = read_json(out_root / MANIFEST_NAME)
+    for slug, record in changed.items():
+        entry = entries.get(slug) or {}
+        if entry.get("uploaded_utc"):
+            published[slug] = {
+                **record,
+                "hdx_dataset": entry.get("hdx_dataset"),
+                "snapshot": entry.get("snapshot_label"),
+                "published": entry["uploaded_utc"],
+            }
+    write_json(out_root / MANIFEST_NAME, published)
+
+
+def built_snapshot(out_root: Path, slugs) -> str | None:
+    """The snapshot the build made these categories from, or None when they disagree."""
+    entries = read_json(out_root / ".state.json").get("categories") or {}
+    labels = {(entries.get(slug) or {}).get("snapshot_label") for slug in slugs}
+    return labels.pop() if len(labels) == 1 else None
+
+
+def pinned_config(config: Path, command: str, label: str) -> Path:
+    """A copy of the config whose source resolves to `label` rather than `latest`."""
+    raw = yaml.safe_load(config.read_text(encoding="utf-8")) or {}
+    source = raw.setdefault("source", {}).setdefault(command, {}) or {}
+    raw["source"][command] = {**source, SNAPSHOT_KEYS[command]: label}
+    pinned = config.with_name(f"{config.stem}.{command}.publish.yaml")
+    pinned.write_text(yaml.safe_dump(raw, sort_keys=False), encoding="utf-8")
+    return pinned
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("osm", "overture"))
+    parser.add_argument("--config", type=Path, required=True)
+    parser.add_argument("--iso3", default=None)
+    args = parser.parse_args()
+
+    from oex.config.loader import load_config
+    from oex.config.schema import dataset_identity
+
+    cfg = load_config(args.config)
+    iso3 = (args.iso3 or cfg.iso3).upper()
+    out_root = Path(cfg.output.dir) / dataset_identity(cfg) / args.command
+    changed, unchanged = gate(out_root, iso3, args.command, cfg.output.remove_after_upload)
+    print(f"publish {iso3}/{args.command}: {len(changed)} changed, {len(unchanged)} unchanged")
+    if not changed:
+        return 0
+
+    config = args.config
+    label = built_snapshot(out_root, changed)
+    if label:
+        config = pinned_config(args.config, args.command, label)
+    argv = ["uv", "run", "oex-cli", args.command, "--config", str(config)]
+    if args.iso3:
+        argv += ["--iso3", args.iso3]
+    returncode = subprocess.run(argv, check=False).returncode
+    record_published(out_root, changed)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
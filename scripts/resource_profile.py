@@ -0,0 +1,278 @@
+#!/usr/bin/env -S uv run python
+"""What each country's export needs, from cheap statistics of its source extract.
+
+    resource_profile.py measure                        every scheduled country's cached PBF
+    resource_profile.py measure NPL path/to/npl.osm.pbf  one country, from a given file
+    resource_profile.py show                           each measured country's profile
+
+The statistics are the PBF's size, its nodes and ways as pbf.stats() estimates them
+from the file's blocks without decoding a feature, and the area of the country's
+boundary. They are kept in .sweep/pbf_stats.json. sweep.py measures a country's PBF
+whenever it finds one in the OSM cache, including a sharded country's just before
+removing it, so the figures follow each extract as it grows.
+
+A country's export is expected to need MEMORY_FLOOR_GB plus GB_PER_MILLION for each
+million nodes and ways. The profile caps that at the share of the host oex would
+take by itself, and gives DuckDB every CPU unless the cap bites, then fewer in
+proportion, since each thread holds its own buffers. A country that needs more than
+the cap belongs in `heavy`, where it is sharded, and one in `heavy` that fits does
+not; the sweep and `show` say so.
+
+Before each sweep, the peak RSS of every country's last whole OSM export, as the
+event logs record it, is kept next to its statistics. Once MIN_CALIBRATION countries
+have one, the two constants are fitted to those peaks, grown by HEADROOM, in place
+of the estimates. A country with a peak of its own needs that peak with HEADROOM.
+Only such a country has its profile written into its merged config, as
+`parallel.memory_gb` and `parallel.threads`, and only where its override sets
+neither; any other keeps oex's default, and `show` says what it recommends.
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+import events
+import pbf
+import yaml
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SCHEDULE_FILE = REPO_ROOT / "scripts" / "schedule.yaml"
+HEAVY_GROUP = "heavy"
+# Estimates, until enough countries have a measured peak to fit them to.
+MEMORY_FLOOR_GB = 2
+GB_PER_MILLION = 0.1
+MIN_CALIBRATION = 5
+# A measured peak is one run's; the next, on a grown extract, may need more.
+HEADROOM = 1.25
+# oex's own default memory limit, as a share of the host.
+OEX_SHARE = 0.7
+KM_PER_DEGREE = 111.32
+
+
+@dataclass(frozen=True)
+class Profile:
+    needed_gb: float
+    memory_gb: int
+    threads: int
+
+    measured: bool = False
+
+    @property
+    def heavy(self) -> bool:
+        return self.needed_gb > self.memory_gb
+
+
+def default_stats_file() -> Path:
+    return REPO_ROOT / ".sweep" / "pbf_stats.json"
+
+
+def load(path: Path) -> dict[str, dict]:
+    """Statistics by ISO3. Missing or unreadable means none yet."""
+    if not path.is_file():
+        return {}
+    try:
+        return dict(json.loads(path.read_text(encoding="utf-8")))
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return {}
+
+
+def save(path: Path, stats: dict[str, dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    partial.write_text(json.dumps(stats, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(partial, path)
+
+
+def area_km2(geojson: str) -> float:
+    """Area of a GeoJSON geometry on the sinusoidal projection, which keeps areas."""
+    import numpy as np
+    import shapely
+    from shapely.geometry import shape
+
+    def sinusoidal(coords):
+        return (
+            np.column_stack((coords[:, 0] * np.cos(np.radians(coords[:, 1])), coords[:, 1]))
+            * KM_PER_DEGREE
+        )
+
+    return float(shapely.transform(shape(json.loads(geojson)), sinusoidal).area)
+
+
+def record(path: Path, iso3: str, source: Path, boundary: str | None = None) -> dict:
+    """The country's statistics, measuring source unless it is the file measured last
+    time, unchanged. The boundary's area is kept from before when none is given."""
+    stats = load(path)
+    known = stats.get(iso3.upper(), {})
+    stat = source.stat()
+    if known.get("source") == str(source) and (known.get("bytes"), known.get("mtime")) == (
+        stat.st_size,
+        stat.st_mtime,
+    ):
+        measured = dict(known)
+    else:
+        measured = {"source": str(source), **pbf.stats(source)}
+        for kept in ("area_km2", "peak_rss"):
+            if kept in known:
+                measured[kept] = known[kept]
+    if boundary:
+        measured["area_km2"] = round(area_km2(boundary), 1)
+    if measured != known:
+        save(path, {**load(path), iso3.upper(): measured})
+    return measured
+
+
+def record_cached(path: Path, iso3: str, pbf_dir: Path, boundary: str | None = None) -> dict | None:
+    """record() for the newest country extract in an OSM cache's `_pbf` folder, if any."""
+    found = sorted(pbf_dir.glob("*-latest.osm.pbf"), key=lambda p: p.stat().st_mtime)
+    return record(path, iso3, found[-1], boundary) if found else None
+
+
+def peaks(paths: Iterable[Path]) -> dict[str, int]:
+    """The peak RSS of each country's latest successful OSM export in the event logs,
+    which are read oldest first. A shard or tile holds only part of a country."""
+    found: dict[str, int] = {}
+    for path in paths:
+        for span in events.load([path]):
+            attrs = span.attrs
+            if span.phase != "export" or not span.ok or "peak_rss" not in attrs:
+                continue
+            if attrs.get("command") == "osm" and attrs.get("iso3") and not attrs.get("parent"):
+                found[attrs["iso3"].upper()] = int(attrs["peak_rss"])
+    return found
+
+
+def record_peaks(path: Path, found: dict[str, int]) -> None:
+    """Keep each country's measured peak with its statistics."""
+    stats = load(path)
+    updated = {
+        iso3: {**stats.get(iso3, {}), "peak_rss": peak}
+        for iso3, peak in found.items()
+        if stats.get(iso3, {}).get("peak_rss") != peak
+    }
+    if updated:
+        save(path, {**stats, **updated})
+
+
+def _entities(stats: dict) -> float:
+    return (stats.get("nodes", 0) + stats.get("ways", 0)) / 1e6
+
+
+def calibrate(stats: dict[str, dict]) -> tuple[float, float]:
+    """(floor GB, GB per million nodes and ways) fitted to the measured peaks with
+    HEADROOM, or the estimates while fewer than MIN_CALIBRATION countries have one
+    or the fit does not grow with the extract."""
+    points = [
+        (_entities(entry), HEADROOM * entry["peak_rss"] / 1024**3)
+        for entry in stats.values()
+        if entry.get("peak_rss") and entry.get("nodes")
+    ]
+    if len({x for x, _ in points}) < MIN_CALIBRATION:
+        return MEMORY_FLOOR_GB, GB_PER_MILLION
+    slope, intercept = statistics.linear_regression(*zip(*points, strict=True))
+    if slope <= 0:
+        return MEMORY_FLOOR_GB, GB_PER_MILLION
+    return max(intercept, 0.5), slope
+
+
+def profile(
+    stats: dict,
+    host_gb: float,
+    cpus: int,
+    model: tuple[float, float] = (MEMORY_FLOOR_GB, GB_PER_MILLION),
+) -> Profile:
+    """The country's own peak with HEADROOM if it has one, else model's estimate."""
+    floor, per_million = model
+    measured = bool(stats.get("peak_rss"))
+    if measured:
+        needed = HEADROOM * stats["peak_rss"] / 1024**3
+    else:
+        needed = floor + per_million * _entities(stats)
+    cap = max(1, int(host_gb * OEX_SHARE))
+    memory_gb = min(cap, math.ceil(needed))
+    threads = cpus if needed <= cap else max(1, int(cpus * cap / needed))
+    return Profile(round(needed, 1), memory_gb, threads, measured)
+
+
+def placement(group: str, iso3: str, found: Profile) -> str | None:
+    """Why the country's profile says it is in the wrong group, if it does."""
+    if found.heavy and group != HEAVY_GROUP:
+        return (
+            f"{group}/{iso3} needs about {found.needed_gb:.0f} GB, more than the "
+            f"{found.memory_gb} GB one export may take: it belongs in {HEAVY_GROUP}"
+        )
+    if not found.heavy and group == HEAVY_GROUP:
+        return (
+            f"{group}/{iso3} needs about {found.needed_gb:.0f} GB, which one export "
+            f"fits in: it need not be in {HEAVY_GROUP}"
+        )
+    return None
+
+
+def scheduled_groups() -> dict[str, str]:
+    """The group of every country in the schedule."""
+    schedule = yaml.safe_load(SCHEDULE_FILE.read_text(encoding="utf-8")) or {}
+    groups = {}
+    for name in schedule.get("groups") or []:
+        for iso3 in (schedule.get(name) or {}).get("countries") or {}:
+            groups.setdefault(iso3, name)
+    return groups
+
+
+def main() -> int:
+    from host import host_memory_gb
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=("measure", "show"))
+    parser.add_argument("iso3", nargs="?")
+    parser.add_argument("pbf", nargs="?", type=Path, help="with an ISO3, the file to measure")
+    args = parser.parse_args()
+    path = default_stats_file()
+    groups = scheduled_groups()
+
+    if args.command == "measure":
+        if args.pbf is not None:
+            measured = {args.iso3.upper(): record(path, args.iso3, args.pbf)}
+        else:
+            from sweep import country_config
+
+            # Merging a country's config measures its cached PBF, if it has one.
+            measured = {}
+            for iso3 in [args.iso3.upper()] if args.iso3 else sorted(groups):
+                country_config(iso3, "monthly")
+                if iso3 in load(path):
+                    measured[iso3] = load(path)[iso3]
+        print(f"resources: {len(measured)} country extract(s) on record")
+        return 0
+
+    host_gb, cpus = host_memory_gb(), os.cpu_count() or 1
+    stats_by_iso3 = load(path)
+    model = calibrate(stats_by_iso3)
+    basis = "estimated" if model == (MEMORY_FLOOR_GB, GB_PER_MILLION) else "fitted to peaks"
+    print(f"model: {model[0]:.1f} GB + {model[1]:.3f} GB per million nodes and ways, {basis}")
+    print(f"{'country':<8} {'PBF':>8} {'nodes':>8} {'ways':>7} {'km2':>10} {'needs':>7}  parallel")
+    for iso3, stats in sorted(stats_by_iso3.items()):
+        found = profile(stats, host_gb, cpus, model)
+        area = f"{stats['area_km2']:>10,.0f}" if "area_km2" in stats else f"{'':>10}"
+        print(
+            f"{iso3:<8} {stats['bytes'] / 1024**3:>6.2f}GB {stats['nodes'] / 1e6:>7.1f}M "
+            f"{stats['ways'] / 1e6:>6.1f}M {area} {found.needed_gb:>5.1f}GB  "
+            f"memory_gb={found.memory_gb} threads={found.threads} "
+            f"({'applied' if found.measured else 'recommended'})"
+        )
+        note = placement(groups[iso3], iso3, found) if iso3 in groups else None
+        if note:
+            print(f"         {note}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""Replay a sweep's jobs against what they cost last time, without running them.
+
+    sweep.py --simulate                                 every enabled job
+    sweep.py --simulate --frequency monthly --concurrency 1,2,4
+    sweep.py --simulate --cost-model mymodel:cost       costs from a function of the job
+    sweep.py --simulate --fake --speedup 600            fake_oex.py through the real runner
+
+Each job costs the wall time and peak RSS of its latest successful run in the
+sweep's event logs. A job with no run there costs the median of its group's, or
+DEFAULT_SECONDS and DEFAULT_RSS when the group has none either. --cost-model names
+a function, `module:function`, that takes a Job and returns (seconds, peak RSS in
+bytes) to use instead.
+
+The replay dispatches whole units as run_jobs does, up to N at a time, and holds
+the next one back while its largest stage would not fit in memory next to what is
+running. It reports, for each concurrency and ordering:
+
+    makespan    from the start of the sweep to the end of its last job
+    peak RAM    the most the running jobs held at once
+    idle        the share of worker time no unit was using
+    missed      jobs that end later than their frequency's period after the start,
+                so the next timer would find the sweep still running
+
+--fake runs the jobs through run_jobs for real, each as fake_oex.py, which sleeps
+and allocates what the job costs, the time divided by --speedup and the memory
+multiplied by --memory-scale.
+"""
+
+import heapq
+import importlib
+import itertools
+import statistics
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+import events
+
+DEFAULT_SECONDS = 30 * 60
+DEFAULT_RSS = 4 * 1024**3
+DAY = 24 * 60 * 60
+# The monthly timer fires on the 1st, so February leaves 28 days.
+WINDOWS = {"daily": DAY, "weekly": 7 * DAY, "monthly": 28 * DAY}
+
+
+class SimulateError(Exception):
+    """The cost model could not be loaded."""
+
+
+@dataclass(frozen=True)
+class Cost:
+    seconds: float
+    peak_rss: int
+
+
+@dataclass(frozen=True)
+class Outcome:
+    concurrency: int
+    order: str
+    makespan: float
+    peak_rss: int
+    idle: float
+    missed: tuple[str, ...]
+
+
+CostModel = Callable[[object], Cost]
+
+
+def history(paths: Iterable[Path]) -> dict[str, Cost]:
+    """The latest successful run of each job in the logs, which are read oldest first."""
+    recorded: dict[str, Cost] = {}
+    for path in paths:
+        for span in events.load([path]):
+            if span.phase == "export" and span.ok and "peak_rss" in span.attrs:
+                recorded[span.name] = Cost(span.seconds, int(span.attrs["peak_rss"]))
+    return recorded
+
+
+def history_model(recorded: dict[str, Cost]) -> CostModel:
+    """A job's own run, else its group's median, else the defaults."""
+    by_group: dict[str, list[Cost]] = defaultdict(list)
+    for job_id, cost in recorded.items():
+        by_group[job_id.split("/", 1)[0]].append(cost)
+    medians = {
+        group: Cost(
+            statistics.median(c.seconds for c in costs),
+            int(statistics.median(c.peak_rss for c in costs)),
+        )
+        for group, costs in by_group.items()
+    }
+
+    def cost(job) -> Cost:
+        if job.id in recorded:
+            return recorded[job.id]
+        return medians.get(job.group, Cost(DEFAULT_SECONDS, DEFAULT_RSS))
+
+    return cost
+
+
+def load_model(spec: str) -> CostModel:
+    """`module:function`, imported from the path; its return value is read as a Cost."""
+    module_name, _, name = spec.partition(":")
+    try:
+        function = getattr(importlib.import_module(module_name), name)
+    except (ImportError, AttributeError, ValueError) as error:
+        raise SimulateError(f"cost model {spec!r}: {error}") from error
+
+    def cost(job) -> Cost:
+        value = function(job)
+        return value if isinstance(value, Cost) else Cost(float(value[0]), int(value[1]))
+
+    return cost
+
+
+def _stages(unit: list) -> list[list]:
+    return [list(batch) for _, batch in itertools.groupby(unit, key=lambda job: job.stage)]
+
+
+def unit_seconds(unit: list, costs: dict[str, Cost]) -> float:
+    return sum(max(costs[job.id].seconds for job in stage) for stage in _stages(unit))
+
+
+def _window(unit: list) -> float:
+    return min(WINDOWS.get(job.frequency, float("inf")) for job in unit)
+
+
+ORDERS: dict[str, Callable[[list[list], dict[str, Cost]], list[list]]] = {
+    "schedule": lambda units, costs: list(units),
+    "longest-first": lambda units, costs: sorted(units, key=lambda u: -unit_seconds(u, costs)),
+    "shortest-first": lambda units, costs: sorted(units, key=lambda u: unit_seconds(u, costs)),
+    "tightest-window": lambda units, costs: sorted(units, key=_window),
+}
+
+
+def peak(intervals: list[tuple[float, float, int]]) -> int:
+    """The most held at once; a job ending frees its memory before one starting then."""
+    edges = sorted(
+        [(start, rss) for start, _, rss in intervals] + [(end, -rss) for _, end, rss in intervals]
+    )
+    held = most = 0
+    for _, step in edges:
+        held += step
+        most = max(most, held)
+    return most
+
+
+def replay(
+    units: list[list], costs: dict[str, Cost], concurrency: int, memory: int
+) -> tuple[float, int, float, list[str]]:
+    """(makespan, peak RSS, idle share, missed job ids) of the units run in order."""
+    clock = 0.0
+    held = 0
+    running: list[tuple[float, int]] = []
+    intervals: list[tuple[float, float, int]] = []
+    busy = 0.0
+    missed = []
+    for unit in units:
+        stages = _stages(unit)
+        need = max(sum(costs[job.id].peak_rss for job in stage) for stage in stages)
+        while running and (len(running) >= concurrency or held + need > memory):
+            end, freed = heapq.heappop(running)
+            clock, held = max(clock, end), held - freed
+        start = clock
+        for stage in stages:
+            for job in stage:
+                end = start + costs[job.id].seconds
+                intervals.append((start, end, costs[job.id].peak_rss))
+                if end > WINDOWS.get(job.frequency, float("inf")):
+                    missed.append(job.id)
+            start = max(start + costs[job.id].seconds for job in stage)
+        busy += start - clock
+        heapq.heappush(running, (start, need))
+        held += need
+    makespan = max((end for _, end, _ in intervals), default=0.0)
+    idle = 1 - busy / (makespan * concurrency) if makespan else 0.0
+    return makespan, peak(intervals), idle, missed
+
+
+def simulate(
+    units: list[list],
+    cost: CostModel,
+    concurrencies: Iterable[int],
+    orders: Iterable[str],
+    memory: int,
+) -> list[Outcome]:
+    costs = {job.id: cost(job) for unit in units for job in unit}
+    outcomes = []
+    for order in orders:
+        ordered = ORDERS[order](units, costs)
+        for concurrency in concurrencies:
+            makespan, peak_rss, idle, missed = replay(ordered, costs, concurrency, memory)
+            outcomes.append(Outcome(concurrency, order, makespan, peak_rss, idle, tuple(missed)))
+    return outcomes
+
+
+def _hours(seconds: float) -> str:
+    return f"{seconds / 3600:.1f}h"
+
+
+def summarise(outcomes: list[Outcome]) -> str:
+    lines = [f"{'workers':>7}  {'order':<16} {'makespan':>9} {'peak RAM':>10} {'idle':>6}  missed"]
+    for o in outcomes:
+        lines.append(
+            f"{o.concurrency:>7}  {o.order:<16} {_hours(o.makespan):>9} "
+            f"{o.peak_rss / 1024**3:>7.1f} GB {o.idle:>6.1%}  {len(o.missed)}"
+        )
+        if o.missed:
+            shown = ", ".join(o.missed[:5])
+            more = f" and {len(o.missed) - 5} more" if len(o.missed) > 5 else ""
+            lines.append(f"{'':>9}missed: {shown}{more}")
+    return "\n".join(lines) + "\n"
+
+
+def fake_jobs(
+    jobs: list, cost: CostModel, script: Path, speedup: float, memory_scale: float
+) -> list:
+    """The jobs as fake_oex.py runs, each sleeping and holding what it costs, scaled.
+    They clean nothing up: a unit's cleanup would remove the real extracts and tiles,
+    and record their stats, when the fake has made none of them."""
+    faked = []
+    for job in jobs:
+        c = cost(job)
+        profile = (
+            ("FAKE_OEX_SECONDS", f"{c.seconds / speedup:.3f}"),
+            ("FAKE_OEX_RSS", str(int(c.peak_rss * memory_scale))),
+        )
+        faked.append(
+            replace(job, script=script, profile_dir=None, env=(*job.env, *profile), cleanup=())
+        )
+    return faked
@@ -0,0 +1,123 @@
+"""Order a sweep's units by how overdue their datasets are, for --order staleness.
+
+A unit's age is the time since its least recent job last succeeded, and it is
+overdue by that age over its frequency's period, so 2.0 is a monthly country two
+months old. Its score is that weighted by its group's place in `groups:`, 1 for the
+first group, 1/2 for the second, 1/3 for the third, and so on: a `normal` country
+has to be three times as overdue as a `priority` one to go before it. A unit that
+has never succeeded goes first and an "as needed" one last. Ties keep the
+schedule's order.
+
+Success times come from the sweep's own records, every shard's included, or, with
+`--staleness-source hdx`, also from each country's first category dataset on HDX,
+the later of its `last_modified` and its `review_date`. The later of the two sources
+counts. Since publish_gate.py, a rebuild whose features did not change is not pushed,
+so HDX does not see it and its dates fall behind; the sweep's record of the success
+does not.
+"""
+
+import math
+import time
+from collections.abc import Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+
+from metrics import load_timestamps
+from simulate import WINDOWS
+
+SOURCES = ("sweep", "hdx")
+
+
+def last_successes(paths: Iterable[Path]) -> dict[str, float]:
+    """The latest success of each job across last-success records."""
+    merged: dict[str, float] = {}
+    for path in paths:
+        for job_id, stamp in load_timestamps(path).items():
+            merged[job_id] = max(stamp, merged.get(job_id, stamp))
+    return merged
+
+
+def _hdx_time(value) -> float:
+    stamp = datetime.fromisoformat(str(value))
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=UTC)
+    return stamp.timestamp()
+
+
+def hdx_last_modified(iso3s: Iterable[str]) -> dict[str, float]:
+    """When each country's datasets last changed or were reviewed on HDX, by ISO3,
+    read anonymously. A country with nothing published is left out."""
+    import yaml
+    from hdx.api.configuration import Configuration
+    from hdx.data.dataset import Dataset
+    from sync_hdx_frequency import BASE_CONFIG, REPO_ROOT, categories, dataset_key
+
+    base = yaml.safe_load(BASE_CONFIG.read_text(encoding="utf-8")) or {}
+    first = categories(REPO_ROOT / base["categories_file"])[0]
+    Configuration.create(
+        hdx_site=base["hdx"]["site"], user_agent=base["hdx"]["user_agent"], hdx_read_only=True
+    )
+    found = {}
+    for iso3 in sorted(set(iso3s)):
+        dataset = Dataset.read_from_hdx(f"{dataset_key(iso3, base)}_{iso3.lower()}_{first}")
+        if dataset is None:
+            continue
+        stamps = [
+            _hdx_time(dataset[key]) for key in ("last_modified", "review_date") if dataset.get(key)
+        ]
+        if stamps:
+            found[iso3.upper()] = max(stamps)
+    return found
+
+
+def overdue(
+    unit: list, stamps: dict[str, float], countries: dict[str, float], now: float
+) -> float | None:
+    """Periods since the unit last succeeded, by the later of the sweep's records and
+    HDX's; inf if neither has it, None without a period."""
+    period = min(WINDOWS.get(job.frequency, math.inf) for job in unit)
+    if period == math.inf:
+        return None
+    known = []
+    if all(job.id in stamps for job in unit):
+        known.append(min(stamps[job.id] for job in unit))
+    first = unit[0]
+    if first.iso3 and first.iso3.upper() in countries:
+        known.append(countries[first.iso3.upper()])
+    if not known:
+        return math.inf
+    return max(0.0, now - max(known)) / period
+
+
+def order(
+    units: list[list],
+    stamps: dict[str, float],
+    ranks: dict[str, int],
+    countries: dict[str, float] | None = None,
+    now: float | None = None,
+) -> list[tuple[list, float | None]]:
+    """(unit, periods overdue) for each unit, the highest score first."""
+    now = time.time() if now is None else now
+    scored = []
+    for unit in units:
+        periods = overdue(unit, stamps, countries or {}, now)
+        weight = 1 / (1 + ranks.get(unit[0].group, len(ranks)))
+        score = -1.0 if periods is None else periods * weight
+        scored.append((unit, periods, score))
+    scored.sort(key=lambda item: -item[2])
+    return [(unit, periods) for unit, periods, _ in scored]
+
+
+def describe(ordered: list[tuple[list, float | None]], shown: int = 5) -> str:
+    parts = []
+    for unit, periods in ordered[:shown]:
+        label = unit[0].parent or unit[0].id
+        if periods is None:
+            age = "as needed"
+        elif periods == math.inf:
+            age = "never run"
+        else:
+            age = f"{periods:.1f}x overdue"
+        parts.append(f"{label} ({age})")
+    more = f" and {len(ordered) - shown} more" if len(ordered) > shown else ""
+    return ", ".join(parts) + more
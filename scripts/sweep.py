@@ -6,21 +6,66 @@
     sweep.py --frequency "as needed"                the manual-only jobs
     sweep.py --dry-run                              print the commands, run nothing
     sweep.py --json                                 print the job list, run nothing
+    sweep.py --report [LOG ...]                     where the time went, from event logs
+    sweep.py --profile 'priority/NPL*'              profile the jobs that match
+    sweep.py --preflight                            check every job's inputs, run nothing
+    sweep.py --simulate                             predict makespan and memory, run nothing
+    sweep.py --shard 2/4                            the second of four cost-balanced shards
+    sweep.py --order staleness                      the most overdue datasets first
 
-Exit codes: 1 a job failed, 2 the schedule is malformed, 3 another sweep holds the lock.
+Every sweep runs the preflight checks before dispatching, unless --no-preflight.
+
+Each job runs in its own session, and a job that times out is ended with its whole
+process tree: SIGTERM, then SIGKILL after TERM_GRACE_SECONDS. The next job starts only
+once nothing of it is left. SIGTERM to the sweep does the same to every running job
+and starts nothing more. SIGUSR1 drains it: running jobs finish, nothing new starts.
+
+Each job spills to a directory of its own under --spill-dir, passed to it as
+OEX_DUCKDB_TEMP and TMPDIR. A job whose directory grows past its quota is ended as
+one that timed out, and the directory is removed when the job ends, however it ends.
+
+Under memory pressure, watchdog.py pauses the running jobs of the latest groups in
+`groups:`, and may end one to requeue it after the rest; --no-watchdog turns it off.
+
+Exit codes: 1 a job failed, 2 the schedule is malformed, 3 another sweep holds the lock,
+4 preflight found problems, 5 a signal stopped or drained the sweep before every job ran.
 """
 
 import argparse
+import contextlib
 import fcntl
+import fnmatch
+import hashlib
+import itertools
 import json
+import os
+import shutil
+import signal
+import sqlite3
 import subprocess
 import sys
-from dataclasses import dataclass
-from datetime import date
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, replace
+from datetime import date, datetime
 from pathlib import Path
 
+import boundaries
+import events
+import overture_cache
+import pbf_store
+import pcode_cache
+import preflight
+import resource_profile
+import simulate
+import staleness
 import yaml
+from events import EventLog
+from host import host_memory_gb
+from metrics import Metrics, load_timestamps, save_timestamps
 from omegaconf import OmegaConf
+from tile_country import config_categories, publish_config, tile_config, work_dir
+from watchdog import Watchdog, pressure
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 SCHEDULE_FILE = REPO_ROOT / "scripts" / "schedule.yaml"
@@ -30,6 +75,18 @@ WORK_DIR = REPO_ROOT / ".sweep"
 MANUAL_FREQUENCY = "as needed"
 COMMAND_SOURCES = ("osm", "overture")
 DEFAULT_TIMEOUT_SECONDS = 6 * 60 * 60
+POLL_SECONDS = 0.5
+# How long a job's processes have to exit after SIGTERM before they are killed.
+TERM_GRACE_SECONDS = 30
+PROFILE_SCRIPT = REPO_ROOT / "scripts" / "profile_job.py"
+PROFILERS = ("cprofile", "py-spy")
+TILE_SCRIPT = REPO_ROOT / "scripts" / "tile_country.py"
+PUBLISH_SCRIPT = REPO_ROOT / "scripts" / "publish_gate.py"
+OVERTURE_SCRIPT = REPO_ROOT / "scripts" / "overture_cache.py"
+FAKE_SCRIPT = REPO_ROOT / "scripts" / "fake_oex.py"
+# Without --spill-quota-gb, the share of the spill volume's free space that the jobs
+# of a stage split between them.
+SPILL_FREE_SHARE = 0.8
 
 
 class ScheduleError(Exception):
@@ -44,12 +101,46 @@ class Job:
     config: Path
     iso3: str | None
     extra: tuple[str, ...] = ()
+    profile_dir: Path | None = None
+    profiler: str = "cprofile"
+    # Run through this script, e.g. tile_country.py, instead of oex-cli.
+    script: Path | None = None
+    # A shard or tile names the job it is part of. Jobs of one parent run as one unit,
+    # stage by stage, the jobs of a stage side by side.
+    parent: str | None = None
+    stage: int = 0
+    env: tuple[tuple[str, str], ...] = ()
+    # Removed once every job of the unit has finished.
+    cleanup: tuple[Path, ...] = ()
+    # The schedule's, for the simulator's missed windows.
+    frequency: str | None = None
+
+    def environ(self) -> dict[str, str] | None:
+        return {**os.environ, **dict(self.env)} if self.env else None
 
     def argv(self) -> list[str]:
-        argv = ["uv", "run", "oex-cli", self.command, "--config", str(self.config)]
+        args = [self.command, "--config", str(self.config)]
         if self.iso3:
-            argv += ["--iso3", self.iso3]
-        return argv + list(self.extra)
+            args += ["--iso3", self.iso3]
+        args += list(self.extra)
+        if self.script is not None:
+            return ["uv", "run", "python", str(self.script), *args]
+        if self.profile_dir is None:
+            return ["uv", "run", "oex-cli", *args]
+        wrapped = ["uv", "run", "python", str(PROFILE_SCRIPT)]
+        if self.profiler == "cprofile":
+            return [*wrapped, "--cprofile", str(self.profile_dir), *args]
+        sampled = self.profile_dir / "py-spy.speedscope.json"
+        sampler = [
+            "py-spy",
+            "record",
+            "--subprocesses",
+            "--format",
+            "speedscope",
+            "-o",
+            str(sampled),
+        ]
+        return [*sampler, "--", *wrapped, str(self.profile_dir), *args]
 
     def as_dict(self) -> dict:
         return {
@@ -58,6 +149,10 @@ class Job:
             "command": self.command,
             "config": str(self.config.relative_to(REPO_ROOT)),
             "iso3": self.iso3,
+            "parent": self.parent,
+            "stage": self.stage,
+            "frequency": self.frequency,
+            "env": dict(self.env),
             "argv": self.argv(),
         }
 
@@ -95,12 +190,23 @@ def skip_reason(attrs: dict, frequency_filter: str | None, today: date) -> str |
     return None
 
 
-def country_config(iso3: str, frequency: str) -> Path:
+def country_config(iso3: str, frequency: str, dry_run: bool = False) -> Path:
     """configs/countries/<ISO3>.yaml merged over base, with the schedule's frequency.
 
     The frequency is written in last because oex passes it to HDX as the expected
     update frequency, so a dataset advertises the cadence that actually runs it.
     Interpolations stay unresolved, so no secret reaches the merged file.
+
+    Unless the override draws its own, the boundary comes from the local store,
+    already buffered, so the job never resolves it; without a stored one, oex
+    fetches it at run time as before. Likewise pcode tagging reads the country's
+    slice of the admin polygons, while that slice is of the release fieldmaps lists.
+    With dry_run, as in a rehearsal, the store is only read.
+
+    A PBF in the OSM cache is measured here, except in a rehearsal, for the resource
+    profile; see resource_profile.py. Once the country has a measured peak, its
+    profile sets `parallel.memory_gb` and `parallel.threads`, unless the override sets
+    either; until then oex keeps its own default.
     """
     layers = [OmegaConf.load(BASE_CONFIG)]
     override = COUNTRY_CONFIG_DIR / f"{iso3}.yaml"
@@ -108,12 +214,173 @@ def country_config(iso3: str, frequency: str) -> Path:
         layers.append(OmegaConf.load(override))
     layers.append(OmegaConf.create({"frequency": frequency}))
     merged = OmegaConf.merge(*layers)
+    boundary = merged.get("boundary") or {}
+    if not boundary.get("geom"):
+        geom = boundaries.prepared_boundary(
+            boundaries.default_store(),
+            boundary.get("geoboundaries_level", "ADM0"),
+            iso3,
+            float(boundary.get("buffer_meters", 0) or 0),
+            read_only=dry_run,
+        )
+        if geom is not None:
+            merged.boundary.geom = geom
+            merged.boundary.buffer_meters = 0
+    pcodes = (merged.get("source") or {}).get("pcodes") or {}
+    if pcodes.get("enabled"):
+        raw = OmegaConf.to_container(pcodes, resolve=False)
+        cache_dir = raw.get("cache_dir", "data/pcodes")
+        shared = pcode_cache.resolved_dir(cache_dir)
+        settings = pcode_cache.settings_of(raw)
+        if shared is not None and settings and pcode_cache.is_current(shared, iso3, settings):
+            merged.source.pcodes.cache_dir = f"{cache_dir}/countries/{iso3.upper()}"
+    stats_file = resource_profile.default_stats_file()
+    osm = (OmegaConf.to_container(merged, resolve=False).get("source") or {}).get("osm") or {}
+    cache = osm_cache_dir(osm)
+    if not dry_run and cache is not None and osm.get("engine", "geofabrik") == "geofabrik":
+        resource_profile.record_cached(
+            stats_file,
+            iso3,
+            cache / "geofabrik" / iso3.lower() / "_pbf",
+            (merged.get("boundary") or {}).get("geom"),
+        )
+    parallel = merged.get("parallel") or {}
+    if parallel.get("memory_gb") is None and parallel.get("threads") is None:
+        stats = resource_profile.load(stats_file)
+        found = resource_profile.profile(
+            stats.get(iso3.upper(), {}),
+            host_memory_gb(),
+            os.cpu_count() or 1,
+            resource_profile.calibrate(stats),
+        )
+        if found.measured:
+            OmegaConf.update(merged, "parallel.memory_gb", found.memory_gb)
+            OmegaConf.update(merged, "parallel.threads", found.threads)
     target = WORK_DIR / "merged" / f"{iso3}.yaml"
     target.parent.mkdir(parents=True, exist_ok=True)
-    target.write_text(OmegaConf.to_yaml(merged, resolve=False), encoding="utf-8")
+    # Into place whole: a job of another sweep on the host may be reading it.
+    partial = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    partial.write_text(OmegaConf.to_yaml(merged, resolve=False), encoding="utf-8")
+    os.replace(partial, target)
     return target
 
 
+def resolved_setting(value: str) -> str | None:
+    """A config string with its interpolations resolved, or None when one names an env
+    var that is unset."""
+    try:
+        return OmegaConf.to_container(OmegaConf.create({"v": value}), resolve=True)["v"]
+    except Exception:  # noqa: BLE001 - the caller goes without it
+        return None
+
+
+def osm_cache_dir(osm: dict) -> Path | None:
+    """source.osm.cache_dir resolved, or None when it names an env var that is unset."""
+    resolved = resolved_setting(osm.get("cache_dir", "data/osm"))
+    return None if resolved is None else REPO_ROOT / resolved
+
+
+def shard_jobs(job: Job, shards: int) -> list[Job]:
+    """One country job split into sub-jobs, each exporting a bundle of its categories.
+
+    The first shard runs alone and fetches the country extract; it and every other
+    shard keep the PBF, so the rest, which run side by side, reuse it instead of each
+    downloading it. oex keys its parquet on the categories, so each shard still builds
+    its own, smaller one. The memory ceiling, the config's or the host's, is split
+    between the shards running side by side, and the PBF is removed afterwards unless
+    the config keeps it.
+    """
+    raw = OmegaConf.to_container(OmegaConf.load(job.config), resolve=False)
+    categories = config_categories(raw)
+    bundles = [b for b in (categories[i::shards] for i in range(shards)) if b]
+    if len(bundles) < 2:
+        return [job]
+    side_by_side = len(bundles) - 1
+    osm = raw.setdefault("source", {}).setdefault("osm", {})
+    keep_pbf = osm.get("keep_pbf", False)
+    osm["keep_pbf"] = True
+    raw.pop("categories_file", None)
+    memory_gb = (raw.get("parallel") or {}).get("memory_gb")
+
+    cache_dir = osm_cache_dir(osm)
+    cleanup: tuple[Path, ...] = ()
+    if cache_dir is not None and not keep_pbf and osm.get("engine", "geofabrik") == "geofabrik":
+        cleanup = (cache_dir / "geofabrik" / str(job.iso3).lower() / "_pbf",)
+
+    sub_jobs = []
+    for number, bundle in enumerate(bundles, start=1):
+        shard = {**raw, "categories": bundle}
+        env: tuple[tuple[str, str], ...] = ()
+        if number > 1:
+            if memory_gb:
+                shard["parallel"] = {
+                    **raw["parallel"],
+                    "memory_gb": max(1, memory_gb // side_by_side),
+                }
+            else:
+                env = (("OEX_MEMORY_GB", f"{host_memory_gb() / side_by_side:.1f}"),)
+        target = job.config.with_name(f"{job.config.stem}.shard{number}of{len(bundles)}.yaml")
+        target.write_text(
+            OmegaConf.to_yaml(OmegaConf.create(shard), resolve=False), encoding="utf-8"
+        )
+        sub_jobs.append(
+            replace(
+                job,
+                id=f"{job.id}/{number}of{len(bundles)}",
+                config=target,
+                parent=job.id,
+                stage=0 if number == 1 else 1,
+                env=env,
+                cleanup=cleanup,
+            )
+        )
+    return sub_jobs
+
+
+def tile_jobs(job: Job, tiles: int) -> list[Job]:
+    """One country job as a unit in four stages: tile_country.py plans the tiles, every
+    tile exports side by side, tile_country.py merges them, and `oex-cli file`
+    publishes the merged layers. The tile configs and the publish config do not exist
+    until the plan and merge stages write them."""
+    raw = OmegaConf.to_container(OmegaConf.load(job.config), resolve=False)
+    cache_dir = osm_cache_dir(raw.get("source", {}).get("osm", {}))
+    cleanup = (work_dir(cache_dir, str(job.iso3)),) if cache_dir is not None else ()
+    unit = replace(job, parent=job.id, cleanup=cleanup)
+    steps = ("--tiles", str(tiles))
+    return [
+        replace(unit, id=f"{job.id}/plan", command="plan", script=TILE_SCRIPT, extra=steps),
+        *(
+            replace(
+                unit,
+                id=f"{job.id}/tile{n}of{tiles}",
+                config=tile_config(job.config, n, tiles),
+                stage=1,
+            )
+            for n in range(1, tiles + 1)
+        ),
+        replace(
+            unit, id=f"{job.id}/merge", command="merge", script=TILE_SCRIPT, extra=steps, stage=2
+        ),
+        replace(
+            unit, id=f"{job.id}/publish", command="file", config=publish_config(job.config), stage=3
+        ),
+    ]
+
+
+def gated_jobs(job: Job) -> list[Job]:
+    """One country job as a unit of two: oex-cli builds every category without publishing,
+    then publish_gate.py publishes the ones whose features changed since last time. A job
+    that does not publish to HDX anyway runs as it is."""
+    raw = yaml.safe_load(job.config.read_text(encoding="utf-8")) or {}
+    if "--no-hdx-push" in job.extra or not (raw.get("hdx") or {}).get("push"):
+        return [job]
+    unit = replace(job, parent=job.id)
+    return [
+        replace(unit, id=f"{job.id}/build", extra=(*job.extra, "--no-hdx-push", "--no-s3")),
+        replace(unit, id=f"{job.id}/publish", script=PUBLISH_SCRIPT, stage=1),
+    ]
+
+
 def commands_for(config: Path) -> list[str]:
     """Which oex-cli subcommands a config needs. Both sources enabled means both."""
     raw = yaml.safe_load(config.read_text(encoding="utf-8")) or {}
@@ -145,21 +412,50 @@ def group_candidates(name: str, group: dict) -> list[tuple[str, dict, str, objec
     """(label, attrs, kind, ref) for every job in a group, before filtering."""
     if "countries" in group:
         default = group.get("frequency")
-        return [
-            (iso3, attributes(value, default), "country", iso3)
-            for iso3, value in (group["countries"] or {}).items()
-        ]
+        candidates = []
+        for iso3, value in (group["countries"] or {}).items():
+            attrs = attributes(value, default)
+            attrs.setdefault("shards", group.get("shards", 1))
+            attrs.setdefault("tiles", group.get("tiles", 1))
+            attrs.setdefault("gate", group.get("gate", False))
+            candidates.append((iso3, attrs, "country", iso3))
+        return candidates
     if "dir" in group:
         return folder_candidates(name, group)
     raise ScheduleError(f"group {name!r} has neither `countries:` nor `dir:`")
 
 
+def due_countries(
+    schedule: dict, group_filter: str | None, frequency_filter: str | None, today: date
+) -> list[str]:
+    """The countries resolve() would make jobs of, read before it runs, so the
+    warm-ups fetch for them alone. A schedule it cannot read gives none; resolve()
+    reports the error."""
+    countries = []
+    for name in schedule.get("groups") or []:
+        group = schedule.get(name) or {}
+        if group_filter not in (None, name) or "countries" not in group:
+            continue
+        if not group.get("enabled", True):
+            continue
+        try:
+            for _, attrs, _, iso3 in group_candidates(name, group):
+                if frequency_filter is not None and attrs["frequency"] != frequency_filter:
+                    continue
+                if skip_reason(attrs, frequency_filter, today) is None:
+                    countries.append(str(iso3).upper())
+        except (ScheduleError, ValueError):
+            continue
+    return list(dict.fromkeys(countries))
+
+
 def resolve(
     schedule: dict,
     group_filter: str | None,
     frequency_filter: str | None,
     today: date,
     extra: tuple[str, ...] = (),
+    dry_run: bool = False,
 ) -> tuple[list[Job], list[str]]:
     groups = schedule.get("groups")
     if not groups:
@@ -190,7 +486,7 @@ def resolve(
                 continue
 
             config = (
-                country_config(str(ref), attrs["frequency"])
+                country_config(str(ref), attrs["frequency"], dry_run)
                 if kind == "country"
                 else Path(str(ref))
             )
@@ -198,14 +494,171 @@ def resolve(
             commands = commands_for(config)
             for command in commands:
                 suffix = f":{command}" if len(commands) > 1 else ""
-                jobs.append(Job(f"{name}/{label}{suffix}", name, command, config, iso3, extra))
+                job = Job(
+                    f"{name}/{label}{suffix}",
+                    name,
+                    command,
+                    config,
+                    iso3,
+                    extra,
+                    frequency=attrs["frequency"],
+                )
+                shards, tiles = attrs.get("shards", 1), attrs.get("tiles", 1)
+                if kind == "country" and command == "osm" and tiles > 1:
+                    jobs += tile_jobs(job, tiles)
+                elif kind == "country" and command == "osm" and shards > 1:
+                    jobs += shard_jobs(job, shards)
+                elif kind == "country" and attrs.get("gate"):
+                    jobs += gated_jobs(job)
+                else:
+                    jobs.append(job)
     return jobs, skipped
 
 
-def acquire_lock():
+def with_profiling(jobs: list[Job], pattern: str, profiler: str, root: Path) -> list[Job]:
+    """Jobs whose id matches the glob run profiled, each into its own folder under root."""
+    return [
+        replace(
+            job, profile_dir=root / job.id.replace("/", "_").replace(":", "_"), profiler=profiler
+        )
+        if fnmatch.fnmatchcase(job.id, pattern)
+        else job
+        for job in jobs
+    ]
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, e.g. 2/4, got {value!r}") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"there is no shard {index} of {count}")
+    return index, count
+
+
+def journal_dir(shard: tuple[int, int] | None) -> Path:
+    """Where a sweep keeps its lock, last-success record, metrics and event logs. A
+    shard keeps its own, so shards on one host neither block nor overwrite each other."""
+    return WORK_DIR if shard is None else WORK_DIR / "shards" / f"{shard[0]}of{shard[1]}"
+
+
+def history_logs() -> list[Path]:
+    """Every sweep's event log, the shards' included, oldest first. The file names
+    carry the start time, so the order is the same wherever the logs were copied."""
+    logs = [*WORK_DIR.glob("events/sweep-*.jsonl"), *WORK_DIR.glob("shards/*/events/sweep-*.jsonl")]
+    return sorted(logs, key=lambda path: path.name)
+
+
+def expected_cost() -> tuple[str, Callable[[Job], simulate.Cost]]:
+    """What a job is expected to cost, and from what: its recorded wall time, else its
+    country's PBF size, else one per job."""
+    recorded = simulate.history(history_logs())
+    if recorded:
+        return "history", simulate.history_model(recorded)
+    sizes = {
+        iso3: stats["bytes"]
+        for iso3, stats in resource_profile.load(resource_profile.default_stats_file()).items()
+    }
+    if sizes:
+        median = sorted(sizes.values())[len(sizes) // 2]
+        return "size", lambda job: simulate.Cost(sizes.get((job.iso3 or "").upper(), median), 0)
+    return "count", lambda job: simulate.Cost(1, 0)
+
+
+def shard_plan(
+    jobs: list[Job], count: int, cost: Callable[[Job], simulate.Cost]
+) -> list[list[Job]]:
+    """The jobs split into count shards of about equal expected wall time.
+
+    Jobs that share a source extract stay together: the jobs of a unit, and every
+    job of one country, whatever its group. The largest bundle goes first, each to
+    the lightest shard so far, a tie to the lower number. Each shard keeps the
+    schedule's order. The same jobs and costs give the same plan on every runner;
+    see shared_cost() for the costs.
+    """
+    costs = {job.id: cost(job) for job in jobs}
+    bundles: dict[object, list[Job]] = {}
+    for unit in units(jobs):
+        first = unit[0]
+        key = first.iso3.upper() if first.iso3 else first.parent or first.id
+        bundles.setdefault(key, []).extend(unit)
+    weights = {key: simulate.unit_seconds(bundle, costs) for key, bundle in bundles.items()}
+    position = {key: jobs.index(bundle[0]) for key, bundle in bundles.items()}
+    loads = [0.0] * count
+    shards: list[list[object]] = [[] for _ in range(count)]
+    for key in sorted(bundles, key=lambda k: (-weights[k], position[k])):
+        lightest = min(range(count), key=lambda n: (loads[n], n))
+        loads[lightest] += weights[key]
+        shards[lightest].append(key)
+    return [
+        [job for key in sorted(keys, key=position.__getitem__) for job in bundles[key]]
+        for keys in shards
+    ]
+
+
+def shared_cost(path: Path, jobs: list[Job]) -> tuple[str, Callable[[Job], simulate.Cost]]:
+    """What each job is expected to cost, from a table every runner reads. When the
+    file does not exist yet, this runner's expected_cost() writes it; the first writer
+    wins, so runners that share the file share the plan. A job the table does not
+    list costs its median."""
+    if not path.is_file():
+        basis, cost = expected_cost()
+        table = {job.id: cost(job).seconds for job in jobs}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        partial.write_text(
+            json.dumps({"basis": basis, "seconds": table}, indent=2, sort_keys=True),
+            encoding="utf-8",
+        )
+        try:
+            # A link, unlike a rename, never replaces another runner's table.
+            os.link(partial, path)
+        except FileExistsError:
+            pass
+        finally:
+            partial.unlink()
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        table = {str(job_id): float(seconds) for job_id, seconds in payload["seconds"].items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+        raise ScheduleError(f"{path}: not a cost table: {error}") from error
+    median = sorted(table.values())[len(table) // 2] if table else 1.0
+    return path.name, lambda job: simulate.Cost(table.get(job.id, median), 0)
+
+
+def plan_digest(plan: list[list[Job]]) -> str:
+    """Short enough to compare across runners' logs: they must all print the same."""
+    ids = json.dumps([[job.id for job in shard] for shard in plan])
+    return hashlib.sha256(ids.encode()).hexdigest()[:12]
+
+
+def by_staleness(jobs: list[Job], ranks: dict[str, int], source: str) -> list[Job]:
+    """The jobs' units reordered most overdue first; see staleness.py. Success times
+    come from every journal, since shards record their own."""
+    stamps = staleness.last_successes(
+        [WORK_DIR / "last_success.json", *sorted(WORK_DIR.glob("shards/*/last_success.json"))]
+    )
+    countries = {}
+    if source == "hdx":
+        try:
+            countries = staleness.hdx_last_modified(job.iso3 for job in jobs if job.iso3)
+        except Exception as error:  # noqa: BLE001 - the sweep's records will do
+            print(f"sweep: HDX unreadable ({error}), ordering by sweep records", file=sys.stderr)
+            source = "sweep"
+    ordered = staleness.order(units(jobs), stamps, ranks, countries)
+    print(
+        f"sweep: by staleness from {source} records: {staleness.describe(ordered)}",
+        file=sys.stderr,
+    )
+    return [job for unit, _ in ordered for job in unit]
+
+
+def acquire_lock(work_dir: Path | None = None):
     """Non-blocking exclusive lock, so an overrunning tick cannot collide with the next."""
-    WORK_DIR.mkdir(parents=True, exist_ok=True)
-    handle = (WORK_DIR / "sweep.lock").open("w", encoding="utf-8")
+    work_dir = work_dir or WORK_DIR
+    work_dir.mkdir(parents=True, exist_ok=True)
+    handle = (work_dir / "sweep.lock").open("w", encoding="utf-8")
     try:
         fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
     except BlockingIOError:
@@ -214,27 +667,689 @@ def acquire_lock():
     return handle
 
 
-def run_jobs(jobs: list[Job], timeout: int) -> list[str]:
+@contextlib.contextmanager
+def warmup_lock():
+    """Blocking and host-wide: one sweep at a time, shards included, writes the stores
+    every sweep reads, such as the boundary store, the pcodes slices, the merged
+    configs, the PBF stats and the Overture cache. The others wait their turn."""
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    with (WORK_DIR / "warmup.lock").open("w", encoding="utf-8") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+class Progress:
+    """What run_jobs reports as it goes: a metrics textfile and the last-success record.
+
+    Without paths it records nothing, which is what a rehearsal or a test wants.
+    """
+
+    def __init__(
+        self,
+        jobs: list[Job],
+        metrics_file: Path | None = None,
+        successes_file: Path | None = None,
+        event_log: EventLog | None = None,
+    ):
+        self.successes_file = successes_file
+        self.event_log = event_log or EventLog(None, "sweep")
+        self._spans: dict[str, str] = {}
+        self.metrics = Metrics(metrics_file)
+        m = self.metrics
+        m.declare("oex_sweep_jobs", "gauge", "Jobs of this sweep by group and state.")
+        m.declare(
+            "oex_sweep_jobs_finished_total", "counter", "Jobs finished in this sweep by outcome."
+        )
+        m.declare("oex_sweep_job_duration_seconds", "gauge", "Wall time of the job's latest run.")
+        m.declare("oex_sweep_job_peak_rss_bytes", "gauge", "Peak RSS of the job's largest process.")
+        m.declare("oex_sweep_job_spill_peak_bytes", "gauge", "Most the job's spill directory held.")
+        m.declare(
+            "oex_sweep_last_success_timestamp_seconds",
+            "gauge",
+            "When the job last succeeded, in this sweep or an earlier one.",
+        )
+        m.declare(
+            "oex_sweep_updated_timestamp_seconds",
+            "gauge",
+            "When the sweep last wrote this file. Stale while a job runs means it is stuck.",
+        )
+        for group in dict.fromkeys(job.group for job in jobs):
+            for state in ("queued", "running"):
+                m.set("oex_sweep_jobs", 0, group=group, state=state)
+            for outcome in ("succeeded", "failed"):
+                m.set("oex_sweep_jobs_finished_total", 0, group=group, outcome=outcome)
+        for job in jobs:
+            m.inc("oex_sweep_jobs", group=job.group, state="queued")
+        for job_id, stamp in self.successes().items():
+            m.set("oex_sweep_last_success_timestamp_seconds", stamp, job=job_id)
+        self.write()
+
+    def successes(self) -> dict[str, float]:
+        return load_timestamps(self.successes_file) if self.successes_file else {}
+
+    def write(self) -> None:
+        self.metrics.set("oex_sweep_updated_timestamp_seconds", time.time())
+        self.metrics.write()
+
+    def started(self, job: Job) -> None:
+        self._spans[job.id] = self.event_log.start(
+            job.id,
+            "export",
+            group=job.group,
+            command=job.command,
+            iso3=job.iso3,
+            parent=job.parent,
+            profile=job.profile_dir,
+        )
+        self.metrics.inc("oex_sweep_jobs", -1, group=job.group, state="queued")
+        self.metrics.inc("oex_sweep_jobs", group=job.group, state="running")
+        self.write()
+
+    def skipped(self, job: Job) -> None:
+        """A job that never ran because the stage it depends on failed."""
+        self.metrics.inc("oex_sweep_jobs", -1, group=job.group, state="queued")
+        self.metrics.inc("oex_sweep_jobs_finished_total", group=job.group, outcome="failed")
+        self.write()
+
+    def requeued(self, job: Job, seconds: float, peak_rss: int) -> None:
+        """A job ended to relieve memory pressure, back in the queue to run again."""
+        self.event_log.end(self._spans.pop(job.id), ok=False, peak_rss=peak_rss, requeued=True)
+        self.metrics.inc("oex_sweep_jobs", -1, group=job.group, state="running")
+        self.metrics.inc("oex_sweep_jobs", group=job.group, state="queued")
+        self.write()
+
+    def finished(
+        self, job: Job, ok: bool, seconds: float, peak_rss: int, spill_peak: int | None = None
+    ) -> None:
+        attrs = {} if spill_peak is None else {"spill_peak": spill_peak}
+        self.event_log.end(self._spans.pop(job.id), ok=ok, peak_rss=peak_rss, **attrs)
+        m = self.metrics
+        m.inc("oex_sweep_jobs", -1, group=job.group, state="running")
+        outcome = "succeeded" if ok else "failed"
+        m.inc("oex_sweep_jobs_finished_total", group=job.group, outcome=outcome)
+        m.set("oex_sweep_job_duration_seconds", seconds, job=job.id, group=job.group)
+        m.set("oex_sweep_job_peak_rss_bytes", peak_rss, job=job.id, group=job.group)
+        if spill_peak is not None:
+            m.set("oex_sweep_job_spill_peak_bytes", spill_peak, job=job.id, group=job.group)
+        if ok:
+            stamp = time.time()
+            m.set("oex_sweep_last_success_timestamp_seconds", stamp, job=job.id)
+            if self.successes_file is not None:
+                save_timestamps(self.successes_file, {**self.successes(), job.id: stamp})
+        self.write()
+
+
+class Supervisor:
+    """The running jobs' process groups, and what signals, and the memory watchdog if
+    there is one, have asked of the sweep.
+
+    Without install() no handler is set, which is what a test wants.
+    """
+
+    def __init__(self, watchdog: Watchdog | None = None):
+        self.groups: set[int] = set()
+        self.draining = False
+        self.stopping = False
+        # Jobs a drain kept from starting, as run_jobs left them.
+        self.left = 0
+        self.watchdog = watchdog
+
+    def track(self, pgid: int, job: Job, requeue: bool = True) -> None:
+        self.groups.add(pgid)
+        if self.watchdog is not None:
+            self.watchdog.track(pgid, job.id, job.group, requeue)
+
+    def untrack(self, pgid: int) -> None:
+        self.groups.discard(pgid)
+        if self.watchdog is not None:
+            self.watchdog.untrack(pgid)
+
+    def poll(self) -> None:
+        if self.watchdog is not None:
+            self.watchdog.poll(self.groups)
+
+    def paused_seconds(self, pgid: int) -> float:
+        """How long the watchdog has held the job stopped, which its timeout leaves out."""
+        return self.watchdog.paused_seconds(pgid) if self.watchdog is not None else 0.0
+
+    def evicted(self, pgid: int) -> bool:
+        """Whether the watchdog has asked for the job to be ended and requeued."""
+        return self.watchdog is not None and pgid in self.watchdog.evicted
+
+    def install(self) -> None:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGUSR1, self._drain)
+
+    def _drain(self, signum, frame) -> None:
+        self.draining = True
+        print("sweep: SIGUSR1, draining: running jobs finish, none start", file=sys.stderr)
+
+    def _stop(self, signum, frame) -> None:
+        self.draining = self.stopping = True
+        print("sweep: SIGTERM, stopping every running job", file=sys.stderr)
+        for pgid in list(self.groups):
+            signal_group(pgid, signal.SIGTERM)
+            # A job the watchdog paused would otherwise never see it.
+            signal_group(pgid, signal.SIGCONT)
+
+
+@dataclass
+class Spill:
+    """A job's own DuckDB temp directory, with the most it held and whether that
+    passed the quota."""
+
+    path: Path
+    quota: int
+    peak: int = 0
+    exceeded: bool = False
+
+    def size(self) -> int:
+        """Bytes allocated under the directory; DuckDB's temp files are sparse."""
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_blocks * 512
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def check(self) -> bool:
+        """Measure the directory, and say whether the job has gone over its quota."""
+        size = self.size()
+        self.peak = max(self.peak, size)
+        self.exceeded = self.exceeded or size > self.quota
+        return self.exceeded
+
+
+def default_spill_dir() -> Path:
+    """OEX_SPILL_DIR, else data/spill under OEX_DATA_DIR."""
+    if os.environ.get("OEX_SPILL_DIR"):
+        return Path(os.environ["OEX_SPILL_DIR"])
+    return Path(os.environ.get("OEX_DATA_DIR", REPO_ROOT)) / "data" / "spill"
+
+
+def spill_root(spill_dir: Path) -> Path:
+    """This sweep's folder of the volume, which shards on one host share."""
+    return spill_dir / f"sweep-{os.getpid()}"
+
+
+def clear_stale_spills(spill_dir: Path) -> list[Path]:
+    """Remove what sweeps that are no longer running left, e.g. one killed outright."""
+    removed = []
+    for path in sorted(spill_dir.glob("sweep-*")):
+        pid = path.name.removeprefix("sweep-")
+        if pid.isdigit() and int(pid) != os.getpid() and not Path(f"/proc/{pid}").exists():
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    return removed
+
+
+def signal_group(pgid: int, sig: int) -> None:
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def group_alive(pgid: int) -> bool:
+    """Whether any process of the group still runs. A zombie holds no memory, and one
+    orphaned to an init that does not reap would otherwise keep the group alive."""
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[2]) == pgid and fields[0] not in ("Z", "X"):
+            return True
+    return False
+
+
+def end_groups(
+    processes: dict[int, subprocess.Popen], reaped: dict[int, tuple[int, object]] | None = None
+) -> Iterator[tuple[int, int, object]]:
+    """(position, wait status, rusage) for each child, once its whole process group
+    has gone. Each group gets SIGTERM, and SIGKILL if any of it outlives the grace.
+
+    A job runs in its own session, so its group is its pid. A child not already in
+    reaped is reaped here; what it started outlives it in the group until killed.
+    """
+    for process in processes.values():
+        signal_group(process.pid, signal.SIGTERM)
+        signal_group(process.pid, signal.SIGCONT)
+    deadline = time.monotonic() + TERM_GRACE_SECONDS
+    killed = False
+    reaped = dict(reaped or {})
+    pending = dict(processes)
+    while pending:
+        for position, process in list(pending.items()):
+            if position not in reaped:
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    reaped[position] = (status, usage)
+            if position in reaped and not group_alive(process.pid):
+                del pending[position]
+                yield position, *reaped[position]
+        if pending and not killed and time.monotonic() >= deadline:
+            for process in pending.values():
+                signal_group(process.pid, signal.SIGKILL)
+            killed = True
+        if pending:
+            time.sleep(POLL_SECONDS)
+
+
+def wait_all(
+    processes: list[subprocess.Popen],
+    timeout: float,
+    supervisor: Supervisor | None = None,
+    over: dict[int, Callable[[], bool]] | None = None,
+) -> Iterator[tuple[int, int | None, int]]:
+    """(position, exit code, peak RSS in bytes) for each child as it exits. Children still
+    running at the timeout, not counting the time the supervisor's watchdog held them
+    stopped, or when the supervisor is stopping, are ended with their process tree and
+    yield None for the code, as does a child whose check in over, by position, says so
+    at a poll, or that the supervisor's watchdog evicts. A child that exits leaving
+    processes behind in its group has those ended before it is yielded.
+
+    os.wait4 returns that child's own rusage, where RUSAGE_CHILDREN would be the running
+    maximum across every job the sweep has run so far.
+    """
+    supervisor = supervisor or Supervisor()
+    deadline = time.monotonic() + timeout
+    pending = dict(enumerate(processes))
+    while pending:
+        for position, process in list(pending.items()):
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                if group_alive(process.pid):
+                    for _ in end_groups({position: process}, {position: (status, usage)}):
+                        pass
+                process.returncode = os.waitstatus_to_exitcode(status)
+                del pending[position]
+                yield position, process.returncode, usage.ru_maxrss * 1024
+        supervisor.poll()
+        ended = {
+            p: process
+            for p, process in pending.items()
+            if supervisor.evicted(process.pid) or (over and p in over and over[p]())
+        }
+        if ended:
+            for position, status, usage in end_groups(ended):
+                process = pending.pop(position)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                yield position, None, usage.ru_maxrss * 1024
+        now = time.monotonic()
+        overdue = {
+            p: process
+            for p, process in pending.items()
+            if supervisor.stopping or now >= deadline + supervisor.paused_seconds(process.pid)
+        }
+        if overdue:
+            for position, status, usage in end_groups(overdue):
+                process = pending.pop(position)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                yield position, None, usage.ru_maxrss * 1024
+        if pending:
+            time.sleep(POLL_SECONDS)
+
+
+def wait_with_usage(process: subprocess.Popen, timeout: float) -> tuple[int | None, int]:
+    """Exit code and peak RSS of one child; the code is None when it timed out."""
+    _, returncode, peak_rss = next(wait_all([process], timeout))
+    return returncode, peak_rss
+
+
+def units(jobs: list[Job]) -> list[list[Job]]:
+    """Jobs in run order, with consecutive jobs of one parent grouped into a unit."""
+    grouped: list[list[Job]] = []
+    for job in jobs:
+        if grouped and job.parent is not None and grouped[-1][0].parent == job.parent:
+            grouped[-1].append(job)
+        else:
+            grouped.append([job])
+    return grouped
+
+
+def stages(unit: list[Job]) -> list[list[Job]]:
+    return [list(batch) for _, batch in itertools.groupby(unit, key=lambda job: job.stage)]
+
+
+def run_jobs(
+    jobs: list[Job],
+    timeout: int,
+    progress: Progress | None = None,
+    supervisor: Supervisor | None = None,
+    spill_dir: Path | None = None,
+    spill_quota: int | None = None,
+) -> list[str]:
+    """Run jobs in order. A unit of shards or tiles runs stage by stage, the jobs of a
+    stage side by side; a failed stage skips the stages after it, which depend on it.
+    Each unit is reported as one line when it is done. Once the supervisor drains, no
+    stage starts, and the jobs left are neither run nor failures.
+
+    A job the supervisor's watchdog evicts is requeued once, with the stages after it,
+    to run again after every other unit.
+
+    With a spill_dir, each job gets a directory of its own under it, which is ended
+    with the job if it passes spill_quota bytes, by default an equal share of
+    SPILL_FREE_SHARE of the volume's free space between the stage's jobs."""
+    progress = progress or Progress(jobs)
+    supervisor = supervisor or Supervisor()
     failures = []
     total = len(jobs)
-    for index, job in enumerate(jobs, start=1):
-        print(f"[{index}/{total}] {job.id}: {' '.join(job.argv())}", flush=True)
+    index = 0
+    queue = units(jobs)
+    requeued_once: set[str] = set()
+    for unit in queue:
+        unit_failures = 0
+        requeued: list[Job] = []
+        for batch in stages(unit):
+            if supervisor.draining:
+                break
+            if requeued and not unit_failures:
+                # Waits for the jobs it depends on to run again.
+                requeued += batch
+                continue
+            if unit_failures:
+                for job in batch:
+                    index += 1
+                    print(
+                        f"[{index}/{total}] {job.id} SKIPPED, an earlier stage failed",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+                    progress.skipped(job)
+                    failures.append(job.id)
+                continue
+            running = []
+            spills: dict[int, Spill] = {}
+            if spill_dir is not None:
+                spill_dir.mkdir(parents=True, exist_ok=True)
+                quota = spill_quota or int(
+                    shutil.disk_usage(spill_dir).free * SPILL_FREE_SHARE / len(batch)
+                )
+            for job in batch:
+                index += 1
+                print(f"[{index}/{total}] {job.id}: {' '.join(job.argv())}", flush=True)
+                progress.started(job)
+                env = job.environ()
+                if spill_dir is not None:
+                    spill = Spill(spill_dir / job.id.replace("/", "_").replace(":", "_"), quota)
+                    shutil.rmtree(spill.path, ignore_errors=True)
+                    spill.path.mkdir()
+                    spills[len(running)] = spill
+                    env = {**(env or os.environ), "OEX_DUCKDB_TEMP": str(spill.path)}
+                    env["TMPDIR"] = str(spill.path)
+                # Its own session, so the job's whole tree can be signalled as one group.
+                process = subprocess.Popen(
+                    job.argv(), cwd=REPO_ROOT, env=env, start_new_session=True
+                )
+                supervisor.track(process.pid, job, requeue=job.id not in requeued_once)
+                running.append((index, job, time.monotonic(), process))
+            processes = [r[3] for r in running]
+
+            over = {position: spill.check for position, spill in spills.items()}
+            for position, returncode, peak_rss in wait_all(processes, timeout, supervisor, over):
+                number, job, started, process = running[position]
+                evicted = returncode is None and supervisor.evicted(process.pid)
+                supervisor.untrack(process.pid)
+                spill = spills.get(position)
+                if spill is not None:
+                    # Whatever it wrote after the last poll, then nothing of it left.
+                    spill.check()
+                    shutil.rmtree(spill.path, ignore_errors=True)
+                if evicted and not supervisor.stopping:
+                    progress.requeued(job, time.monotonic() - started, peak_rss)
+                    print(
+                        f"[{number}/{total}] {job.id} REQUEUED, ended under memory pressure",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+                    requeued.append(job)
+                    requeued_once.add(job.id)
+                    total += 1
+                    continue
+                progress.finished(
+                    job,
+                    returncode == 0,
+                    time.monotonic() - started,
+                    peak_rss,
+                    spill.peak if spill else None,
+                )
+                if returncode != 0 and supervisor.stopping:
+                    print(f"[{number}/{total}] {job.id} STOPPED", file=sys.stderr, flush=True)
+                elif returncode is None and spill is not None and spill.exceeded:
+                    print(
+                        f"[{number}/{total}] {job.id} SPILL over {spill.quota / 1024**3:.1f} GB",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+                elif returncode is None:
+                    print(
+                        f"[{number}/{total}] {job.id} TIMEOUT after {timeout}s",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+                elif returncode != 0:
+                    print(
+                        f"[{number}/{total}] {job.id} FAILED rc={returncode}",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+                if returncode != 0:
+                    failures.append(job.id)
+                    unit_failures += 1
+        if requeued and not supervisor.draining:
+            queue.append(requeued)
+            continue
+        if unit[0].parent is not None:
+            done = sum(1 for job in unit if job.id not in failures)
+            print(f"{unit[0].parent}: {done}/{len(unit)} job(s) complete", flush=True)
+        for path in unit[0].cleanup:
+            if unit[0].iso3 and path.is_dir():
+                # The last look at a sharded country's extract before it goes.
+                resource_profile.record_cached(
+                    resource_profile.default_stats_file(), unit[0].iso3, path
+                )
+            shutil.rmtree(path, ignore_errors=True)
+        if supervisor.draining:
+            break
+    supervisor.left = total - index
+    return failures
+
+
+def placement_notes(jobs: list[Job]) -> list[str]:
+    """Countries whose resource profile says they are in the wrong group."""
+    stats = resource_profile.load(resource_profile.default_stats_file())
+    model = resource_profile.calibrate(stats)
+    notes = []
+    for group, iso3 in dict.fromkeys((job.group, job.iso3) for job in jobs if job.iso3):
+        if iso3.upper() in stats:
+            found = resource_profile.profile(
+                stats[iso3.upper()], host_memory_gb(), os.cpu_count() or 1, model
+            )
+            note = resource_profile.placement(group, iso3, found)
+            if note:
+                notes.append(note)
+    return notes
+
+
+def refresh_boundaries(event_log: EventLog, countries: list[str]) -> None:
+    """Bring the boundary store up to what geoBoundaries serves oex, for the countries
+    about to run that were not checked lately. A failure is not fatal: the stored
+    version, or oex's own fetch, still serves."""
+    if not countries:
+        return
+    level = boundaries.base_level()
+    with event_log.span("boundaries", "resolve", release=boundaries.RELEASE, level=level) as span:
         try:
-            completed = subprocess.run(job.argv(), cwd=REPO_ROOT, timeout=timeout)
-        except subprocess.TimeoutExpired:
-            print(
-                f"[{index}/{total}] {job.id} TIMEOUT after {timeout}s", file=sys.stderr, flush=True
+            span["changed"] = boundaries.refresh(
+                boundaries.default_store(),
+                level,
+                countries,
+                max_age=boundaries.CHECK_AFTER_SECONDS,
             )
-            failures.append(job.id)
+        except (boundaries.BoundaryError, sqlite3.Error, OSError) as error:
+            print(f"sweep: boundary store not refreshed: {error}", file=sys.stderr)
+            span["ok"] = False
+
+
+def warm_pcodes(event_log: EventLog) -> None:
+    """Slice the pcodes admin polygons for every scheduled country not yet sliced for
+    the current release. A failure is not fatal: a country without a slice tags
+    against the shared files, as before."""
+    settings = pcode_cache.base_settings()
+    if settings is None:
+        return
+    with event_log.span("pcodes", "pcodes", levels=list(settings.levels)) as span:
+        try:
+            built, failed = pcode_cache.warm(settings, boundaries.scheduled_countries())
+        except pcode_cache.PcodeCacheError as error:
+            print(f"sweep: pcodes cache not warmed: {error}", file=sys.stderr)
+            span["ok"] = False
+            return
+        span["built"], span["failed"] = len(built), len(failed)
+        if built or failed:
+            print(f"sweep: pcodes sliced for {len(built)} country(ies), {len(failed)} failed")
+
+
+def warm_overture(jobs: list[Job], event_log: EventLog) -> list[Job]:
+    """Pull the Overture subsets the jobs read into the local cache, once per release,
+    and run each job the cache covers through overture_cache.py. A failure is not
+    fatal: whatever is not cached is read from S3 by oex, as before."""
+    overture = [job for job in jobs if job.command == "overture"]
+    if not overture:
+        return jobs
+    root = overture_cache.default_root()
+    configs = list(dict.fromkeys(job.config for job in overture))
+    with event_log.span("overture", "download", configs=len(configs)) as span:
+        try:
+            fetched, evicted = overture_cache.warm(configs, root)
+            span["fetched"], span["evicted"] = len(fetched), len(evicted)
+        except overture_cache.OvertureCacheError as error:
+            print(f"sweep: overture cache not warmed: {error}", file=sys.stderr)
+            span["ok"] = False
+    covered = {config for config in configs if overture_cache.cached(root, config)}
+    return [
+        replace(job, script=OVERTURE_SCRIPT)
+        if job.command == "overture"
+        and job.script is None
+        and job.profile_dir is None
+        and job.config in covered
+        else job
+        for job in jobs
+    ]
+
+
+def planet_sources(jobs: list[Job]) -> dict[Path, tuple[str, str] | None]:
+    """Each local planet the jobs may read, with the (URL, md5 URL) oex would download
+    it from when it is missing, or None if oex would not."""
+    from oex.config.schema import OsmSourceConfig
+
+    defaults = OsmSourceConfig()
+    planets: dict[Path, tuple[str, str] | None] = {}
+    for config in dict.fromkeys(job.config for job in jobs if job.command == "osm"):
+        raw = OmegaConf.to_container(OmegaConf.load(config), resolve=False)
+        osm = (raw.get("source") or {}).get("osm") or {}
+        if osm.get("engine") != "planet" and not osm.get("planet_fallback"):
+            continue
+        value = resolved_setting(str(osm.get("pbf_path") or ""))
+        if not value or "://" in value:
             continue
-        if completed.returncode != 0:
-            print(
-                f"[{index}/{total}] {job.id} FAILED rc={completed.returncode}",
-                file=sys.stderr,
-                flush=True,
+        download = None
+        if osm.get("engine") == "planet" and osm.get("auto_download_planet"):
+            download = (
+                osm.get("pbf_url", defaults.pbf_url),
+                osm.get("md5_url", defaults.md5_url),
             )
-            failures.append(job.id)
-    return failures
+        path = REPO_ROOT / value
+        planets[path] = planets.get(path) or download
+    return planets
+
+
+def warm_planet(jobs: list[Job], event_log: EventLog) -> None:
+    """Put each planet the jobs read into the PBF store, so the Tasking Manager runs
+    share it: adopt one on disk, hashing it once, or fetch one oex would otherwise
+    download itself. A failure is not fatal: oex reads or fetches the path as before."""
+    for path, download in planet_sources(jobs).items():
+        if path.is_file() and pbf_store.stored(path):
+            continue
+        if not path.is_file() and download is None:
+            continue
+        with event_log.span(str(path), "download") as span:
+            try:
+                if path.is_file():
+                    digest = pbf_store.adopt(path)
+                    print(f"sweep: planet {path} in the PBF store as {digest[:12]}")
+                else:
+                    _, span["bytes"] = pbf_store.fetch(download[0], path, md5_url=download[1])
+            except (OSError, pbf_store.StoreError) as error:
+                print(f"sweep: planet not stored: {error}", file=sys.stderr)
+                span["ok"] = False
+
+
+def run_preflight(jobs: list[Job], event_log: EventLog) -> int:
+    """Check every job's inputs side by side, and print each problem under its job.
+
+    A config a job's earlier stage writes, such as a tile's, does not exist yet and
+    is covered by checking the country config that stage starts from.
+    """
+    targets = [
+        (job.id, job.config, job.iso3) for job in jobs if job.config.exists() or job.stage == 0
+    ]
+    with event_log.span("preflight", "preflight", jobs=len(targets)) as span:
+        found = preflight.run(targets)
+        failing = {job_id: problems for job_id, problems in found.items() if problems}
+        span["failing"] = len(failing)
+        span["ok"] = not failing
+    for job_id, problems in failing.items():
+        for problem in problems:
+            print(f"preflight {job_id}: {problem}", file=sys.stderr)
+    if failing:
+        print(
+            f"sweep: preflight failed for {len(failing)}/{len(targets)} job(s), nothing ran",
+            file=sys.stderr,
+        )
+        return 4
+    print(f"sweep: preflight passed for {len(targets)} job(s)")
+    return 0
+
+
+def report(paths: list[Path]) -> int:
+    """Where the time went, from the named event logs, or the latest sweep's."""
+    if not paths:
+        logs = sorted((WORK_DIR / "events").glob("sweep-*.jsonl"), key=lambda p: p.stat().st_mtime)
+        if not logs:
+            print(f"sweep: no event logs in {WORK_DIR / 'events'}", file=sys.stderr)
+            return 2
+        paths = logs[-1:]
+    print(events.summarise(events.load(paths)), end="")
+    return 0
+
+
+def run_simulation(jobs: list[Job], args: argparse.Namespace) -> int:
+    """The simulator's report for the resolved jobs, or, with --fake, the jobs run
+    through run_jobs as fake_oex.py. Neither touches the lock, the sweep's records, or
+    the extracts, tiles and PBF stats a real unit leaves to its cleanup."""
+    try:
+        if args.cost_model:
+            cost = simulate.load_model(args.cost_model)
+        else:
+            cost = simulate.history_model(simulate.history(history_logs()))
+    except simulate.SimulateError as error:
+        print(f"sweep: {error}", file=sys.stderr)
+        return 2
+    if args.fake:
+        log = events.default_path(WORK_DIR, "simulate")
+        fake = simulate.fake_jobs(jobs, cost, FAKE_SCRIPT, args.speedup, args.memory_scale)
+        failures = run_jobs(fake, args.timeout, Progress(fake, event_log=EventLog(log, "sweep")))
+        print(events.summarise(events.load([log])), end="")
+        return 1 if failures else 0
+    concurrencies = [int(n) for n in args.concurrency.split(",")]
+    memory = int((args.memory_gb or host_memory_gb()) * 1024**3)
+    outcomes = simulate.simulate(units(jobs), cost, concurrencies, simulate.ORDERS, memory)
+    print(simulate.summarise(outcomes), end="")
+    return 0
 
 
 def main() -> int:
@@ -252,27 +1367,210 @@ def main() -> int:
     )
     parser.add_argument("--dry-run", action="store_true", help="print the commands, run nothing")
     parser.add_argument("--json", action="store_true", help="print the job list, run nothing")
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="node-exporter textfile to keep updated (default .sweep/sweep.prom)",
+    )
+    parser.add_argument(
+        "--events",
+        type=Path,
+        help="JSONL event log to write (default .sweep/events/sweep-<time>-<pid>.jsonl)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="run only shard I of N, balanced by expected cost, with its own lock and "
+        "records under .sweep/shards/IofN/",
+    )
+    parser.add_argument(
+        "--shard-costs",
+        type=Path,
+        metavar="FILE",
+        help="with --shard, the expected cost of each job, from a JSON table every runner "
+        "reads; written from this runner's records when it does not exist yet",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        type=Path,
+        help="volume for the jobs' DuckDB spill, fast and local "
+        "(default $OEX_SPILL_DIR, else data/spill under $OEX_DATA_DIR)",
+    )
+    parser.add_argument(
+        "--spill-quota-gb",
+        type=float,
+        help="most one job may spill before it is ended (default an equal share of "
+        f"{SPILL_FREE_SHARE:.0%} of the volume's free space between the jobs side by side)",
+    )
+    parser.add_argument(
+        "--order",
+        choices=("schedule", "staleness"),
+        default="schedule",
+        help="schedule runs `groups:` in order; staleness runs the most overdue first, "
+        "weighted by group (default schedule)",
+    )
+    parser.add_argument(
+        "--staleness-source",
+        choices=staleness.SOURCES,
+        default="sweep",
+        help="with --order staleness, when each dataset last succeeded: the sweep's own "
+        "records, or the later of those and HDX's dates (default sweep)",
+    )
+    parser.add_argument(
+        "--no-watchdog",
+        action="store_true",
+        help="never pause or requeue a job under memory pressure; see watchdog.py",
+    )
+    parser.add_argument(
+        "--report",
+        nargs="*",
+        type=Path,
+        metavar="LOG",
+        help="summarise event logs (default the latest sweep's) and run nothing",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="JOB_ID_GLOB",
+        help="profile the jobs whose id matches, e.g. 'heavy/USA' or 'priority/*'",
+    )
+    parser.add_argument(
+        "--profiler",
+        choices=PROFILERS,
+        default="cprofile",
+        help="cprofile is deterministic; py-spy samples, and must be installed",
+    )
+    parser.add_argument(
+        "--preflight",
+        action="store_true",
+        help="check every job's config, paths, boundary and disk, then stop",
+    )
+    parser.add_argument(
+        "--no-preflight",
+        action="store_true",
+        help="dispatch without checking first",
+    )
     parser.add_argument(
         "--no-hdx-push",
         action="store_true",
         help="rehearse against the real configs without publishing to HDX",
     )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="replay the jobs against their recorded costs, run nothing; see simulate.py",
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1,2,4",
+        help="with --simulate, units side by side to try (default 1,2,4)",
+    )
+    parser.add_argument(
+        "--memory-gb",
+        type=float,
+        help="with --simulate, the memory units share (default the host's)",
+    )
+    parser.add_argument(
+        "--cost-model",
+        metavar="MODULE:FUNCTION",
+        help="with --simulate, a function of the job returning (seconds, peak RSS bytes)",
+    )
+    parser.add_argument(
+        "--fake",
+        action="store_true",
+        help="with --simulate, run every job as fake_oex.py through the real runner",
+    )
+    parser.add_argument(
+        "--speedup",
+        type=float,
+        default=60.0,
+        help="with --fake, divide each job's recorded time by this (default 60)",
+    )
+    parser.add_argument(
+        "--memory-scale",
+        type=float,
+        default=0.01,
+        help="with --fake, multiply each job's recorded peak RSS by this (default 0.01)",
+    )
     args = parser.parse_args()
+    if args.report is not None:
+        return report(args.report)
 
+    rehearsal = args.json or args.dry_run or args.simulate
+    journal = journal_dir(args.shard)
+    event_log = EventLog(
+        None if rehearsal else args.events or events.default_path(journal, "sweep"), "sweep"
+    )
     extra = ("--no-hdx-push",) if args.no_hdx_push else ()
+    lock = None
+    if not rehearsal and not args.preflight:
+        # Before the warm-ups, which write the stores the jobs are resolved against.
+        lock = acquire_lock(journal)
+        if lock is None:
+            print("sweep: another sweep holds the lock, refusing to overlap", file=sys.stderr)
+            return 3
     schedule = yaml.safe_load(SCHEDULE_FILE.read_text(encoding="utf-8")) or {}
-    try:
-        jobs, skipped = resolve(schedule, args.group, args.frequency, date.today(), extra)
-    except ScheduleError as error:
-        print(f"sweep: {error}", file=sys.stderr)
-        return 2
+    with warmup_lock() if lock is not None else contextlib.nullcontext():
+        if lock is not None:
+            # The last runs' peaks, before the configs that the profile writes into.
+            resource_profile.record_peaks(
+                resource_profile.default_stats_file(), resource_profile.peaks(history_logs())
+            )
+            refresh_boundaries(
+                event_log, due_countries(schedule, args.group, args.frequency, date.today())
+            )
+            warm_pcodes(event_log)
+        try:
+            with event_log.span("resolve", "resolve") as span:
+                jobs, skipped = resolve(
+                    schedule, args.group, args.frequency, date.today(), extra, rehearsal
+                )
+                span["jobs"] = len(jobs)
+        except ScheduleError as error:
+            print(f"sweep: {error}", file=sys.stderr)
+            return 2
+
+    if args.profile:
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        jobs = with_profiling(jobs, args.profile, args.profiler, WORK_DIR / "profiles" / stamp)
+        if all(job.profile_dir is None for job in jobs):
+            print(f"sweep: --profile {args.profile!r} matches no job", file=sys.stderr)
+            return 2
+
+    if args.shard:
+        index, count = args.shard
+        try:
+            basis, cost = (
+                shared_cost(args.shard_costs, jobs) if args.shard_costs else expected_cost()
+            )
+        except ScheduleError as error:
+            print(f"sweep: {error}", file=sys.stderr)
+            return 2
+        plan = shard_plan(jobs, count, cost)
+        print(
+            f"sweep: shard {index}/{count} by {basis}, {len(plan[index - 1])} of {len(jobs)} "
+            f"job(s), plan {plan_digest(plan)}",
+            file=sys.stderr,
+        )
+        jobs = plan[index - 1]
+
+    ranks = {name: rank for rank, name in enumerate(schedule.get("groups") or [])}
+    if args.order == "staleness":
+        jobs = by_staleness(jobs, ranks, args.staleness_source)
 
     if args.json:
         print(json.dumps([job.as_dict() for job in jobs]))
         return 0
+    if args.simulate:
+        return run_simulation(jobs, args)
 
     for line in skipped:
         print(f"skip {line}")
+    for note in placement_notes(jobs):
+        print(f"resources: {note}")
+    for job in jobs:
+        if job.profile_dir is not None:
+            print(f"profile {job.id} -> {job.profile_dir}")
     print(f"sweep: {len(jobs)} job(s)")
 
     if args.dry_run:
@@ -281,13 +1579,44 @@ def main() -> int:
         return 0
     if not jobs:
         return 0
+    if args.preflight:
+        return run_preflight(jobs, event_log)
 
-    lock = acquire_lock()
-    if lock is None:
-        print("sweep: another sweep holds the lock, refusing to overlap", file=sys.stderr)
-        return 3
+    if not args.no_preflight and run_preflight(jobs, event_log):
+        return 4
 
-    failures = run_jobs(jobs, args.timeout)
+    with warmup_lock():
+        jobs = warm_overture(jobs, event_log)
+        warm_planet(jobs, event_log)
+    progress = Progress(
+        jobs, args.metrics or journal / "sweep.prom", journal / "last_success.json", event_log
+    )
+    watchdog = None
+    if not args.no_watchdog:
+        if pressure() is None:
+            print("sweep: no memory pressure (PSI) on this kernel, watchdog off", file=sys.stderr)
+        else:
+            watchdog = Watchdog(WORK_DIR / "running", ranks, event_log)
+    supervisor = Supervisor(watchdog)
+    supervisor.install()
+    spill_dir = args.spill_dir or default_spill_dir()
+    for path in clear_stale_spills(spill_dir):
+        print(f"sweep: removed {path}, left by a sweep no longer running", file=sys.stderr)
+    quota = int(args.spill_quota_gb * 1024**3) if args.spill_quota_gb else None
+    with event_log.span("sweep", "sweep", only_group=args.group, frequency=args.frequency):
+        try:
+            failures = run_jobs(
+                jobs, args.timeout, progress, supervisor, spill_root(spill_dir), quota
+            )
+        finally:
+            shutil.rmtree(spill_root(spill_dir), ignore_errors=True)
+    if supervisor.draining:
+        print(
+            f"sweep: {'stopped' if supervisor.stopping else 'drained'}, {supervisor.left} of "
+            f"{len(jobs)} job(s) not started, {len(failures)} failed",
+            file=sys.stderr,
+        )
+        return 5
     if failures:
         print(f"sweep: {len(failures)}/{len(jobs)} failed: {', '.join(failures)}", file=sys.stderr)
         return 1
@@ -7,17 +7,28 @@ re-exporting anything.
 
     sync_hdx_frequency.py --group heavy              # report the drift, change nothing
     sync_hdx_frequency.py --group heavy --apply      # write the new frequency
-    sync_hdx_frequency.py                            # every country group
+    sync_hdx_frequency.py --apply                    # every country the schedule changed
+    sync_hdx_frequency.py --full                     # every country, changed or not
+
+.sweep/hdx_frequency.json keeps the frequency each country's datasets were last
+found or set to. Only the countries whose frequency in the schedule differs from it,
+or that it does not have, are checked, so the sync after a schedule change reads the
+datasets of a handful of countries rather than all of them. --full checks every
+country, for drift made on HDX itself. A country is recorded once all its datasets
+state its frequency, or are not published; one left drifted or failed is checked
+again next time.
 
 Exit codes: 1 a dataset failed to update, 2 the schedule is malformed.
 """
 
 import argparse
+import json
 import os
 import sys
 from pathlib import Path
 
 import yaml
+from events import EventLog, default_path
 from hdx.api.configuration import Configuration
 from hdx.data.dataset import Dataset
 
@@ -25,6 +36,8 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 SCHEDULE_FILE = REPO_ROOT / "scripts" / "schedule.yaml"
 BASE_CONFIG = REPO_ROOT / "configs" / "base.yaml"
 COUNTRY_CONFIG_DIR = REPO_ROOT / "configs" / "countries"
+WORK_DIR = REPO_ROOT / ".sweep"
+SNAPSHOT_FILE = WORK_DIR / "hdx_frequency.json"
 
 
 def categories(schema_path: Path) -> list[str]:
@@ -64,50 +77,99 @@ def scheduled_countries(schedule: dict, group_filter: str | None) -> list[tuple[
     return pairs
 
 
+def load_snapshot(path: Path) -> dict[str, str]:
+    """The frequency each country was last aligned to. Missing or unreadable means none."""
+    try:
+        return {str(k): str(v) for k, v in json.loads(path.read_text(encoding="utf-8")).items()}
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return {}
+
+
+def save_snapshot(path: Path, snapshot: dict[str, str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    partial.write_text(json.dumps(snapshot, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(partial, path)
+
+
+def changed(pairs: list[tuple[str, str]], snapshot: dict[str, str]) -> list[tuple[str, str]]:
+    """The pairs whose frequency is not the one the snapshot holds for the country."""
+    return [(iso3, frequency) for iso3, frequency in pairs if snapshot.get(iso3) != frequency]
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("--group", help="one group from `groups:` in the schedule")
     parser.add_argument("--apply", action="store_true", help="write changes (default: report only)")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="check every country, not only those whose frequency changed since the last sync",
+    )
+    parser.add_argument(
+        "--events",
+        type=Path,
+        help="JSONL event log to write (default .sweep/events/sync_hdx_frequency-<time>.jsonl)",
+    )
     args = parser.parse_args()
+    event_log = EventLog(
+        args.events or default_path(WORK_DIR, "sync_hdx_frequency"), "sync_hdx_frequency"
+    )
 
     schedule = yaml.safe_load(SCHEDULE_FILE.read_text(encoding="utf-8")) or {}
     base = yaml.safe_load(BASE_CONFIG.read_text(encoding="utf-8")) or {}
     cats = categories(REPO_ROOT / base["categories_file"])
-    pairs = scheduled_countries(schedule, args.group)
+    scheduled = scheduled_countries(schedule, args.group)
+    snapshot = load_snapshot(SNAPSHOT_FILE)
+    pairs = scheduled if args.full else changed(scheduled, snapshot)
+    if not args.full:
+        print(f"{len(pairs)} of {len(scheduled)} country(ies) changed since the last sync")
+    if not pairs:
+        return 0
     print(f"{len(pairs)} country(ies) x {len(cats)} categories = {len(pairs) * len(cats)} datasets")
 
     api_key = os.environ.get("HDX_API_KEY")
     if not api_key:
         raise SystemExit("HDX_API_KEY is not set; source .env first")
-    Configuration.create(
-        hdx_site=base["hdx"]["site"],
-        user_agent=base["hdx"]["user_agent"],
-        hdx_key=api_key,
-    )
+    with event_log.span(base["hdx"]["site"], "hdx_connect"):
+        Configuration.create(
+            hdx_site=base["hdx"]["site"],
+            user_agent=base["hdx"]["user_agent"],
+            hdx_key=api_key,
+        )
 
     drift, missing, failed = [], 0, []
+    aligned = {}
     for iso3, frequency in pairs:
+        before = (len(drift), len(failed))
         wanted = Dataset.transform_update_frequency(frequency)
         if wanted is None:
             raise SystemExit(f"{iso3}: {frequency!r} is not a frequency HDX understands")
         key = dataset_key(iso3, base)
-        for slug in cats:
-            name = f"{key}_{iso3.lower()}_{slug}"
-            dataset = Dataset.read_from_hdx(name)
-            if dataset is None:
-                missing += 1
-                continue
-            current = str(dataset.get("data_update_frequency", ""))
-            if current == wanted:
-                continue
-            drift.append((name, current, wanted))
-            if not args.apply:
-                continue
-            try:
-                dataset.set_expected_update_frequency(frequency)
-                dataset.update_in_hdx(update_resources=False, hxl_update=False)
-            except Exception as error:  # noqa: BLE001 - report and continue the sweep
-                failed.append(f"{name}: {error}")
+        with event_log.span(iso3, "country", frequency=frequency):
+            for slug in cats:
+                name = f"{key}_{iso3.lower()}_{slug}"
+                with event_log.span(name, "hdx_read", group=iso3):
+                    dataset = Dataset.read_from_hdx(name)
+                if dataset is None:
+                    missing += 1
+                    continue
+                current = str(dataset.get("data_update_frequency", ""))
+                if current == wanted:
+                    continue
+                drift.append((name, current, wanted))
+                if not args.apply:
+                    continue
+                try:
+                    with event_log.span(name, "hdx_update", group=iso3):
+                        dataset.set_expected_update_frequency(frequency)
+                        dataset.update_in_hdx(update_resources=False, hxl_update=False)
+                except Exception as error:  # noqa: BLE001 - report and continue the sweep
+                    failed.append(f"{name}: {error}")
+        if len(failed) == before[1] and (args.apply or len(drift) == before[0]):
+            aligned[iso3] = frequency
+    if aligned:
+        save_snapshot(SNAPSHOT_FILE, {**load_snapshot(SNAPSHOT_FILE), **aligned})
 
     label = Dataset.update_frequencies
     for name, current, wanted in drift:
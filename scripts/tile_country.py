@@ -0,0 +1,463 @@
+#!/usr/bin/env -S uv run python
+"""Cut a country too large for one export into tiles, and merge the tiles back.
+
+    tile_country.py plan --config .sweep/merged/USA.yaml --iso3 USA --tiles 8
+    tile_country.py merge --config .sweep/merged/USA.yaml --iso3 USA --tiles 8
+
+sweep.py runs these around a country with `tiles: N` in the schedule. `plan` splits
+the boundary into N tiles holding about as many OSM nodes each, cuts every tile
+out of the country PBF in one osmium pass, and writes one config per tile. Each
+tile is then an ordinary `oex-cli osm` export to GeoParquet, pcodes included, sized
+to the tile, not the country. `merge` joins each category's tiles into one file,
+keeping a feature that straddles a cut only in the first tile that exported it, by
+its OSM id, and writes the config with which `oex-cli file` publishes them as the single
+per-category dataset HDX expects.
+"""
+
+import argparse
+import json
+import math
+import re
+import subprocess
+import sys
+from datetime import UTC, datetime
+from pathlib import Path
+
+import shapely
+import yaml
+from host import host_memory_gb
+from omegaconf import OmegaConf
+from shapely.geometry import box, mapping, shape
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+# Cells along the longer side of the country's bounding box. Tiles are cut on cell
+# edges, so this bounds how evenly the nodes can be shared out.
+GRID_CELLS = 64
+# Columns a category's select gives a name to: `expr AS name`, or a bare column.
+ALIAS = re.compile(r"(?:\bAS\s+(\w+)|^(\w+))\s*$", re.IGNORECASE)
+# Columns oex's pcodes tagging adds to each tile's layers.
+PCODE_COLUMN = re.compile(r"^adm\d+_(?:pcode|name)$")
+# Each tile's layers carry the OSM id under this name, for merge to tell copies by.
+TILE_ID = "tile_feature_id"
+
+
+class TileError(Exception):
+    """The country cannot be tiled as asked."""
+
+
+def tile_config(config: Path, number: int, tiles: int) -> Path:
+    return config.with_name(f"{config.stem}.tile{number}of{tiles}.yaml")
+
+
+def publish_config(config: Path) -> Path:
+    return config.with_name(f"{config.stem}.tiled.yaml")
+
+
+def work_dir(cache_dir: Path, iso3: str) -> Path:
+    """Tile PBFs, tile outputs and the merged layers, all removed after the sweep."""
+    return cache_dir / "tiles" / iso3.lower()
+
+
+def balanced_tiles(
+    weights: dict[tuple[int, int], float], nx: int, ny: int, tiles: int
+) -> list[tuple[int, int, int, int]]:
+    """Split an nx by ny grid into `tiles` rectangles of about equal weight.
+
+    Recursive bisection: each rectangle is cut, across whichever axis does it better,
+    where the weight on either side is closest to its share of the tiles still to
+    place. Each side keeps at least as many cells with weight as tiles it must hold,
+    so every tile touches the country. Rectangles are (i0, j0, i1, j1) in cells,
+    upper bounds exclusive.
+    """
+
+    def split(rect: tuple[int, int, int, int], count: int) -> list[tuple[int, int, int, int]]:
+        if count == 1:
+            return [rect]
+        i0, j0, i1, j1 = rect
+        left = count // 2
+        best, best_gap = None, math.inf
+        # The longer axis first, so it wins a tie and tiles stay compact.
+        for axis in (0, 1) if i1 - i0 >= j1 - j0 else (1, 0):
+            lo, hi = (i0, i1) if axis == 0 else (j0, j1)
+            line = [0.0] * (hi - lo)
+            cells = [0] * (hi - lo)
+            for (i, j), weight in weights.items():
+                if i0 <= i < i1 and j0 <= j < j1 and weight > 0:
+                    line[(i if axis == 0 else j) - lo] += weight
+                    cells[(i if axis == 0 else j) - lo] += 1
+            total, occupied = sum(line), sum(cells)
+            running, held = 0.0, 0
+            for cut in range(1, hi - lo):
+                running += line[cut - 1]
+                held += cells[cut - 1]
+                if held < left or occupied - held < count - left:
+                    continue
+                gap = abs(running - total * left / count)
+                if gap < best_gap:
+                    best, best_gap = (axis, lo + cut), gap
+        if best is None:
+            raise TileError(f"cannot cut {rect} into {count} tiles that each hold data")
+        axis, at = best
+        if axis == 0:
+            first, second = (i0, j0, at, j1), (at, j0, i1, j1)
+        else:
+            first, second = (i0, j0, i1, at), (i0, at, i1, j1)
+        return split(first, left) + split(second, count - left)
+
+    if tiles < 1:
+        raise TileError(f"tiles must be at least 1, got {tiles}")
+    return split((0, 0, nx, ny), tiles)
+
+
+def grid(bounds: tuple[float, float, float, float]) -> tuple[float, int, int]:
+    """Square cells over the bounding box: (cell size in degrees, nx, ny)."""
+    minx, miny, maxx, maxy = bounds
+    cell = max(maxx - minx, maxy - miny) / GRID_CELLS or 1.0
+    return cell, max(1, math.ceil((maxx - minx) / cell)), max(1, math.ceil((maxy - miny) / cell))
+
+
+def node_density(
+    pbf: Path, bounds: tuple[float, float, float, float], cell: float
+) -> dict[tuple[int, int], int]:
+    """Nodes per grid cell, streamed out of the PBF by DuckDB in one aggregate."""
+    import duckdb
+
+    minx, miny, _, _ = bounds
+    conn = duckdb.connect()
+    conn.execute("INSTALL spatial; LOAD spatial;")
+    rows = conn.execute(
+        f"""
+        SELECT floor((lon - {minx}) / {cell})::INTEGER AS i,
+               floor((lat - {miny}) / {cell})::INTEGER AS j,
+               count(*)
+        FROM ST_ReadOSM('{str(pbf).replace("'", "''")}')
+        WHERE kind = 'node' AND lon IS NOT NULL
+        GROUP BY ALL
+        """
+    ).fetchall()
+    conn.close()
+    return {(int(i), int(j)): int(count) for i, j, count in rows}
+
+
+def plan_tiles(boundary, density: dict[tuple[int, int], int], tiles: int) -> list[dict]:
+    """Tile polygons, each the country's boundary within one balanced rectangle.
+
+    A cell inside the boundary counts one more than its nodes, so empty land still
+    falls to some tile; cells outside it count nothing, whatever the PBF's margin holds.
+    """
+    bounds = boundary.bounds
+    cell, nx, ny = grid(bounds)
+    minx, miny, _, _ = bounds
+    cells = [(i, j) for i in range(nx) for j in range(ny)]
+    boxes = [
+        box(minx + i * cell, miny + j * cell, minx + (i + 1) * cell, miny + (j + 1) * cell)
+        for i, j in cells
+    ]
+    inside = shapely.intersects(boundary, boxes)
+    weights = {key: density.get(key, 0) + 1 for key, hit in zip(cells, inside, strict=True) if hit}
+    planned = []
+    for i0, j0, i1, j1 in balanced_tiles(weights, nx, ny, tiles):
+        rect = box(minx + i0 * cell, miny + j0 * cell, minx + i1 * cell, miny + j1 * cell)
+        piece = shapely.make_valid(boundary.intersection(rect))
+        nodes = sum(w - 1 for (i, j), w in weights.items() if i0 <= i < i1 and j0 <= j < j1)
+        planned.append({"geometry": mapping(piece), "bounds": rect.bounds, "nodes": nodes})
+    return planned
+
+
+def country_pbf(cfg, iso3: str) -> tuple[Path, bool]:
+    """The country's source PBF, and whether it was fetched for this plan and so is
+    the plan's to remove. geofabrik downloads to where oex's own engine would."""
+    src = cfg.source["osm"]
+    if src.engine == "planet":
+        return Path(src.pbf_path), False
+    if src.engine != "geofabrik":
+        raise TileError(f"tiling needs a PBF; engine {src.engine!r} has none")
+    from oex.osm.fetch_planet import download_pbf
+    from oex.osm.geofabrik import lookup_country
+
+    extract = lookup_country(iso3, index_url=src.geofabrik_index_url)
+    pbf_dir = Path(src.cache_dir) / "geofabrik" / iso3.lower() / "_pbf"
+    target = pbf_dir / f"{extract.geofabrik_id}-latest.osm.pbf"
+    if target.is_file():
+        return target, False
+    print(f"plan: downloading {extract.pbf_url}", flush=True)
+    result = download_pbf(extract.pbf_url, pbf_dir, md5_url=extract.md5_url, filename=target.name)
+    return result.path, not src.keep_pbf
+
+
+def cut_tiles(source: Path, planned: list[dict], work: Path) -> list[Path]:
+    """Every tile out of the source PBF in one osmium pass.
+
+    `smart` completes the multipolygons that cross a cut, which `complete_ways` would
+    leave broken in both tiles; merge() drops the copy that results.
+    """
+    extracts, outputs = [], []
+    for number, tile in enumerate(planned, start=1):
+        polygon = work / f"tile{number}.geojson"
+        polygon.write_text(json.dumps(tile["geometry"]), encoding="utf-8")
+        output = work / f"tile{number}.osm.pbf"
+        extracts.append(
+            {
+                "output": output.name,
+                "polygon": {"file_name": str(polygon), "file_type": "geojson"},
+            }
+        )
+        outputs.append(output)
+    config = work / "_osmium-extracts.json"
+    config.write_text(
+        json.dumps({"directory": str(work), "extracts": extracts}, indent=2), encoding="utf-8"
+    )
+    command = ["osmium", "extract", "--config", str(config), "--strategy", "smart"]
+    print(f"plan: one osmium pass over {source} for {len(planned)} tile(s)", flush=True)
+    completed = subprocess.run([*command, "--overwrite", str(source)], check=False)
+    if completed.returncode != 0:
+        raise TileError(f"osmium extract failed with rc={completed.returncode}")
+    return outputs
+
+
+def config_categories(raw: dict) -> list[dict]:
+    """The categories a config exports: inline, or from its categories_file."""
+    if raw.get("categories"):
+        return list(raw["categories"])
+    schema = yaml.safe_load((REPO_ROOT / raw["categories_file"]).read_text(encoding="utf-8"))
+    return list(schema["categories"])
+
+
+def write_config(raw: dict, target: Path) -> None:
+    target.write_text(OmegaConf.to_yaml(OmegaConf.create(raw), resolve=False), encoding="utf-8")
+
+
+def tile_configs(
+    raw: dict, config: Path, work: Path, pbfs: list[Path], memory_gb: float
+) -> list[Path]:
+    """One config per tile: the country's categories, read from the tile's PBF and
+    written to GeoParquet alone, with nothing published. pcodes are tagged here, tile
+    by tile, so the publish stage never tags the whole country at once. Each category
+    also selects the feature's OSM id as TILE_ID."""
+    categories = [
+        {
+            **category,
+            "osm": {
+                **(category.get("osm") or {}),
+                "select": [
+                    *((category.get("osm") or {}).get("select") or []),
+                    f"feature_id AS {TILE_ID}",
+                ],
+            },
+        }
+        for category in config_categories(raw)
+    ]
+    written = []
+    for number, pbf in enumerate(pbfs, start=1):
+        tile = {
+            **raw,
+            "categories": categories,
+            "boundary": {"geom": (work / f"tile{number}.geojson").read_text(encoding="utf-8")},
+            "parallel": {**(raw.get("parallel") or {}), "memory_gb": max(1, int(memory_gb))},
+            "output": {
+                "dir": str(work / "out" / f"tile{number}"),
+                "formats": ["geoparquet"],
+                "metadata": False,
+                "resume": False,
+                "report": {"enabled": False},
+                "s3": {"enabled": False},
+            },
+            "hdx": {"push": False},
+        }
+        tile.pop("categories_file", None)
+        tile["source"] = {
+            **raw["source"],
+            "osm": {
+                **raw["source"]["osm"],
+                "enabled": True,
+                "engine": "planet",
+                "pbf_path": str(pbf),
+                "cache_dir": str(work / "cache" / f"tile{number}"),
+                "planet_clip_to_boundary": False,
+                "auto_download_planet": False,
+                "planet_fallback": False,
+            },
+            "overture": {"enabled": False},
+        }
+        target = tile_config(config, number, len(pbfs))
+        write_config(tile, target)
+        written.append(target)
+    return written
+
+
+def plan(config: Path, iso3: str, tiles: int) -> int:
+    from oex.boundary import resolve_boundary
+    from oex.config.loader import load_config
+
+    cfg = load_config(config)
+    raw = OmegaConf.to_container(OmegaConf.load(config), resolve=False)
+    boundary = shape(json.loads(resolve_boundary(iso3, cfg.boundary).geojson))
+    work = work_dir(Path(cfg.source["osm"].cache_dir), iso3)
+    work.mkdir(parents=True, exist_ok=True)
+
+    source, fetched = country_pbf(cfg, iso3)
+    snapshot = datetime.fromtimestamp(source.stat().st_mtime, tz=UTC).date().isoformat()
+    cell, _, _ = grid(boundary.bounds)
+    planned = plan_tiles(boundary, node_density(source, boundary.bounds, cell), tiles)
+    for number, tile in enumerate(planned, start=1):
+        print(f"plan: tile {number}/{tiles} {tile['nodes']:,} node(s)", flush=True)
+    pbfs = cut_tiles(source, planned, work)
+    if fetched:
+        source.unlink(missing_ok=True)
+
+    memory_gb = cfg.parallel.memory_gb or host_memory_gb()
+    tile_configs(raw, config, work, pbfs, memory_gb / tiles)
+    (work / "plan.json").write_text(
+        json.dumps({"snapshot": snapshot, "tiles": planned}, indent=2), encoding="utf-8"
+    )
+    return 0
+
+
+def column_names(select: list[str]) -> list[str]:
+    names = []
+    for expression in select:
+        match = ALIAS.search(expression.strip())
+        if match:
+            names.append(match.group(1) or match.group(2))
+    return names
+
+
+def _quote(path: Path) -> str:
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+def tile_select(parts: list[Path], types: dict[str, str], earlier: list[Path]) -> str:
+    """The features of one tile's layer that no earlier tile kept.
+
+    Features are whole, not clipped at the cut, and each tile exported every feature
+    its extract holds, so a feature straddling a cut is in every tile that has it.
+    The first of those keeps it, and a later one drops a feature whose OSM id is in
+    an earlier tile's layer, reading only that column of the earlier tiles.
+    """
+    source = f"read_parquet([{', '.join(_quote(p) for p in parts)}], union_by_name = true)"
+    # Read as GEOMETRY when DuckDB recognises the GeoParquet metadata, as WKB otherwise.
+    geometry = "geometry" if types.get("geometry") == "GEOMETRY" else "ST_GeomFromWKB(geometry)"
+    selected = ", ".join(f'"{c}"' for c in types if c not in ("geometry", "bbox", TILE_ID))
+    query = f"SELECT {selected}, {geometry} AS geom FROM {source} AS tile"
+    if earlier:
+        kept = f"read_parquet([{', '.join(_quote(p) for p in earlier)}], union_by_name = true)"
+        query += (
+            f" WHERE NOT EXISTS (SELECT 1 FROM {kept} AS kept"
+            f' WHERE kept."{TILE_ID}" = tile."{TILE_ID}")'
+        )
+    return query
+
+
+def merge_layer(
+    parts: dict[int, list[Path]], target: Path, memory_gb: float
+) -> tuple[int, list[str]]:
+    """One category's tiles as one FlatGeobuf, and the columns it holds.
+
+    Each tile is filtered by tile_select() and written straight through, and the
+    FlatGeobuf goes without a spatial index, which GDAL would build in memory over
+    every feature. Peak memory follows the tiles' ids, not the country's features.
+    """
+    import duckdb
+
+    conn = duckdb.connect()
+    conn.execute("INSTALL spatial; LOAD spatial;")
+    conn.execute(f"SET memory_limit='{max(1, int(memory_gb))}GB'")
+    selects, columns, earlier = [], [], []
+    for number, paths in sorted(parts.items()):
+        described = conn.execute(
+            "DESCRIBE SELECT * FROM read_parquet("
+            f"[{', '.join(_quote(p) for p in paths)}], union_by_name = true)"
+        ).fetchall()
+        types = {row[0]: row[1] for row in described}
+        if TILE_ID not in types:
+            raise TileError(f"tile {number}: {paths[0].name} has no {TILE_ID} column")
+        selects.append(tile_select(paths, types, earlier))
+        columns += [c for c in types if c not in ("geometry", "bbox", TILE_ID) and c not in columns]
+        earlier = [*earlier, *paths]
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.unlink(missing_ok=True)
+    conn.execute(f"""
+        COPY ({" UNION ALL BY NAME ".join(selects)})
+        TO {_quote(target)} WITH (
+            FORMAT GDAL, DRIVER 'FlatGeobuf', SRS 'EPSG:4326',
+            LAYER_CREATION_OPTIONS 'SPATIAL_INDEX=NO'
+        )
+    """)
+    count = conn.execute(f"SELECT count(*) FROM ST_Read({_quote(target)})").fetchone()[0]
+    conn.close()
+    return int(count), columns
+
+
+def merge(config: Path, iso3: str, tiles: int) -> int:
+    from oex.config.loader import load_config
+    from oex.naming import slugify
+
+    cfg = load_config(config)
+    raw = OmegaConf.to_container(OmegaConf.load(config), resolve=False)
+    work = work_dir(Path(cfg.source["osm"].cache_dir), iso3)
+    planned = json.loads((work / "plan.json").read_text(encoding="utf-8"))
+    snapshot = planned["snapshot"]
+    memory_gb = cfg.parallel.memory_gb or host_memory_gb()
+
+    merged = []
+    for category in config_categories(raw):
+        slug = slugify(category["name"])
+        parts = {
+            number: found
+            for number in range(1, tiles + 1)
+            if (found := sorted((work / "out" / f"tile{number}").rglob(f"_layers/{slug}.parquet")))
+        }
+        osm = category.get("osm") or {}
+        if not parts or not osm.get("enabled", True):
+            print(f"merge: {category['name']}: no tile exported it, not published", flush=True)
+            continue
+        target = work / "merged" / f"{slug}.fgb"
+        count, columns = merge_layer(parts, target, memory_gb)
+        print(f"merge: {category['name']}: {len(parts)} tile(s), {count:,} feature(s)", flush=True)
+        names = column_names(osm.get("select") or [])
+        names += [c for c in columns if PCODE_COLUMN.match(c) and c not in names]
+        merged.append(
+            {
+                **category,
+                "osm": {**osm, "enabled": False},
+                "file": {
+                    "enabled": True,
+                    "path": str(target),
+                    "select": {name: name for name in names},
+                },
+            }
+        )
+    if not merged:
+        raise TileError(f"{iso3}: no tile exported any category")
+
+    publish = {**raw, "categories": merged}
+    publish.pop("categories_file", None)
+    publish["source"] = {
+        **raw["source"],
+        "osm": {**raw["source"]["osm"], "enabled": False},
+        "overture": {"enabled": False},
+        "file": {"enabled": True, "crs": "EPSG:4326", "snapshot": snapshot},
+        # The tiles tagged them already.
+        "pcodes": {**(raw["source"].get("pcodes") or {}), "enabled": False},
+    }
+    write_config(publish, publish_config(config))
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("step", choices=("plan", "merge"))
+    parser.add_argument("--config", type=Path, required=True)
+    parser.add_argument("--iso3", required=True)
+    parser.add_argument("--tiles", type=int, required=True)
+    args = parser.parse_args()
+    step = plan if args.step == "plan" else merge
+    try:
+        return step(args.config, args.iso3, args.tiles)
+    except TileError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
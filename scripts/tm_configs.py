@@ -5,6 +5,7 @@
     tm_configs.py --interval 6          a shorter window
     tm_configs.py --sandbox             sandbox projects, into their own group dir
     tm_configs.py --dry-run             report what would change, write nothing
+    tm_configs.py --simplify 20         simplify each project polygon within 20 m
 
 Projects have no country code, so each config identifies by project id through
 output.s3.folder and extracts from the planet PBF clipped to the project polygon.
@@ -12,26 +13,57 @@ Configs for projects that are no longer active are removed.
 """
 
 import argparse
+import codecs
+import contextlib
+import hashlib
 import json
-import re
+import math
 import os
+import re
+import signal
 import subprocess
 import sys
+import tempfile
+import time
 import urllib.error
 import urllib.request
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pbf_store
+import shapely
+from events import EventLog, default_path
+from host import host_memory_gb
+from metrics import Metrics, load_timestamps, save_timestamps
 from omegaconf import OmegaConf
+from pbf import blob_header
+from shapely.geometry import mapping, shape
 from upath import UPath
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 TEMPLATE = REPO_ROOT / "configs" / "_tm-template.yaml"
+BATCH_SCRIPT = REPO_ROOT / "scripts" / "tm_export_batch.py"
 TM_API_BASE_URL = "https://tasking-manager-production-api.hotosm.org/api/v2"
 MAX_INTERVAL_HOURS = 24
 PBF_ENV = "TM_PBF"
 # TM mapping_types are 1-based indexes into this order.
 MAPPING_TYPES = ("Roads", "Buildings", "Waterways", "Landuse")
 DATE_PREFIX = re.compile(r"\d{4}-\d{2}-\d{2}")
+WORK_DIR = REPO_ROOT / ".sweep"
+# Metres per degree of latitude; --simplify takes metres, the polygons are in degrees.
+METRES_PER_DEGREE = 111_320
+# Extracts per osmium pass, and the memory one extract's id sets take during it.
+# Placeholders until scripts/bench_extract.py has been run on the production host;
+# set them from its recommendation, and rerun it on new hardware.
+EXTRACT_BATCH = 50
+EXTRACT_MB = 300
+# How long one project of a --batch export may run before its process is killed.
+PROJECT_TIMEOUT_SECONDS = 60 * 60
+BATCH_POLL_SECONDS = 5
+# The active-projects response is parsed as it arrives, this much at a time.
+READ_SIZE = 64 * 1024
+FEATURES_KEY = re.compile(r'"features"\s*:\s*\[')
 
 
 class TaskingManagerError(Exception):
@@ -43,8 +75,105 @@ def _display(path: Path) -> str:
     return os.path.relpath(path, REPO_ROOT)
 
 
-def fetch_active_projects(interval: int, sandbox: bool, timeout: int) -> list[dict]:
-    """Active projects as GeoJSON features. The endpoint caps interval at 24 hours."""
+def tm_metrics(path: Path | None) -> Metrics:
+    """The textfile this run keeps updated; one per scope, so production and sandbox
+    runs never overwrite each other."""
+    metrics = Metrics(path)
+    metrics.declare("oex_tm_projects", "gauge", "Projects in this run by state.")
+    metrics.declare("oex_tm_download_bytes_total", "counter", "Source PBF bytes downloaded.")
+    metrics.declare(
+        "oex_tm_osmium_extract_seconds",
+        "gauge",
+        "Wall time of the latest osmium extract, every pass.",
+    )
+    metrics.declare(
+        "oex_tm_prefilter_seconds", "gauge", "Wall time of the latest osmium tags-filter pass."
+    )
+    metrics.declare("oex_tm_exports_total", "counter", "Project exports by outcome.")
+    metrics.declare("oex_tm_export_duration_seconds", "gauge", "Wall time of a project's export.")
+    metrics.declare(
+        "oex_tm_export_peak_rss_bytes", "gauge", "Peak RSS of a project export's largest process."
+    )
+    metrics.declare(
+        "oex_tm_last_success_timestamp_seconds", "gauge", "When a project last exported cleanly."
+    )
+    metrics.declare("oex_tm_updated_timestamp_seconds", "gauge", "When this file was written.")
+    metrics.set("oex_tm_download_bytes_total", 0)
+    for outcome in ("succeeded", "failed"):
+        metrics.set("oex_tm_exports_total", 0, outcome=outcome)
+    return metrics
+
+
+def write_metrics(metrics: Metrics) -> None:
+    metrics.set("oex_tm_updated_timestamp_seconds", time.time())
+    metrics.write()
+
+
+def iter_features(stream) -> Iterator[dict]:
+    """The features of a GeoJSON FeatureCollection, one at a time as the bytes arrive.
+
+    Only the feature being parsed is held, never the whole payload. A feature that
+    does not parse yet is retried with at least as many bytes again as are buffered,
+    so a large polygon costs a few parses rather than one per read.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer, done = "", False
+
+    def more() -> None:
+        nonlocal buffer, done
+        chunk = stream.read(max(READ_SIZE, len(buffer)))
+        done = not chunk
+        buffer += text.decode(chunk, final=done)
+
+    while not (match := FEATURES_KEY.search(buffer)):
+        if done:
+            raise TaskingManagerError("no `features` in the response")
+        # Enough of the tail that a key split across two reads is still found.
+        buffer = buffer[-16:]
+        more()
+    buffer = buffer[match.end() :]
+    while True:
+        stripped = buffer.lstrip(" \t\r\n,")
+        if stripped.startswith("]"):
+            return
+        if stripped:
+            try:
+                feature, end = decoder.raw_decode(stripped)
+            except json.JSONDecodeError as error:
+                if done:
+                    raise TaskingManagerError(f"truncated or invalid response: {error}") from error
+            else:
+                buffer = stripped[end:]
+                yield feature
+                continue
+        if done:
+            raise TaskingManagerError("the response ended inside `features`")
+        buffer = stripped
+        more()
+
+
+def spool_feature(feature: dict, aoi_dir: Path) -> dict:
+    """Write a project's polygon to `<aoi_dir>/<id>.geojson`, and return the feature
+    pointing at that file in place of its geometry. Every later stage reads the file,
+    so a run holds one polygon at a time however many projects it has."""
+    project_id = str(feature["properties"]["project_id"])
+    aoi_dir.mkdir(parents=True, exist_ok=True)
+    path = aoi_dir / f"{project_id}.geojson"
+    path.write_text(json.dumps(feature["geometry"]), encoding="utf-8")
+    return {"geometry_path": path, "properties": feature["properties"]}
+
+
+def geometry_of(feature: dict) -> dict:
+    """A feature's polygon, whether it is inline or spooled to disk."""
+    if "geometry" in feature:
+        return feature["geometry"]
+    return json.loads(feature["geometry_path"].read_text(encoding="utf-8"))
+
+
+def fetch_active_projects(interval: int, sandbox: bool, timeout: int, aoi_dir: Path) -> list[dict]:
+    """Active projects, each spooled to aoi_dir as it is parsed. The endpoint caps
+    interval at 24 hours."""
     if not 1 <= interval <= MAX_INTERVAL_HOURS:
         raise TaskingManagerError(f"--interval must be 1..{MAX_INTERVAL_HOURS}, got {interval}")
     url = f"{TM_API_BASE_URL}/projects/queries/active/?interval={interval}"
@@ -53,16 +182,16 @@ def fetch_active_projects(interval: int, sandbox: bool, timeout: int) -> list[di
     request = urllib.request.Request(url, headers={"accept": "application/json"})
     try:
         with urllib.request.urlopen(request, timeout=timeout) as response:
-            payload = json.load(response)
-    except (urllib.error.URLError, json.JSONDecodeError) as error:
+            return [spool_feature(feature, aoi_dir) for feature in iter_features(response)]
+    except OSError as error:
+        # URLError, and a connection that drops or times out part way through.
+        raise TaskingManagerError(f"{url}: {error}") from error
+    except TaskingManagerError as error:
         raise TaskingManagerError(f"{url}: {error}") from error
-    if "features" not in payload:
-        raise TaskingManagerError(f"{url}: no `features` in the response: {payload}")
-    return payload["features"]
 
 
-def fetch_project(project_id: str, timeout: int) -> dict:
-    """One project as a GeoJSON feature, whatever its recent activity."""
+def fetch_project(project_id: str, timeout: int, aoi_dir: Path) -> dict:
+    """One project, spooled to aoi_dir, whatever its recent activity."""
     url = f"{TM_API_BASE_URL}/projects/{project_id}/"
     request = urllib.request.Request(url, headers={"accept": "application/json"})
     try:
@@ -72,13 +201,14 @@ def fetch_project(project_id: str, timeout: int) -> dict:
         raise TaskingManagerError(f"{url}: {error}") from error
     if "areaOfInterest" not in payload:
         raise TaskingManagerError(f"{url}: no `areaOfInterest` in the response")
-    return {
+    feature = {
         "geometry": payload["areaOfInterest"],
         "properties": {
             "project_id": payload["projectId"],
             "mapping_types": payload.get("mappingTypes"),
         },
     }
+    return spool_feature(feature, aoi_dir)
 
 
 def category_names(mapping_types: list) -> list[str]:
@@ -121,7 +251,7 @@ def build_config(
     if not cfg.categories:
         return None
     cfg.dataset_name = f"Tasking Manager Project {project_id}"
-    cfg.boundary.geom = json.dumps(feature["geometry"])
+    cfg.boundary.geom = json.dumps(geometry_of(feature))
     cfg.output.s3.folder = f"hotosm_project_{project_id}"
     if pbf_path is not None:
         cfg.source.osm.pbf_path = str(pbf_path)
@@ -130,7 +260,66 @@ def build_config(
     return cfg
 
 
-def write_osmium_config(features: list[dict], pbf_dir: Path) -> tuple[Path, dict[str, Path]]:
+def vertex_count(geometry: dict) -> int:
+    return int(shapely.get_num_coordinates(shape(geometry)))
+
+
+def prepare_geometry(geometry: dict, tolerance_m: float, precision: int | None) -> dict:
+    """Repair, simplify and round a project polygon without ever shrinking it.
+
+    Hand-drawn TM polygons carry thousands of vertices at 15 digits, which osmium's
+    point-in-polygon test and the DuckDB clip pay for on every feature. The polygon is
+    first grown by the tolerance plus the rounding step, so neither the simplification
+    nor the rounding can pull its edge inside the original. The tolerance is metres at
+    the equator, so it is tighter east-west towards the poles.
+    """
+    raw = shape(geometry)
+    repaired = shapely.union_all(
+        [
+            part
+            for part in shapely.get_parts(raw if raw.is_valid else shapely.make_valid(raw))
+            if part.geom_type.endswith("Polygon")
+        ]
+    )
+    prepared = repaired
+    grid = 10.0**-precision if precision is not None else 0.0
+    tolerance = tolerance_m / METRES_PER_DEGREE
+    if tolerance or grid:
+        prepared = prepared.buffer(tolerance + grid, join_style="mitre").simplify(tolerance)
+    if grid:
+        prepared = shapely.set_precision(prepared, grid)
+    if not prepared.covers(repaired):
+        prepared = shapely.union_all([prepared, repaired])
+    return json.loads(json.dumps(mapping(prepared)))
+
+
+def prepare_geometries(
+    features: list[dict], tolerance_m: float, precision: int | None
+) -> tuple[int, int]:
+    """prepare_geometry() on every feature in place, rewriting a spooled one's file.
+    Returns vertices before and after."""
+    before = after = 0
+    for feature in features:
+        geometry = geometry_of(feature)
+        before += vertex_count(geometry)
+        geometry = prepare_geometry(geometry, tolerance_m, precision)
+        after += vertex_count(geometry)
+        if "geometry" in feature:
+            feature["geometry"] = geometry
+        else:
+            feature["geometry_path"].write_text(json.dumps(geometry), encoding="utf-8")
+    if features:
+        saved = 1 - after / before if before else 0.0
+        print(
+            f"geometry: {len(features)} polygon(s), {before} -> {after} vertices "
+            f"({saved:.0%} fewer), tolerance {tolerance_m:g} m, precision {precision}"
+        )
+    return before, after
+
+
+def write_osmium_config(
+    features: list[dict], pbf_dir: Path, name: str = "_osmium-extracts.json"
+) -> tuple[Path, dict[str, Path]]:
     """One osmium extract config covering every project, so the source PBF is read once.
 
     osmium streams the whole input per invocation, so one pass with N extracts costs
@@ -140,8 +329,10 @@ def write_osmium_config(features: list[dict], pbf_dir: Path) -> tuple[Path, dict
     extracts, outputs = [], {}
     for feature in features:
         project_id = str(feature["properties"]["project_id"])
-        polygon = pbf_dir / f"{project_id}.geojson"
-        polygon.write_text(json.dumps(feature["geometry"]), encoding="utf-8")
+        polygon = feature.get("geometry_path")
+        if polygon is None:
+            polygon = pbf_dir / f"{project_id}.geojson"
+            polygon.write_text(json.dumps(feature["geometry"]), encoding="utf-8")
         output = pbf_dir / f"{project_id}.osm.pbf"
         extracts.append(
             {
@@ -150,7 +341,7 @@ def write_osmium_config(features: list[dict], pbf_dir: Path) -> tuple[Path, dict
             }
         )
         outputs[project_id] = output
-    config = pbf_dir / "_osmium-extracts.json"
+    config = pbf_dir / name
     config.write_text(
         json.dumps({"directory": str(pbf_dir), "extracts": extracts}, indent=2),
         encoding="utf-8",
@@ -158,7 +349,114 @@ def write_osmium_config(features: list[dict], pbf_dir: Path) -> tuple[Path, dict
     return config, outputs
 
 
-def run_osmium_extract(source_pbf: Path, config: Path) -> None:
+def plan_extract_batches(
+    features: list[dict], max_extracts: int, memory_gb: float, mb_per_extract: float
+) -> list[list[dict]]:
+    """Split the projects into osmium passes that each fit the memory budget.
+
+    With complete_ways, osmium keeps node and way id sets per extract for the whole
+    pass, so a pass's memory grows with its extract count and one pass over hundreds
+    of projects can exhaust the host. Each pass holds at most max_extracts, and no
+    more than memory_gb can hold at mb_per_extract each. The projects are shared out
+    evenly rather than leaving a small last pass.
+    """
+    if not features:
+        return []
+    fits = int(memory_gb * 1024 // mb_per_extract)
+    per_pass = max(1, min(max_extracts, fits))
+    passes = math.ceil(len(features) / per_pass)
+    size, extra = divmod(len(features), passes)
+    batches, start = [], 0
+    for index in range(passes):
+        end = start + size + (index < extra)
+        batches.append(features[start:end])
+        start = end
+    return batches
+
+
+def extract_workers(batches: list[list[dict]], memory_gb: float, mb_per_extract: float) -> int:
+    """Passes to run side by side: as many as the memory budget holds at the largest
+    pass's estimate, and no more than half the cores, since each pass also decodes."""
+    if not batches:
+        return 1
+    largest = max(len(batch) for batch in batches) * mb_per_extract
+    fits = int(memory_gb * 1024 // largest)
+    return max(1, min(len(batches), fits, (os.cpu_count() or 2) // 2))
+
+
+def tag_filter_expressions(template) -> list[str] | None:
+    """osmium tags-filter expressions for the union of the template's category filters.
+
+    `key: true` keeps any value, a list keeps those values. None when some enabled
+    category cannot be expressed, an empty filter among them, since dropping what it
+    selects would silently empty that category.
+    """
+    keys: dict[str, set[str] | None] = {}
+    for category in template.categories:
+        osm = category.get("osm") or {}
+        if not osm.get("enabled", True):
+            continue
+        tag_filter = OmegaConf.to_container(osm.get("filter") or OmegaConf.create({}))
+        if not tag_filter:
+            return None
+        for key, value in tag_filter.items():
+            if value is True:
+                keys[key] = None
+                continue
+            values = [value] if isinstance(value, str) else value
+            if not isinstance(values, list) or not all(
+                isinstance(v, str) and "," not in v and "=" not in v for v in values
+            ):
+                return None
+            if keys.get(key, set()) is not None:
+                keys[key] = keys.get(key, set()) | set(values)
+    return [
+        f"nwr/{key}" if values is None else f"nwr/{key}={','.join(sorted(values))}"
+        for key, values in sorted(keys.items())
+    ]
+
+
+def source_fingerprint(pbf: Path) -> str:
+    """Path, size and mtime rather than a content hash, which would read ~80 GB."""
+    stat = pbf.stat()
+    identity = f"{pbf.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode()).hexdigest()[:12]
+
+
+def prefilter_source(
+    source_pbf: Path, expressions: list[str], cache_dir: Path, metrics: Metrics | None = None
+) -> Path:
+    """The source cut down to what the categories select, plus the nodes, ways and
+    relation members they reference, cut once per source and filter set.
+
+    Every later pass, the multi-extract and each project's oex run, then reads a
+    fraction of the planet. A filtered file from an older source or another filter is
+    removed once the new one is in place.
+    """
+    filter_hash = hashlib.sha256("\n".join(expressions).encode()).hexdigest()[:12]
+    target = cache_dir / f"_filtered-{source_fingerprint(source_pbf)}-{filter_hash}.osm.pbf"
+    if target.is_file():
+        print(f"prefilter: reusing {_display(target)}")
+        return target
+    partial = target.with_name(f".{target.name}.partial.osm.pbf")
+    command = ["osmium", "tags-filter", "--overwrite", "-o", str(partial), str(source_pbf)]
+    print(f"prefilter: {source_pbf} -> {_display(target)} ({' '.join(expressions)})")
+    started = time.monotonic()
+    completed = subprocess.run(command + expressions)
+    if completed.returncode != 0:
+        partial.unlink(missing_ok=True)
+        raise TaskingManagerError(f"osmium tags-filter failed with rc={completed.returncode}")
+    partial.rename(target)
+    if metrics is not None:
+        metrics.set("oex_tm_prefilter_seconds", time.monotonic() - started)
+        write_metrics(metrics)
+    for stale in cache_dir.glob("_filtered-*.osm.pbf"):
+        if stale != target:
+            stale.unlink()
+    return target
+
+
+def run_osmium_extract(source_pbf: Path, config: Path, metrics: Metrics | None = None) -> None:
     """Single pass over the source PBF, writing every project's extract."""
     command = [
         "osmium",
@@ -171,7 +469,11 @@ def run_osmium_extract(source_pbf: Path, config: Path) -> None:
         str(source_pbf),
     ]
     print(f"osmium extract: one pass over {source_pbf} for {config}")
+    started = time.monotonic()
     completed = subprocess.run(command)
+    if metrics is not None:
+        metrics.set("oex_tm_osmium_extract_seconds", time.monotonic() - started)
+        write_metrics(metrics)
     if completed.returncode != 0:
         raise TaskingManagerError(f"osmium extract failed with rc={completed.returncode}")
 
@@ -196,53 +498,144 @@ def resolve_source_pbf(location: str) -> str:
     return str(pbfs[0])
 
 
-def ensure_local_pbf(source: str, cache_dir: Path) -> Path:
-    """osmium reads local files only, so fetch a remote source once and reuse it."""
+def ensure_local_pbf(source: str, cache_dir: Path, metrics: Metrics | None = None) -> Path:
+    """osmium reads local files only, so a remote source is fetched into the PBF store,
+    once for every pipeline that reads it, and viewed from cache_dir."""
     if "://" not in source:
         return Path(source)
     remote = UPath(source)
-    cache_dir.mkdir(parents=True, exist_ok=True)
     local = cache_dir / f"{remote.parent.name}-{remote.name}"
-    size = remote.stat().st_size
-    if local.is_file() and local.stat().st_size == size:
+    try:
+        _, downloaded = pbf_store.fetch(source, local)
+    except pbf_store.StoreError as error:
+        raise TaskingManagerError(str(error)) from error
+    if not downloaded:
         print(f"source: reusing {_display(local)}")
-        return local
-    print(f"source: downloading {source} ({size / 1e6:.1f} MB) -> {_display(local)}")
-    local.write_bytes(remote.read_bytes())
+    elif metrics is not None:
+        metrics.inc("oex_tm_download_bytes_total", downloaded)
+        write_metrics(metrics)
     return local
 
 
+def extract_dir(sandbox: bool, pbf_dir: Path | None) -> Path:
+    """Where the project polygons and their extracts live: --pbf-dir, or data/tm."""
+    return pbf_dir or Path(os.environ.get("OEX_DATA_DIR", REPO_ROOT)) / "data" / (
+        "tm_sandbox" if sandbox else "tm"
+    )
+
+
+def prune_polygons(pbf_dir: Path) -> list[Path]:
+    """Remove the `<id>.geojson` polygons runs used to leave beside the extracts."""
+    stale = [path for path in pbf_dir.glob("*.geojson") if path.stem.isdigit()]
+    for path in stale:
+        path.unlink(missing_ok=True)
+    return stale
+
+
 def cut_project_extracts(
-    features: list[dict], sandbox: bool, pbf_dir: Path | None
+    features: list[dict],
+    sandbox: bool,
+    pbf_dir: Path | None,
+    metrics: Metrics | None = None,
+    event_log: EventLog | None = None,
+    expressions: list[str] | None = None,
+    max_extracts: int = EXTRACT_BATCH,
+    memory_gb: float | None = None,
+    mb_per_extract: float = EXTRACT_MB,
 ) -> dict[str, Path]:
-    """Cut every project's PBF in one pass, and report which are usable."""
+    """Cut every project's PBF in as few passes as the memory budget allows, and report
+    which are usable.
+
+    With tag filter expressions, the passes read the source pre-filtered to them.
+    memory_gb defaults to half the host's; the passes that fit in it run side by side.
+    """
+    event_log = event_log or EventLog(None, "tm_configs")
     source = os.environ.get(PBF_ENV)
     if not source:
         raise TaskingManagerError(f"--extract needs {PBF_ENV} set to the source PBF")
 
-    target = pbf_dir or Path(os.environ.get("OEX_DATA_DIR", REPO_ROOT)) / "data" / (
-        "tm_sandbox" if sandbox else "tm"
-    )
-    source_pbf = ensure_local_pbf(resolve_source_pbf(source), target)
+    target = extract_dir(sandbox, pbf_dir)
+    with event_log.span("source", "resolve"):
+        location = resolve_source_pbf(source)
+    with event_log.span(location, "download"):
+        source_pbf = ensure_local_pbf(location, target, metrics)
     if not source_pbf.is_file():
         raise TaskingManagerError(f"{PBF_ENV}={source_pbf} is not a file")
-    config, outputs = write_osmium_config(features, target)
-    run_osmium_extract(source_pbf, config)
+    if expressions:
+        with event_log.span(str(source_pbf), "prefilter", expressions=expressions):
+            source_pbf = prefilter_source(source_pbf, expressions, target, metrics)
+    memory_gb = memory_gb or host_memory_gb() / 2
+    batches = plan_extract_batches(features, max_extracts, memory_gb, mb_per_extract)
+    workers = extract_workers(batches, memory_gb, mb_per_extract)
+    if len(batches) > 1:
+        print(
+            f"osmium extract: {len(features)} projects in {len(batches)} passes of at most "
+            f"{max(len(batch) for batch in batches)}, {workers} at a time"
+        )
+
+    def one_pass(index: int, batch: list[dict]) -> dict[str, Path]:
+        name = "_osmium-extracts.json" if len(batches) == 1 else f"_osmium-extracts-{index}.json"
+        config, outputs = write_osmium_config(batch, target, name)
+        vertices = sum(vertex_count(geometry_of(feature)) for feature in batch)
+        with event_log.span(
+            str(source_pbf), "osmium_extract", extracts=len(outputs), vertices=vertices
+        ):
+            run_osmium_extract(source_pbf, config)
+        return outputs
+
+    started = time.monotonic()
+    outputs: dict[str, Path] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch_outputs in pool.map(one_pass, range(len(batches)), batches):
+            outputs.update(batch_outputs)
+    if metrics is not None:
+        metrics.set("oex_tm_osmium_extract_seconds", time.monotonic() - started)
+        write_metrics(metrics)
 
     usable = {}
     for project_id, path in outputs.items():
         if not path.is_file():
             print(f"warn project {project_id}: osmium wrote no extract, using {PBF_ENV} whole")
             continue
-        if node_count(path) == 0:
+        with event_log.span(project_id, "node_count") as span:
+            span["nodes"] = nodes = node_count(path)
+        if nodes == 0:
+            reason = (
+                "does not cover it or has nothing the categories select"
+                if expressions
+                else "does not cover it"
+            )
             print(
-                f"warn project {project_id}: extract is empty, so {PBF_ENV} does not cover it; "
+                f"warn project {project_id}: extract is empty, so {PBF_ENV} {reason}; "
                 "the export would publish nothing"
             )
         usable[project_id] = path
     return usable
 
 
+def extract_digest(pbf: Path) -> str:
+    """SHA-256 over a PBF's data blocks. The header block carries the source's
+    replication timestamp, which moves with every new source whether or not the
+    project's features did, so it is left out."""
+    digest = hashlib.sha256()
+    with pbf.open("rb") as handle:
+        while prefix := handle.read(4):
+            kind, size = blob_header(handle.read(int.from_bytes(prefix, "big")))
+            blob = handle.read(size)
+            if kind == b"OSMData":
+                digest.update(blob)
+    return digest.hexdigest()
+
+
+def export_fingerprint(config: Path, extract: Path | None) -> str | None:
+    """What an export depends on: the config as written and the features in its
+    extract. None, so always exported, for a project reading the whole source."""
+    if extract is None or not extract.is_file():
+        return None
+    text = config.read_text(encoding="utf-8")
+    return hashlib.sha256(f"{text}\n{extract_digest(extract)}".encode()).hexdigest()
+
+
 def node_count(pbf: Path) -> int:
     """Nodes in a PBF. Zero means the source did not cover that project's polygon."""
     completed = subprocess.run(
@@ -255,11 +648,14 @@ def node_count(pbf: Path) -> int:
     return int(completed.stdout.strip() or 0)
 
 
-def sync(out_dir: Path, configs: dict, dry_run: bool) -> int:
+def sync(out_dir: Path, configs: dict | Iterable[tuple[str, object]], dry_run: bool) -> int:
     """Write changed configs. Nothing is deleted: the API reports what moved in the
-    interval, not everything that exists, so its silence is not a signal to drop a project."""
+    interval, not everything that exists, so its silence is not a signal to drop a project.
+
+    configs is a dict of file name to config, or (name, config) pairs, which can be
+    built one at a time so that only one project's polygon is ever in a config."""
     written = 0
-    for name, cfg in sorted(configs.items()):
+    for name, cfg in sorted(configs.items()) if isinstance(configs, dict) else configs:
         text = OmegaConf.to_yaml(cfg, resolve=False)
         target = out_dir / name
         if target.exists() and target.read_text(encoding="utf-8") == text:
@@ -271,24 +667,183 @@ def sync(out_dir: Path, configs: dict, dry_run: bool) -> int:
     return written
 
 
-def export_configs(paths: list[Path]) -> int:
-    """Run oex-cli over the configs just written. How often to do that is the caller's call."""
-    failures = []
+def _read_results(results_file: Path) -> dict[str, dict]:
+    """The projects tm_export_batch.py has finished, leaving out a line still being written."""
+    records = {}
+    if results_file.is_file():
+        for line in results_file.read_text(encoding="utf-8").splitlines(keepends=True):
+            if not line.endswith("\n"):
+                continue
+            record = json.loads(line)
+            records[record["project"]] = record
+    return records
+
+
+def _run_batch(chunk: list[Path], results_file: Path, project_timeout: float):
+    """One tm_export_batch.py process over the chunk. Each project gets project_timeout
+    seconds from the one before it finishing; a process still on one after that is
+    killed with its process group. Returns (records by project, the project it was
+    killed on or None, exit code, peak RSS in bytes)."""
+    results_file.unlink(missing_ok=True)
+    argv = ["uv", "run", "python", str(BATCH_SCRIPT), "--results", str(results_file)]
+    process = subprocess.Popen([*argv, *map(str, chunk)], cwd=REPO_ROOT, start_new_session=True)
+    done, deadline, hung = 0, time.monotonic() + project_timeout, None
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        records = _read_results(results_file)
+        if len(records) > done:
+            done, deadline = len(records), time.monotonic() + project_timeout
+        elif time.monotonic() >= deadline:
+            # tm_export_batch.py runs the projects in argv order.
+            hung = next(path for path in chunk if path.stem not in records)
+            print(f"{_display(hung)}: no result after {project_timeout:.0f}s", file=sys.stderr)
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        time.sleep(BATCH_POLL_SECONDS)
+    records = _read_results(results_file)
+    results_file.unlink(missing_ok=True)
+    return records, hung, os.waitstatus_to_exitcode(status), usage.ru_maxrss * 1024
+
+
+def _export_batches(
+    paths: list[Path],
+    batch: int,
+    event_log: EventLog,
+    project_timeout: float = PROJECT_TIMEOUT_SECONDS,
+):
+    """Run the configs through tm_export_batch.py, `batch` to a process, yielding each
+    project's (path, ok, seconds, peak RSS) as its process exits. A project that runs
+    past project_timeout fails alone: its process is killed and the rest of its batch
+    goes on in a new one. A project the results never mention otherwise, because its
+    process died first, failed."""
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    results_file = WORK_DIR / f"tm_batch-{os.getpid()}.jsonl"
+    for start in range(0, len(paths), batch):
+        chunk = paths[start : start + batch]
+        print(
+            f"[{start + 1}-{start + len(chunk)}/{len(paths)}] export {len(chunk)} in one process",
+            flush=True,
+        )
+        while chunk:
+            span = event_log.start(f"batch of {len(chunk)}", "export", projects=len(chunk))
+            started = time.monotonic()
+            records, hung, returncode, peak_rss = _run_batch(chunk, results_file, project_timeout)
+            elapsed = time.monotonic() - started
+            event_log.end(span, ok=returncode == 0 and hung is None, peak_rss=peak_rss)
+            if returncode < 0 and hung is None:
+                print(f"batch of {len(chunk)} killed by signal {-returncode}", file=sys.stderr)
+            rest = chunk[chunk.index(hung) + 1 :] if hung is not None else []
+            for path in chunk[: len(chunk) - len(rest)]:
+                record = records.get(path.stem)
+                if record is None:
+                    yield path, False, elapsed, peak_rss
+                else:
+                    yield path, record["ok"], record["seconds"], record["peak_rss"]
+            chunk = rest
+
+
+def _export_each(paths: list[Path], event_log: EventLog):
+    """One `oex-cli osm` per config, yielding as _export_batches does."""
     for index, path in enumerate(paths, start=1):
         print(f"[{index}/{len(paths)}] export {_display(path)}", flush=True)
-        completed = subprocess.run(
+        span = event_log.start(path.stem, "export")
+        started = time.monotonic()
+        process = subprocess.Popen(
             ["uv", "run", "oex-cli", "osm", "--config", str(path)], cwd=REPO_ROOT
         )
-        if completed.returncode != 0:
-            print(f"[{index}/{len(paths)}] FAILED rc={completed.returncode}", file=sys.stderr)
+        # wait4 rather than wait, for this export's own peak RSS.
+        _, status, usage = os.wait4(process.pid, 0)
+        ok = os.waitstatus_to_exitcode(status) == 0
+        event_log.end(span, ok=ok, peak_rss=usage.ru_maxrss * 1024)
+        yield path, ok, time.monotonic() - started, usage.ru_maxrss * 1024
+
+
+def export_configs(
+    paths: list[Path],
+    metrics: Metrics | None = None,
+    successes_file: Path | None = None,
+    event_log: EventLog | None = None,
+    fingerprints: dict[Path, str | None] | None = None,
+    exported_file: Path | None = None,
+    batch: int = 1,
+    project_timeout: float = PROJECT_TIMEOUT_SECONDS,
+) -> int:
+    """Run oex-cli over the configs just written. How often to do that is the caller's call.
+
+    A project whose fingerprint matches the one its last successful export left in
+    exported_file is skipped: the same config over the same features would publish
+    the same files again. With batch above 1, that many projects share one oex
+    process; see tm_export_batch.py. One of them still running after
+    project_timeout seconds is killed and fails alone.
+    """
+    metrics = metrics or tm_metrics(None)
+    event_log = event_log or EventLog(None, "tm_configs")
+    fingerprints = fingerprints or {}
+    exported = load_fingerprints(exported_file)
+    unchanged = [
+        path
+        for path in paths
+        if fingerprints.get(path) is not None and exported.get(path.stem) == fingerprints[path]
+    ]
+    for path in unchanged:
+        print(f"skip {_display(path)}: config and extract unchanged since its last export")
+        metrics.inc("oex_tm_exports_total", outcome="unchanged")
+    paths = [path for path in paths if path not in unchanged]
+    if batch > 1:
+        outcomes = _export_batches(paths, batch, event_log, project_timeout)
+    else:
+        outcomes = _export_each(paths, event_log)
+    failures = []
+    for index, (path, ok, seconds, peak_rss) in enumerate(outcomes, start=1):
+        project = path.stem
+        metrics.set("oex_tm_export_duration_seconds", seconds, project=project)
+        metrics.set("oex_tm_export_peak_rss_bytes", peak_rss, project=project)
+        if not ok:
+            print(f"[{index}/{len(paths)}] FAILED {_display(path)}", file=sys.stderr)
             failures.append(path.name)
+            metrics.inc("oex_tm_exports_total", outcome="failed")
+        else:
+            metrics.inc("oex_tm_exports_total", outcome="succeeded")
+            stamp = time.time()
+            metrics.set("oex_tm_last_success_timestamp_seconds", stamp, project=project)
+            if successes_file is not None:
+                save_timestamps(successes_file, {**load_timestamps(successes_file), project: stamp})
+            if exported_file is not None and fingerprints.get(path) is not None:
+                save_fingerprints(
+                    exported_file, {**load_fingerprints(exported_file), project: fingerprints[path]}
+                )
+        write_metrics(metrics)
+    skipped = f", {len(unchanged)} unchanged skipped"
     if failures:
-        print(f"{len(failures)}/{len(paths)} failed: {', '.join(failures)}", file=sys.stderr)
+        print(
+            f"{len(failures)}/{len(paths)} failed: {', '.join(failures)}{skipped}", file=sys.stderr
+        )
         return 1
-    print(f"export complete {len(paths)}/{len(paths)}")
+    print(f"export complete {len(paths)}/{len(paths)}{skipped}")
     return 0
 
 
+def load_fingerprints(path: Path | None) -> dict[str, str]:
+    """Fingerprints of the last successful export by project. Missing means none yet."""
+    if path is None or not path.is_file():
+        return {}
+    try:
+        return {str(k): str(v) for k, v in json.loads(path.read_text(encoding="utf-8")).items()}
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+
+
+def save_fingerprints(path: Path, fingerprints: dict[str, str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    partial.write_text(json.dumps(fingerprints, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(partial, path)
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(
         description=__doc__,
@@ -311,6 +866,46 @@ def main() -> int:
         "each config at its own extract instead of the whole file",
     )
     parser.add_argument("--pbf-dir", type=Path, help="where --extract writes per-project PBFs")
+    parser.add_argument(
+        "--extract-batch",
+        type=int,
+        default=EXTRACT_BATCH,
+        metavar="N",
+        help=f"at most N extracts per osmium pass (default {EXTRACT_BATCH})",
+    )
+    parser.add_argument(
+        "--extract-memory-gb",
+        type=float,
+        metavar="GB",
+        help="memory the osmium passes may use between them (default half the host's)",
+    )
+    parser.add_argument(
+        "--extract-mb",
+        type=float,
+        default=EXTRACT_MB,
+        metavar="MB",
+        help=f"memory estimate per extract in a pass (default {EXTRACT_MB})",
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="extract from the whole source PBF rather than one tag-filtered to the "
+        "template's categories",
+    )
+    parser.add_argument(
+        "--simplify",
+        type=float,
+        metavar="METRES",
+        help="repair and simplify each project polygon within this tolerance, growing it "
+        "first so it never shrinks below the original",
+    )
+    parser.add_argument(
+        "--precision",
+        type=int,
+        metavar="DIGITS",
+        help="round polygon coordinates to this many decimals (6 is ~0.1 m); implies the "
+        "repair that --simplify does",
+    )
     parser.add_argument(
         "--template", type=Path, default=TEMPLATE, help="config template to fill in per project"
     )
@@ -323,62 +918,144 @@ def main() -> int:
     parser.add_argument(
         "--export", action="store_true", help="export each project after writing its config"
     )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1,
+        metavar="N",
+        help="with --export, run up to N projects in one oex process rather than one each",
+    )
+    parser.add_argument(
+        "--project-timeout",
+        type=float,
+        default=PROJECT_TIMEOUT_SECONDS,
+        metavar="SECONDS",
+        help=f"with --batch, fail a project still running after this long "
+        f"(default {PROJECT_TIMEOUT_SECONDS})",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="node-exporter textfile to keep updated (default .sweep/<group>.prom)",
+    )
+    parser.add_argument(
+        "--events",
+        type=Path,
+        help="JSONL event log to write (default .sweep/events/<group>-<time>-<pid>.jsonl)",
+    )
     args = parser.parse_args()
 
-    out_dir = args.out or REPO_ROOT / "configs" / (
-        "tasking_manager_sandbox" if args.sandbox else "tasking_manager"
-    )
+    group = "tasking_manager_sandbox" if args.sandbox else "tasking_manager"
+    out_dir = args.out or REPO_ROOT / "configs" / group
     if not out_dir.is_dir():
         print(f"tm: {out_dir} is not a directory", file=sys.stderr)
         return 2
 
-    try:
-        if args.project:
-            features = [fetch_project(pid, args.timeout) for pid in args.project]
-        else:
-            features = fetch_active_projects(args.interval, args.sandbox, args.timeout)
+    metrics = None if args.dry_run else tm_metrics(args.metrics or WORK_DIR / f"{group}.prom")
+    successes_file = WORK_DIR / f"{group}_last_success.json"
+    if metrics is not None:
+        for project, stamp in load_timestamps(successes_file).items():
+            metrics.set("oex_tm_last_success_timestamp_seconds", stamp, project=project)
+    event_log = EventLog(
+        None if args.dry_run else args.events or default_path(WORK_DIR, group), "tm_configs"
+    )
+    # The polygons are read only while this run cuts its extracts and builds its
+    # configs, so they go to a scratch dir removed once the configs are written:
+    # beside the extracts when it cuts them, the system's otherwise.
+    pbf_dir = extract_dir(args.sandbox, args.pbf_dir) if args.extract and not args.dry_run else None
+    if pbf_dir is not None:
+        pbf_dir.mkdir(parents=True, exist_ok=True)
+        prune_polygons(pbf_dir)
+    with tempfile.TemporaryDirectory(prefix=".tm-aoi-", dir=pbf_dir) as scratch:
+        aoi_dir = Path(scratch)
+        try:
+            with event_log.span("projects", "fetch") as span:
+                if args.project:
+                    features = [fetch_project(pid, args.timeout, aoi_dir) for pid in args.project]
+                else:
+                    features = fetch_active_projects(
+                        args.interval, args.sandbox, args.timeout, aoi_dir
+                    )
+                span["projects"] = len(features)
 
-        kept = []
-        for feature in features:
-            if category_names(feature["properties"].get("mapping_types")):
-                kept.append(feature)
-            else:
-                print(
-                    f"skip project {feature['properties']['project_id']}: no supported mapping type"
+            kept = []
+            for feature in features:
+                if category_names(feature["properties"].get("mapping_types")):
+                    kept.append(feature)
+                else:
+                    print(
+                        f"skip project {feature['properties']['project_id']}: no supported mapping type"
+                    )
+
+            if args.simplify is not None or args.precision is not None:
+                with event_log.span("polygons", "geometry", projects=len(kept)) as span:
+                    span["vertices_before"], span["vertices_after"] = prepare_geometries(
+                        kept, args.simplify or 0.0, args.precision
+                    )
+
+            template = OmegaConf.create(args.template.read_text(encoding="utf-8"))
+            outputs: dict[str, Path] = {}
+            if args.extract and kept and not args.dry_run:
+                expressions = None if args.no_prefilter else tag_filter_expressions(template)
+                outputs = cut_project_extracts(
+                    kept,
+                    args.sandbox,
+                    args.pbf_dir,
+                    metrics,
+                    event_log,
+                    expressions,
+                    args.extract_batch,
+                    args.extract_memory_gb,
+                    args.extract_mb,
                 )
+        except TaskingManagerError as error:
+            print(f"tm: {error}", file=sys.stderr)
+            return 2
 
-        outputs: dict[str, Path] = {}
-        if args.extract and kept and not args.dry_run:
-            outputs = cut_project_extracts(kept, args.sandbox, args.pbf_dir)
-    except TaskingManagerError as error:
-        print(f"tm: {error}", file=sys.stderr)
-        return 2
+        configs: list[str] = []
 
-    template = OmegaConf.create(args.template.read_text(encoding="utf-8"))
-    configs = {}
-    for feature in kept:
-        project_id = str(feature["properties"]["project_id"])
-        cfg = build_config(
-            template,
-            feature,
-            args.sandbox,
-            outputs.get(project_id),
-            args.template != TEMPLATE,
-        )
-        if cfg is None:
-            print(f"skip project {project_id}: no category matched")
-            continue
-        configs[f"{project_id}.yaml"] = cfg
+        def built():
+            for feature in sorted(kept, key=lambda f: f"{f['properties']['project_id']}.yaml"):
+                project_id = str(feature["properties"]["project_id"])
+                cfg = build_config(
+                    template,
+                    feature,
+                    args.sandbox,
+                    outputs.get(project_id),
+                    args.template != TEMPLATE,
+                )
+                if cfg is None:
+                    print(f"skip project {project_id}: no category matched")
+                    continue
+                configs.append(f"{project_id}.yaml")
+                yield configs[-1], cfg
 
-    written = sync(out_dir, configs, args.dry_run)
+        with event_log.span(_display(out_dir), "sync") as span:
+            span["written"] = written = sync(out_dir, built(), args.dry_run)
     scope = "sandbox" if args.sandbox else "production"
     print(
         f"tm: {scope} active={len(features)} configs={len(configs)} "
         f"written={written} -> {_display(out_dir)}"
     )
+    if metrics is not None:
+        for state, count in (("active", len(features)), ("configs", len(configs))):
+            metrics.set("oex_tm_projects", count, state=state)
+        metrics.set("oex_tm_projects", written, state="written")
+        write_metrics(metrics)
     if not args.export or args.dry_run:
         return 0
-    return export_configs([out_dir / name for name in sorted(configs)])
+    paths = [out_dir / name for name in configs]
+    fingerprints = {path: export_fingerprint(path, outputs.get(path.stem)) for path in paths}
+    return export_configs(
+        paths,
+        metrics,
+        successes_file,
+        event_log,
+        fingerprints,
+        WORK_DIR / f"{group}_exported.json",
+        args.batch,
+        args.project_timeout,
+    )
 
 
 if __name__ == "__main__":
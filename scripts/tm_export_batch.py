@@ -0,0 +1,70 @@
+#!/usr/bin/env -S uv run python
+"""Export several Tasking Manager project configs in one oex process.
+
+    tm_export_batch.py --results .sweep/batch.jsonl configs/tasking_manager/*.yaml
+
+tm_configs.py --export --batch N runs this instead of one `oex-cli osm` per project.
+The projects share a template and a category set, and are small, so most of what a
+separate process costs each of them is the interpreter, oex's imports and DuckDB's
+extension loading rather than the export. Here those are paid once per batch.
+
+Each project still runs through its own oex Exporter: it builds, names and uploads
+its artifacts exactly as `oex-cli osm --config` would. oex opens a DuckDB session
+per category inside an export, so a session is not shared across projects.
+
+One JSON line per project is appended to --results as soon as it finishes, so the
+caller can tell which projects of a batch that died part way through still need
+exporting. An exception in one project fails that project, not the batch.
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+
+
+def export_one(path: Path) -> dict:
+    from oex.config.loader import load_config
+    from oex.exporter import Exporter
+    from oex.osm.runner import OsmRunner
+
+    started = time.monotonic()
+    try:
+        result = Exporter(load_config(path), OsmRunner()).run()
+        ok = result.failed == 0
+    except Exception as error:  # noqa: BLE001 - the next project in the batch still runs
+        print(f"{path.name}: {type(error).__name__}: {error}", file=sys.stderr)
+        ok = False
+    return {
+        "project": path.stem,
+        "ok": ok,
+        "seconds": time.monotonic() - started,
+        # The process's peak so far: projects of a batch share one.
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("configs", nargs="+", type=Path)
+    parser.add_argument("--results", type=Path, required=True, help="JSONL to append to")
+    args = parser.parse_args()
+
+    from oex.logging_setup import setup_logging
+
+    setup_logging(level=os.environ.get("LOG_LEVEL", "INFO"))
+    failed = 0
+    with args.results.open("a", encoding="utf-8") as results:
+        for path in args.configs:
+            record = export_one(path)
+            failed += not record["ok"]
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
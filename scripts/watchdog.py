@@ -0,0 +1,225 @@
+"""Pause the least important running jobs while the host is short of memory.
+
+Admission control cannot foresee a job whose memory spikes mid-run, and the kernel's
+OOM killer picks its victim by size, not by what the sweep would rather lose. Every
+WATCH_SECONDS the watchdog reads `some avg10` from /proc/pressure/memory, the share of
+the last ten seconds in which some task waited on memory, and the RSS of each running
+job's process group.
+
+    at or over PAUSE_AT     stop (SIGSTOP) the running job of the latest group in
+                            `groups:`, the largest of equals, but not the last job
+                            still running
+    still, EVICT_AFTER on   end the least important job stopped that long, and
+                            requeue it: it runs again after the rest of the sweep,
+                            resuming from what oex already wrote
+    at or over CRITICAL_AT  with nothing to evict, stop the last job too, unless
+                            it was requeued already: it would never be evicted
+    under RESUME_AT         continue (SIGCONT) the most important stopped job
+
+A sweep that runs one job at a time, as it does by default, only ever has a last
+job, so there the watchdog acts only at CRITICAL_AT. Stopping a job frees none of
+its memory; it keeps the job from taking more while whatever else presses on the
+host, such as another sweep or the page cache's writeback, gets through.
+
+It takes one step per COOLDOWN_SECONDS, since avg10 takes that long to show what the
+last one did. A job is requeued once; stopped again after that, it only waits.
+
+Sweeps on one host, such as shards, list their running jobs in one folder, so the
+choice is made across them all, and each sweep acts only on its own jobs.
+"""
+
+import json
+import os
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+PRESSURE_FILE = Path("/proc/pressure/memory")
+WATCH_SECONDS = 5
+COOLDOWN_SECONDS = 20
+PAUSE_AT = 20.0
+CRITICAL_AT = 60.0
+RESUME_AT = 5.0
+EVICT_AFTER = 120
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+@dataclass
+class Entry:
+    """A running job as its sweep listed it, with what /proc says of its group."""
+
+    pgid: int
+    job: str
+    group: str
+    rank: int
+    sweep: int
+    requeue: bool
+    paused_at: float | None = None
+    rss: int = 0
+
+    @property
+    def paused(self) -> bool:
+        return self.paused_at is not None
+
+
+def pressure(path: Path | None = None) -> float | None:
+    """`some avg10` as a percentage, or None where the kernel has no PSI."""
+    try:
+        lines = (path or PRESSURE_FILE).read_text().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        kind, *fields = line.split()
+        if kind == "some":
+            return float(dict(field.split("=") for field in fields)["avg10"])
+    return None
+
+
+def group_rss() -> dict[int, int]:
+    """Resident bytes of every process group, summed over its live processes."""
+    totals: dict[int, int] = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if fields[0] not in ("Z", "X"):
+            pgrp = int(fields[2])
+            totals[pgrp] = totals.get(pgrp, 0) + int(fields[21]) * PAGE_SIZE
+    return totals
+
+
+def decide(entries: list[Entry], some: float, now: float) -> tuple[str, Entry] | None:
+    """The one step to take, if any: ("pause" | "evict" | "resume", entry)."""
+    running = [e for e in entries if not e.paused]
+    stopped = [e for e in entries if e.paused]
+    if some >= PAUSE_AT:
+        if len(running) > 1:
+            return "pause", max(running, key=lambda e: (e.rank, e.rss))
+        evictable = [e for e in stopped if e.requeue and now - e.paused_at >= EVICT_AFTER]
+        if evictable:
+            return "evict", max(evictable, key=lambda e: (e.rank, e.rss))
+        last = [e for e in running if e.requeue]
+        if last and some >= CRITICAL_AT:
+            return "pause", last[0]
+    elif some < RESUME_AT and stopped:
+        return "resume", min(stopped, key=lambda e: (e.rank, e.rss))
+    return None
+
+
+class Watchdog:
+    """Lists this sweep's running jobs in registry, and pauses, resumes or evicts them.
+
+    ranks gives each group's place in `groups:`; a group missing from it comes last.
+    """
+
+    def __init__(self, registry: Path, ranks: dict[str, int], event_log=None):
+        self.registry = registry
+        self.ranks = ranks
+        self.event_log = event_log
+        # Groups whose job the sweep should end and requeue.
+        self.evicted: set[int] = set()
+        # Seconds each own group has spent stopped, and when a stopped one was stopped,
+        # on the monotonic clock: the sweep does not count them towards its timeout.
+        self._paused: dict[int, float] = {}
+        self._stopped: dict[int, float] = {}
+        self._spans: dict[int, str] = {}
+        self._looked = self._acted = float("-inf")
+        registry.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, pgid: int) -> Path:
+        return self.registry / f"{pgid}.json"
+
+    def _write(self, entry: Entry) -> None:
+        partial = self.registry / f".{entry.pgid}.{os.getpid()}.tmp"
+        fields = {k: v for k, v in vars(entry).items() if k != "rss"}
+        partial.write_text(json.dumps(fields), encoding="utf-8")
+        os.replace(partial, self._path(entry.pgid))
+
+    def track(self, pgid: int, job_id: str, group: str, requeue: bool) -> None:
+        rank = self.ranks.get(group, len(self.ranks))
+        self._write(Entry(pgid, job_id, group, rank, os.getpid(), requeue))
+
+    def untrack(self, pgid: int) -> None:
+        self._path(pgid).unlink(missing_ok=True)
+        self.evicted.discard(pgid)
+        self._paused.pop(pgid, None)
+        self._stopped.pop(pgid, None)
+        if pgid in self._spans and self.event_log is not None:
+            self.event_log.end(self._spans.pop(pgid), ok=False)
+
+    def paused_seconds(self, pgid: int) -> float:
+        """How long this sweep has held the group stopped, the current stop included."""
+        total = self._paused.get(pgid, 0.0)
+        if pgid in self._stopped:
+            total += time.monotonic() - self._stopped[pgid]
+        return total
+
+    def entries(self) -> list[Entry]:
+        """Every sweep's running jobs. An entry whose group has gone is removed."""
+        rss = group_rss()
+        found = []
+        for path in self.registry.glob("*.json"):
+            try:
+                entry = Entry(**json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError, TypeError):
+                continue
+            if entry.pgid not in rss:
+                path.unlink(missing_ok=True)
+                continue
+            entry.rss = rss[entry.pgid]
+            found.append(entry)
+        return found
+
+    def poll(self, own: set[int]) -> None:
+        """Look at most once per WATCH_SECONDS, and act on own groups only."""
+        now = time.monotonic()
+        if now - self._looked < WATCH_SECONDS or now - self._acted < COOLDOWN_SECONDS:
+            return
+        self._looked = now
+        some = pressure()
+        if some is None:
+            return
+        step = decide(self.entries(), some, time.time())
+        if step is None:
+            return
+        # Whichever sweep owns the job takes the step; none takes another before it shows.
+        self._acted = now
+        action, entry = step
+        if entry.pgid not in own:
+            return
+        print(
+            f"watchdog: memory pressure {some:.0f}%, {action} {entry.job} "
+            f"({entry.rss / 1024**3:.1f} GB)",
+            file=sys.stderr,
+            flush=True,
+        )
+        if action == "pause":
+            _signal(entry.pgid, signal.SIGSTOP)
+            self._stopped[entry.pgid] = now
+            entry.paused_at = time.time()
+            self._write(entry)
+            if self.event_log is not None:
+                self._spans[entry.pgid] = self.event_log.start(
+                    entry.job, "paused", group=entry.group, pressure=some, rss=entry.rss
+                )
+        elif action == "resume":
+            _signal(entry.pgid, signal.SIGCONT)
+            if entry.pgid in self._stopped:
+                self._paused[entry.pgid] = self.paused_seconds(entry.pgid)
+                del self._stopped[entry.pgid]
+            entry.paused_at = None
+            self._write(entry)
+            if entry.pgid in self._spans and self.event_log is not None:
+                self.event_log.end(self._spans.pop(entry.pgid))
+        else:
+            self.evicted.add(entry.pgid)
+
+
+def _signal(pgid: int, sig: int) -> None:
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
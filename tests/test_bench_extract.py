@@ -0,0 +1,11 @@
+import bench_extract
+
+
+def test_the_recommendation_is_the_fastest_pass_that_fits():
+    results = [
+        {"size": 10, "seconds": 100.0, "peak_mb": 1_100},
+        {"size": 50, "seconds": 125.0, "peak_mb": 5_100},
+        {"size": 200, "seconds": 250.0, "peak_mb": 20_100},
+    ]
+    assert bench_extract.recommend(results, memory_gb=32) == (200, 100)
+    assert bench_extract.recommend(results, memory_gb=8) == (50, 100)
@@ -0,0 +1,146 @@
+import json
+import sqlite3
+
+import boundaries
+import sweep
+import yaml
+from shapely.geometry import shape
+
+SQUARE = {"type": "Polygon", "coordinates": [[[85, 27], [86, 27], [86, 28], [85, 28], [85, 27]]]}
+
+
+def stored(tmp_path, version="v1"):
+    path = tmp_path / "data" / "boundaries.sqlite"
+    conn = boundaries.connect(path)
+    boundaries.store_release(conn, boundaries.RELEASE, "ADM0", version, {"NPL": SQUARE})
+    return path
+
+
+def test_only_the_newest_versions_are_kept(tmp_path):
+    path = stored(tmp_path, "v1")
+    conn = boundaries.connect(path)
+    for version in ("v2", "v3"):
+        boundaries.store_release(conn, "gbOpen", "ADM0", version, {"NPL": SQUARE})
+    versions = {row[0] for row in conn.execute("SELECT version FROM boundaries")}
+    assert boundaries.current_version(conn, "gbOpen", "ADM0") == "v3"
+    assert versions == {"v2", "v3"}
+
+
+def test_a_boundary_is_inlined_as_stored_unless_buffered(tmp_path):
+    path = stored(tmp_path)
+    assert json.loads(boundaries.prepared_boundary(path, "ADM0", "npl", 0)) == SQUARE
+    text = boundaries.prepared_boundary(path, "ADM0", "npl", 1000)
+    prepared = shape(json.loads(text))
+    assert prepared.covers(shape(SQUARE))
+    # 1 km is about 0.0101 degrees of longitude at 27.5N and 0.009 of latitude.
+    minx, miny, _, _ = prepared.bounds
+    assert 84.9902 > minx > 84.9895 and 26.9912 > miny > 26.9908
+    assert boundaries.prepared_boundary(path, "ADM0", "NPL", 1000) == text
+
+
+def test_a_download_becomes_the_geometry_oex_would_make_of_it():
+    one = {"type": "FeatureCollection", "features": [{"geometry": SQUARE}]}
+    two = {"type": "FeatureCollection", "features": [{"geometry": SQUARE}] * 2}
+    assert boundaries.as_geometry(one) == SQUARE
+    assert boundaries.as_geometry(two) == {
+        "type": "GeometryCollection",
+        "geometries": [SQUARE, SQUARE],
+    }
+
+
+def test_no_store_or_no_country_gives_none(tmp_path):
+    assert boundaries.prepared_boundary(tmp_path / "none.sqlite", "ADM0", "NPL", 0) is None
+    assert boundaries.prepared_boundary(stored(tmp_path), "ADM0", "HKG", 0) is None
+
+
+def serving(monkeypatch, builds, failing=()):
+    """geoBoundaries as a dict: each country's metadata with its build date, and a
+    square download; a failing country's metadata call raises."""
+    calls = []
+
+    def fake(url, timeout=boundaries.HTTP_TIMEOUT_SECONDS):
+        calls.append(url)
+        iso3 = url.rstrip("/").split("/")[-2] if "/api/" in url else url.split(":")[-1]
+        if iso3 in failing:
+            raise boundaries.BoundaryError(f"{url}: timed out")
+        if "/api/" in url:
+            return {"buildDate": builds[iso3], "gjDownloadURL": f"download:{iso3}"}
+        return {"type": "FeatureCollection", "features": [{"geometry": SQUARE}]}
+
+    monkeypatch.setattr(boundaries, "_json", fake)
+    return calls
+
+
+def test_an_unchanged_build_is_not_fetched_again(tmp_path, monkeypatch):
+    path = tmp_path / "boundaries.sqlite"
+    calls = serving(monkeypatch, {"NPL": "2024-01-01"})
+    assert boundaries.refresh(path, "ADM0", ["NPL"]) is True
+    assert boundaries.refresh(path, "ADM0", ["npl"]) is False
+    assert [url for url in calls if url.startswith("download:")] == ["download:NPL"]
+    # Checked a moment ago: a sweep leaves it alone.
+    calls.clear()
+    assert boundaries.refresh(path, "ADM0", ["NPL"], max_age=3600) is False
+    assert calls == []
+
+
+def test_a_failed_check_keeps_the_stored_country(tmp_path, monkeypatch):
+    path = tmp_path / "boundaries.sqlite"
+    serving(monkeypatch, {"NPL": "2024-01-01", "SDN": "2024-01-01"})
+    boundaries.refresh(path, "ADM0", ["NPL", "SDN"])
+    conn = boundaries.connect(path)
+    first = boundaries.current_version(conn, boundaries.RELEASE, "ADM0")
+    boundaries.prepared_boundary(path, "ADM0", "NPL", 1000)
+
+    serving(monkeypatch, {"SDN": "2025-06-01"}, failing={"NPL"})
+    assert boundaries.refresh(path, "ADM0", ["NPL", "SDN"]) is True
+    version = boundaries.current_version(conn, boundaries.RELEASE, "ADM0")
+    builds = boundaries.stored_builds(conn, boundaries.RELEASE, "ADM0", version)
+    assert version != first
+    assert {iso3: build for iso3, (build, _) in builds.items()} == {
+        "NPL": "2024-01-01",
+        "SDN": "2025-06-01",
+    }
+    assert json.loads(boundaries.prepared_boundary(path, "ADM0", "NPL", 0)) == SQUARE
+    buffered = conn.execute("SELECT iso3 FROM buffered WHERE version = ?", (version,))
+    assert buffered.fetchall() == [("NPL",)]
+
+    # Back again, and unchanged: nothing more to fetch.
+    serving(monkeypatch, {"NPL": "2024-01-01", "SDN": "2025-06-01"})
+    assert boundaries.refresh(path, "ADM0", ["NPL", "SDN"]) is False
+
+
+def test_the_merged_config_inlines_the_stored_boundary(tmp_path, monkeypatch):
+    stored(tmp_path)
+    monkeypatch.setenv("OEX_DATA_DIR", str(tmp_path))
+    overrides = tmp_path / "countries"
+    overrides.mkdir()
+    (overrides / "SDN.yaml").write_text("boundary:\n  geom: world\n", encoding="utf-8")
+    monkeypatch.setattr(sweep, "COUNTRY_CONFIG_DIR", overrides)
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+
+    merged = yaml.safe_load(sweep.country_config("NPL", "weekly").read_text(encoding="utf-8"))
+    assert shape(json.loads(merged["boundary"]["geom"])).covers(shape(SQUARE))
+    assert merged["boundary"]["buffer_meters"] == 0
+
+    own = yaml.safe_load(sweep.country_config("SDN", "weekly").read_text(encoding="utf-8"))
+    assert own["boundary"]["geom"] == "world"
+
+
+def test_a_rehearsal_reads_the_store_without_writing(tmp_path):
+    path = stored(tmp_path)
+    text = boundaries.prepared_boundary(path, "ADM0", "NPL", 1000, read_only=True)
+    assert shape(json.loads(text)).covers(shape(SQUARE))
+    assert boundaries.connect(path).execute("SELECT count(*) FROM buffered").fetchone() == (0,)
+
+
+def test_a_store_that_cannot_be_read_is_not_fatal(tmp_path, monkeypatch, capsys):
+    broken = tmp_path / "boundaries.sqlite"
+    broken.write_text("not a database")
+    assert boundaries.prepared_boundary(broken, "ADM0", "NPL", 0) is None
+
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(boundaries, "refresh", locked)
+    sweep.refresh_boundaries(sweep.EventLog(None, "sweep"), ["NPL"])
+    assert "database is locked" in capsys.readouterr().err
@@ -0,0 +1,106 @@
+import json
+
+import events
+import pytest
+
+
+def lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def write_log(path, spans):
+    """(name, phase, start, end, parent, attrs) tuples as start/end lines."""
+    with path.open("w", encoding="utf-8") as handle:
+        for name, phase, start, end, parent, attrs in spans:
+            common = {"span": name, "name": name, "phase": phase}
+            handle.write(
+                json.dumps(
+                    {"event": "start", "ts": start, "parent": parent, "attrs": attrs, **common}
+                )
+                + "\n"
+            )
+            handle.write(json.dumps({"event": "end", "ts": end, "ok": True, **common}) + "\n")
+    return path
+
+
+def test_a_span_writes_a_start_and_an_end_line(tmp_path):
+    log = events.EventLog(tmp_path / "e.jsonl", "test")
+    with log.span("NPL", "export", group="priority") as span:
+        span["rows"] = 3
+    start, end = lines(tmp_path / "e.jsonl")
+    assert (start["event"], end["event"]) == ("start", "end")
+    assert start["span"] == end["span"]
+    assert start["attrs"] == {"group": "priority"}
+    assert end["attrs"] == {"rows": 3}
+    assert end["ok"] is True
+    assert end["seconds"] >= 0
+
+
+def test_nested_spans_point_at_their_parent(tmp_path):
+    log = events.EventLog(tmp_path / "e.jsonl", "test")
+    with log.span("sweep", "sweep"), log.span("NPL", "export"):
+        pass
+    outer, inner = (line for line in lines(tmp_path / "e.jsonl") if line["event"] == "start")
+    assert outer["parent"] is None
+    assert inner["parent"] == outer["span"]
+
+
+def test_an_exception_ends_the_span_as_failed(tmp_path):
+    log = events.EventLog(tmp_path / "e.jsonl", "test")
+    with pytest.raises(RuntimeError), log.span("NPL", "export"):
+        raise RuntimeError("boom")
+    end = lines(tmp_path / "e.jsonl")[-1]
+    assert end["ok"] is False
+    assert "boom" in end["attrs"]["error"]
+
+
+def test_no_path_records_nothing(tmp_path):
+    with events.EventLog(None, "test").span("NPL", "export"):
+        pass
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_totals_count_leaves_only_so_nothing_is_counted_twice(tmp_path):
+    log = write_log(
+        tmp_path / "e.jsonl",
+        [
+            ("sweep", "sweep", 0, 10, None, {}),
+            ("a", "download", 0, 4, "sweep", {"group": "g"}),
+            ("b", "export", 4, 10, "sweep", {"group": "g"}),
+        ],
+    )
+    spans = events.load([log])
+    assert [s.name for s in spans if s.children == 0] == ["a", "b"]
+    report = events.summarise(spans)
+    assert "sweep " not in report.split("critical path:")[0].split("phase totals:")[1]
+    assert "utilisation 100.0%" in report
+
+
+def test_the_critical_path_follows_the_chain_that_ends_last():
+    spans = [
+        events.Span("a", "a", "download", "t", None, 0, 2),
+        events.Span("b", "b", "export", "t", None, 0, 8),
+        events.Span("c", "c", "export", "t", None, 2, 5),
+        events.Span("d", "d", "export", "t", None, 8, 9),
+    ]
+    assert [s.name for s in events.critical_path(spans)] == ["b", "d"]
+
+
+def test_concurrency_is_the_most_spans_open_at_once():
+    spans = [
+        events.Span("a", "a", "export", "t", None, 0, 4),
+        events.Span("b", "b", "export", "t", None, 1, 3),
+        events.Span("c", "c", "export", "t", None, 4, 5),
+    ]
+    assert events.max_concurrency(spans) == 2
+
+
+def test_a_span_that_never_ended_is_kept(tmp_path):
+    log = tmp_path / "e.jsonl"
+    log.write_text(
+        json.dumps({"event": "start", "ts": 1, "span": "x", "name": "x", "phase": "export"}) + "\n",
+        encoding="utf-8",
+    )
+    (span,) = events.load([log])
+    assert span.end is None
+    assert span.seconds == 0
@@ -0,0 +1,53 @@
+import metrics
+import pytest
+
+
+def test_samples_render_in_the_textfile_format():
+    m = metrics.Metrics(None)
+    m.declare("oex_jobs", "gauge", "Jobs by state.")
+    m.set("oex_jobs", 3, group="priority", state="queued")
+    assert m.render() == (
+        "# HELP oex_jobs Jobs by state.\n"
+        "# TYPE oex_jobs gauge\n"
+        'oex_jobs{group="priority",state="queued"} 3\n'
+    )
+
+
+def test_counters_accumulate_per_label_set():
+    m = metrics.Metrics(None)
+    m.declare("oex_done_total", "counter", "Done.")
+    m.inc("oex_done_total", outcome="ok")
+    m.inc("oex_done_total", 2, outcome="ok")
+    m.inc("oex_done_total", outcome="failed")
+    assert m.get("oex_done_total", outcome="ok") == 3
+    assert m.get("oex_done_total", outcome="failed") == 1
+
+
+def test_label_values_are_escaped():
+    m = metrics.Metrics(None)
+    m.declare("oex_job", "gauge", "A job.")
+    m.set("oex_job", 1.5, job='a"b\\c')
+    assert 'oex_job{job="a\\"b\\\\c"} 1.5' in m.render()
+
+
+def test_an_undeclared_metric_is_an_error():
+    with pytest.raises(KeyError):
+        metrics.Metrics(None).set("nope", 1)
+
+
+def test_the_file_is_replaced_whole_and_leaves_no_partial_behind(tmp_path):
+    m = metrics.Metrics(tmp_path / "out" / "sweep.prom")
+    m.declare("oex_up", "gauge", "Up.")
+    m.set("oex_up", 1)
+    m.write()
+    assert (tmp_path / "out" / "sweep.prom").read_text(encoding="utf-8").endswith("oex_up 1\n")
+    assert [p.name for p in (tmp_path / "out").iterdir()] == ["sweep.prom"]
+
+
+def test_timestamps_round_trip_and_tolerate_a_missing_or_corrupt_file(tmp_path):
+    path = tmp_path / "last_success.json"
+    assert metrics.load_timestamps(path) == {}
+    metrics.save_timestamps(path, {"priority/AFG": 1.0})
+    assert metrics.load_timestamps(path) == {"priority/AFG": 1.0}
+    path.write_text("{not json", encoding="utf-8")
+    assert metrics.load_timestamps(path) == {}
@@ -0,0 +1,115 @@
+import json
+from types import SimpleNamespace
+
+import oex.overture.runner
+import overture_cache
+import sweep
+import yaml
+from events import EventLog
+from oex.sources.base import SourceQuery
+
+EVENTS = sweep.REPO_ROOT / "configs" / "events"
+CARACAS = EVENTS / "VEN-EQ-2026-000093.yaml"
+EMERGENCY = EVENTS / "VEN-EQ-2026-000093-emergency.yaml"
+AOI = EVENTS / "VEN-EQ-2026-000093-overture.yaml"
+
+
+def released(config, release="2026-09-17.0"):
+    return {
+        name: overture_cache.replace(need, release=release)
+        for name, need in overture_cache.config_needs(config).items()
+    }
+
+
+def cache_entry(root, need):
+    path = need.path(root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"PAR1")
+    return path
+
+
+def test_one_pull_over_the_full_aoi_serves_the_smaller_configs(tmp_path):
+    needs = [need for c in (CARACAS, EMERGENCY, AOI) for need in released(c).values()]
+    planned = overture_cache.plan(needs, tmp_path)
+    assert sorted((n.theme, n.bbox) for n in planned) == sorted(
+        (n.theme, n.bbox) for n in released(AOI).values()
+    )
+    for need in planned:
+        cache_entry(tmp_path, need)
+    assert overture_cache.plan(needs, tmp_path) == []
+    assert overture_cache.lookup(tmp_path, released(CARACAS)["buildings"]) == (
+        released(AOI)["buildings"].path(tmp_path)
+    )
+
+
+def test_a_new_release_evicts_the_old_one(tmp_path):
+    old = cache_entry(tmp_path, released(CARACAS, "2026-08-20.0")["buildings"])
+    new = cache_entry(tmp_path, released(CARACAS)["buildings"])
+    assert overture_cache.evict(tmp_path, {"2026-09-17.0"}) == ["2026-08-20.0"]
+    assert new.exists() and not old.exists()
+    assert overture_cache.lookup(tmp_path, released(CARACAS, "2026-08-20.0")["buildings"]) is None
+
+
+def test_a_covered_category_reads_the_local_file(tmp_path, monkeypatch):
+    local = cache_entry(tmp_path, released(CARACAS)["buildings"])
+
+    def from_s3(self, cfg, category):
+        return SourceQuery(
+            source_expr="read_parquet('s3://overturemaps-us-west-2/...')",
+            select_fields=["id"],
+            where_conditions=[],
+            bbox_cols="bbox",
+            dataset_source=f"OvertureMap {self._release}",
+            source_url="https://overturemaps.org/",
+            source_description="",
+            snapshot_date=None,
+            snapshot_label=self._release,
+            extra_readme_lines=[],
+        )
+
+    monkeypatch.setattr(oex.overture.runner.OvertureRunner, "query_for", from_s3)
+    overture_cache.serve_from_cache(tmp_path, CARACAS)
+    runner = oex.overture.runner.OvertureRunner()
+    runner._release = "2026-09-17.0"
+    query = runner.query_for(None, SimpleNamespace(name="buildings"))
+    assert query.source_expr.startswith(f"read_parquet('{local}'")
+    runner._release = "2026-10-15.0"
+    query = runner.query_for(None, SimpleNamespace(name="buildings"))
+    assert query.source_expr.startswith("read_parquet('s3://")
+
+
+def test_the_sweep_routes_only_covered_overture_jobs_through_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(overture_cache, "default_root", lambda: tmp_path)
+    monkeypatch.setattr(overture_cache, "warm", lambda configs, root: ([], []))
+    cache_entry(tmp_path, released(CARACAS)["buildings"])
+    jobs = [
+        sweep.Job(
+            id="events/caracas", group="events", command="overture", config=CARACAS, iso3=None
+        ),
+        sweep.Job(id="events/aoi", group="events", command="overture", config=AOI, iso3=None),
+    ]
+    routed = sweep.warm_overture(jobs, EventLog(None, "sweep"))
+    assert [job.script for job in routed] == [sweep.OVERTURE_SCRIPT, None]
+    assert routed[0].argv()[:5] == ["uv", "run", "python", str(sweep.OVERTURE_SCRIPT), "overture"]
+
+
+def test_a_buffered_bbox_covers_the_one_oex_queries_near_the_pole(tmp_path):
+    from oex.boundary import Boundary, _buffered
+
+    svalbard = {"type": "Polygon", "coordinates": [[[15, 78], [16, 78], [16, 79], [15, 78]]]}
+    config = tmp_path / "SJM.yaml"
+    config.write_text(
+        yaml.safe_dump(
+            {
+                "boundary": {"geom": json.dumps(svalbard), "buffer_meters": 5000},
+                "source": {"overture": {"release": "2026-09-17.0"}},
+                "categories": [
+                    {"name": "buildings", "overture": {"theme": "b", "feature_type": "b"}}
+                ],
+            }
+        ),
+        encoding="utf-8",
+    )
+    need = overture_cache.config_needs(config)["buildings"]
+    oex_bbox = _buffered(Boundary("SJM", None, json.dumps(svalbard), "test"), 5000).bbox
+    assert overture_cache.contains(need.bbox, oex_bbox)
@@ -0,0 +1,100 @@
+import fcntl
+import os
+
+import pbf_store
+import pytest
+from upath import UPath
+
+
+def test_a_source_is_downloaded_once_for_every_view(tmp_path):
+    source = tmp_path / "remote" / "planet-latest.osm.pbf"
+    source.parent.mkdir()
+    source.write_bytes(b"planet" * 1000)
+    root = tmp_path / "store"
+    tm, sandbox = tmp_path / "tm" / "remote-planet.osm.pbf", tmp_path / "tm_sandbox" / "p.pbf"
+
+    assert pbf_store.fetch(source.as_uri(), tm, root)[1] == 6000
+    assert pbf_store.fetch(source.as_uri(), sandbox, root)[1] == 0
+    assert tm.samefile(sandbox)
+    assert tm.read_bytes() == source.read_bytes()
+    assert tm.stat().st_mode & 0o222 == 0
+    assert len(list((root / "objects").glob("*.osm.pbf"))) == 1
+
+
+def test_an_adopted_copy_becomes_a_link_and_an_unviewed_version_goes(tmp_path):
+    root = tmp_path / "store"
+    planet, copy = tmp_path / "osm" / "planet.osm.pbf", tmp_path / "tm" / "planet.osm.pbf"
+    for path in (planet, copy):
+        path.parent.mkdir()
+        path.write_bytes(b"week 1")
+    digest = pbf_store.adopt(planet, root)
+    assert pbf_store.adopt(copy, root) == digest
+    assert planet.samefile(copy) and pbf_store.stored(copy, root)
+
+    newer = tmp_path / "week2.osm.pbf"
+    newer.write_bytes(b"week 2")
+    pbf_store.fetch(newer.as_uri(), planet, root)
+    assert pbf_store.object_path(root, digest).exists()
+    pbf_store.fetch(newer.as_uri(), copy, root)
+    assert not pbf_store.object_path(root, digest).exists()
+    assert planet.samefile(copy) and copy.read_bytes() == b"week 2"
+
+
+def test_a_download_that_fails_its_checksum_is_not_kept(tmp_path):
+    source = tmp_path / "planet.osm.pbf"
+    source.write_bytes(b"truncated")
+    md5 = tmp_path / "planet.osm.pbf.md5"
+    md5.write_text("0" * 32 + "  planet.osm.pbf\n")
+    root = tmp_path / "store"
+    with pytest.raises(pbf_store.StoreError, match="md5"):
+        pbf_store.fetch(source.as_uri(), tmp_path / "view.pbf", root, md5.as_uri())
+    assert list((root / "objects").iterdir()) == []
+    assert not (tmp_path / "view.pbf").exists()
+
+
+def test_the_store_is_not_locked_while_a_source_downloads(tmp_path, monkeypatch):
+    source = tmp_path / "remote" / "planet-latest.osm.pbf"
+    source.parent.mkdir()
+    source.write_bytes(b"planet")
+    root = tmp_path / "store"
+    opened = UPath.open
+
+    def open_unlocked(self, *args, **kwargs):
+        with (root / ".lock").open("a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        return opened(self, *args, **kwargs)
+
+    monkeypatch.setattr(UPath, "open", open_unlocked)
+    assert pbf_store.fetch(source.as_uri(), tmp_path / "view.pbf", root)[1] == 6
+
+
+def test_an_adopted_copy_keeps_its_mtime(tmp_path, monkeypatch):
+    planet = tmp_path / "planet.osm.pbf"
+    planet.write_bytes(b"week 1")
+    os.utime(planet, (1_780_000_000, 1_780_000_000))
+
+    def cross_device(*args):
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(pbf_store.os, "link", cross_device)
+    digest = pbf_store.adopt(planet, tmp_path / "store")
+    obj = pbf_store.object_path(tmp_path / "store", digest)
+    assert obj.stat().st_mtime == 1_780_000_000
+
+
+def test_the_store_is_not_locked_while_a_file_is_adopted(tmp_path, monkeypatch):
+    planet = tmp_path / "planet.osm.pbf"
+    planet.write_bytes(b"week 1")
+    root = tmp_path / "store"
+    hashed = pbf_store.hash_file
+
+    def hash_unlocked(path):
+        with (root / ".lock").open("a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        return hashed(path)
+
+    monkeypatch.setattr(pbf_store, "hash_file", hash_unlocked)
+    digest = pbf_store.adopt(planet, root)
+    assert planet.samefile(pbf_store.object_path(root, digest))
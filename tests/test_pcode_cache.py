@@ -0,0 +1,121 @@
+import json
+
+import oex.pcodes
+import oex.pcodes.cache
+import pcode_cache
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sweep
+import yaml
+from oex.pcodes import PcodeCacheEntry
+
+LEVELS = [1, 2, 3, 4]
+DATE = "2026-09-01"
+
+
+def shared_cache(tmp_path, date=DATE):
+    """A stand-in for the fieldmaps files: two countries per level, GeoParquet metadata
+    and all, with the meta.json oex writes next to them."""
+    cache_dir = tmp_path / "data" / "pcodes"
+    cache_dir.mkdir(parents=True)
+    entries, levels = {}, {}
+    for level in LEVELS:
+        table = pa.table(
+            {
+                "iso_3": ["NPL", "NPL", "SDN"],
+                f"adm{level}_src": [f"NP{level}1", f"NP{level}2", f"SD{level}1"],
+                "geometry": [b"\x01", b"\x02", b"\x03"],
+            }
+        ).replace_schema_metadata({b"geo": b'{"primary_column": "geometry"}'})
+        path = cache_dir / f"adm{level}_polygons.parquet"
+        pq.write_table(table, path)
+        url = f"https://example.org/adm{level}_polygons.parquet"
+        entries[level] = PcodeCacheEntry(level, path, date, url)
+        levels[str(level)] = {"date": date, "url": url, "path": str(path)}
+    meta = {"levels": levels, "manifest_url": "https://example.org/m.json", "manifest_group": "h"}
+    (cache_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    return cache_dir, entries
+
+
+def test_a_slice_keeps_only_the_country_and_the_file_metadata(tmp_path):
+    cache_dir, entries = shared_cache(tmp_path)
+    assert not pcode_cache.is_warm(cache_dir, "NPL", LEVELS)
+
+    pcode_cache.build_country(entries, "npl", cache_dir)
+    sliced = pq.read_table(pcode_cache.country_dir(cache_dir, "NPL") / "adm2_polygons.parquet")
+    assert sliced.column("adm2_src").to_pylist() == ["NP21", "NP22"]
+    assert sliced.schema.metadata[b"geo"] == b'{"primary_column": "geometry"}'
+    assert pcode_cache.is_warm(cache_dir, "NPL", LEVELS)
+    assert not pcode_cache.is_warm(cache_dir, "SDN", LEVELS)
+
+
+def test_oex_reads_a_warm_slice_without_downloading(tmp_path, monkeypatch):
+    cache_dir, entries = shared_cache(tmp_path)
+    pcode_cache.build_country(entries, "NPL", cache_dir)
+    manifest = [{"grp": "h", "adm": level, "date": DATE} for level in LEVELS]
+    monkeypatch.setattr(oex.pcodes.cache, "_fetch_manifest", lambda url: manifest)
+    monkeypatch.setattr(oex.pcodes.cache, "_atomic_download", lambda *a, **k: 1 / 0)
+
+    found = oex.pcodes.ensure_admin_parquets(
+        cache_dir=pcode_cache.country_dir(cache_dir, "NPL"),
+        levels=LEVELS,
+        manifest_url="https://example.org/m.json",
+        parquet_url_template="https://example.org/adm{level}_polygons.parquet",
+        manifest_group="h",
+    )
+    assert found[3].path.parent == pcode_cache.country_dir(cache_dir, "NPL")
+
+
+def test_a_new_release_makes_the_slices_stale(tmp_path):
+    cache_dir, entries = shared_cache(tmp_path)
+    pcode_cache.build_country(entries, "NPL", cache_dir)
+    meta = json.loads((cache_dir / "meta.json").read_text(encoding="utf-8"))
+    meta["levels"]["4"]["date"] = "2026-10-01"
+    (cache_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    assert not pcode_cache.is_warm(cache_dir, "NPL", LEVELS)
+    assert pcode_cache.is_warm(cache_dir, "NPL", [1, 2, 3])
+
+
+def test_warm_slices_only_the_countries_that_are_not_warm(tmp_path, monkeypatch):
+    cache_dir, entries = shared_cache(tmp_path)
+    pcode_cache.build_country(entries, "NPL", cache_dir)
+    monkeypatch.setattr(oex.pcodes, "ensure_admin_parquets", lambda **kwargs: entries)
+    settings = oex.pcodes.resolve_pcodes_config(
+        {"pcodes": {"enabled": True, "cache_dir": str(cache_dir), "levels": LEVELS}}
+    )
+    built, failed = pcode_cache.warm(settings, ["NPL", "SDN", "sdn"])
+    assert (built, failed) == (["SDN"], [])
+
+
+def listed(date):
+    return {("humanitarian", level): date for level in LEVELS}
+
+
+def test_the_merged_config_points_a_current_country_at_its_slice(tmp_path, monkeypatch):
+    cache_dir, entries = shared_cache(tmp_path)
+    pcode_cache.build_country(entries, "NPL", cache_dir)
+    monkeypatch.setattr(pcode_cache, "manifest_dates", lambda url: listed(DATE))
+    monkeypatch.setenv("OEX_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(sweep, "COUNTRY_CONFIG_DIR", tmp_path / "countries")
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+
+    warm = yaml.safe_load(sweep.country_config("NPL", "weekly").read_text(encoding="utf-8"))
+    cold = yaml.safe_load(sweep.country_config("SDN", "weekly").read_text(encoding="utf-8"))
+    base = yaml.safe_load(sweep.BASE_CONFIG.read_text(encoding="utf-8"))
+    assert warm["source"]["pcodes"]["cache_dir"] == (
+        base["source"]["pcodes"]["cache_dir"] + "/countries/NPL"
+    )
+    assert cold["source"]["pcodes"]["cache_dir"] == base["source"]["pcodes"]["cache_dir"]
+
+
+def test_a_slice_behind_the_manifest_leaves_the_shared_files(tmp_path, monkeypatch):
+    cache_dir, entries = shared_cache(tmp_path)
+    pcode_cache.build_country(entries, "NPL", cache_dir)
+    settings = oex.pcodes.resolve_pcodes_config({"pcodes": {"enabled": True, "levels": LEVELS}})
+    monkeypatch.setattr(pcode_cache, "manifest_dates", lambda url: listed(DATE))
+    assert pcode_cache.is_current(cache_dir, "NPL", settings)
+    # Published after the warm-up: oex would download the world's files into the slice.
+    monkeypatch.setattr(pcode_cache, "manifest_dates", lambda url: listed("2026-10-01"))
+    assert not pcode_cache.is_current(cache_dir, "NPL", settings)
+    monkeypatch.setattr(pcode_cache, "manifest_dates", lambda url: None)
+    assert not pcode_cache.is_current(cache_dir, "NPL", settings)
@@ -0,0 +1,99 @@
+import preflight
+import pytest
+from oex.config.loader import load_config
+
+SQUARE = '{"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}'
+
+
+def write_config(tmp_path, geom=SQUARE, pbf_path=None):
+    pbf_path = pbf_path or tmp_path / "missing.osm.pbf"
+    text = f"""
+iso3: NPL
+boundary:
+  geom: '{geom}'
+output:
+  dir: {tmp_path}/output
+duckdb:
+  temp_dir: {tmp_path}/duckdb
+source:
+  overture:
+    enabled: false
+  osm:
+    enabled: true
+    engine: planet
+    cache_dir: {tmp_path}/osm
+    pbf_path: {pbf_path}
+    auto_download_planet: false
+categories:
+  - name: roads
+    osm:
+      filter: {{highway: true}}
+      select: [feature_id AS id]
+"""
+    path = tmp_path / "NPL.yaml"
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def test_a_sound_config_has_no_problems(tmp_path):
+    pbf = tmp_path / "npl.osm.pbf"
+    pbf.write_bytes(b"x" * 10)
+    assert preflight.check(write_config(tmp_path, pbf_path=pbf), "NPL") == []
+
+
+def test_an_unset_env_var_is_reported_before_anything_else(tmp_path, monkeypatch):
+    monkeypatch.delenv("PREFLIGHT_TEST_BUCKET", raising=False)
+    config = write_config(tmp_path)
+    text = config.read_text(encoding="utf-8")
+    bucket = "output:\n  s3:\n    bucket: ${oc.env:PREFLIGHT_TEST_BUCKET}\n"
+    config.write_text(text.replace("output:\n", bucket), encoding="utf-8")
+    (problem,) = preflight.check(config, "NPL")
+    assert "config does not load" in problem and "PREFLIGHT_TEST_BUCKET" in problem
+
+
+def test_a_missing_planet_pbf_and_a_broken_geometry_are_both_reported(tmp_path):
+    problems = preflight.check(write_config(tmp_path, geom="{not json"), "NPL")
+    assert any("does not exist" in problem for problem in problems)
+    assert any("boundary.geom" in problem for problem in problems)
+
+
+def test_a_disk_smaller_than_the_export_is_a_problem(tmp_path):
+    cfg = load_config(write_config(tmp_path))
+    assert preflight.check_disk(cfg, None) == []
+    assert preflight.check_disk(cfg, 1) == []
+    (problem,) = preflight.check_disk(cfg, 10**18)
+    assert "GiB free" in problem
+
+
+def test_a_config_shared_by_two_jobs_is_checked_once(tmp_path, monkeypatch):
+    calls = []
+
+    def check(config, iso3):
+        calls.append((config, iso3))
+        return ["broken"] if iso3 == "SDN" else []
+
+    monkeypatch.setattr(preflight, "check", check)
+    found = preflight.run(
+        [
+            ("events/a:osm", tmp_path / "a.yaml", None),
+            ("events/a:overture", tmp_path / "a.yaml", None),
+            ("priority/SDN", tmp_path / "SDN.yaml", "SDN"),
+        ]
+    )
+    assert found == {"events/a:osm": [], "events/a:overture": [], "priority/SDN": ["broken"]}
+    assert len(calls) == 2
+
+
+def test_a_check_that_crashes_is_reported_as_a_problem(tmp_path, monkeypatch):
+    def check(config, iso3):
+        raise OSError("boom")
+
+    monkeypatch.setattr(preflight, "check", check)
+    (problem,) = preflight.run([("a", tmp_path / "a.yaml", None)])["a"]
+    assert "boom" in problem
+
+
+@pytest.mark.parametrize("geom", ["world", SQUARE])
+def test_an_inline_boundary_needs_no_network(tmp_path, geom):
+    cfg = load_config(write_config(tmp_path, geom=geom))
+    assert preflight.check_boundary(cfg, "NPL") == []
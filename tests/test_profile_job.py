@@ -0,0 +1,25 @@
+import json
+
+import duckdb
+import oex.exporter
+import profile_job
+
+
+def test_each_statement_of_the_main_query_gets_its_own_duckdb_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(oex.exporter, "materialise", oex.exporter.materialise)
+    profile_job.enable_duckdb_profiling(tmp_path)
+    conn = duckdb.connect()
+    count = oex.exporter.materialise(conn, "roads", "range(10)", "range AS x", "x < 4")
+    assert count == 4
+    created = json.loads((tmp_path / "duckdb-roads-1.json").read_text(encoding="utf-8"))
+    assert created["query_name"].strip().startswith("CREATE OR REPLACE TABLE roads")
+
+
+def test_profiling_is_switched_off_after_the_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(oex.exporter, "materialise", oex.exporter.materialise)
+    profile_job.enable_duckdb_profiling(tmp_path)
+    conn = duckdb.connect()
+    oex.exporter.materialise(conn, "roads", "range(10)", "range AS x", "true")
+    before = sorted(p.name for p in tmp_path.iterdir())
+    conn.execute("SELECT 42").fetchall()
+    assert sorted(p.name for p in tmp_path.iterdir()) == before
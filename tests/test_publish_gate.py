@@ -0,0 +1,113 @@
+import json
+import sqlite3
+import zipfile
+
+import publish_gate
+import yaml
+
+
+def shp_zip(path, features=b"features", readme="built today", dbf_date=b"\x7e\x08\x05"):
+    with zipfile.ZipFile(path, "w") as bundle:
+        bundle.writestr("roads.shp", b"shp:" + features)
+        bundle.writestr("roads.dbf", b"\x03" + dbf_date + b"header" + features)
+        bundle.writestr("README.txt", readme)
+        bundle.writestr("metadata.json", json.dumps({"properties": {"table:row_count": 2}}))
+    return path
+
+
+def gpkg_zip(tmp_path, name, rows, last_change):
+    gpkg = tmp_path / f"{name}.gpkg"
+    conn = sqlite3.connect(gpkg)
+    conn.execute("CREATE TABLE gpkg_contents (table_name TEXT, data_type TEXT, last_change TEXT)")
+    conn.execute("INSERT INTO gpkg_contents VALUES ('roads', 'features', ?)", (last_change,))
+    conn.execute("CREATE TABLE roads (fid INTEGER PRIMARY KEY, geom BLOB, name TEXT)")
+    conn.executemany("INSERT INTO roads VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    path = tmp_path / f"{name}.zip"
+    with zipfile.ZipFile(path, "w") as bundle:
+        bundle.write(gpkg, arcname="roads.gpkg")
+    return path
+
+
+def test_a_rebuild_of_the_same_features_digests_the_same(tmp_path):
+    first = shp_zip(tmp_path / "a.zip")
+    again = shp_zip(tmp_path / "b.zip", readme="built next month", dbf_date=b"\x7e\x09\x05")
+    edited = shp_zip(tmp_path / "c.zip", features=b"features, one renamed")
+    assert publish_gate.artifact_digest(first) == publish_gate.artifact_digest(again)
+    assert publish_gate.artifact_digest(first) != publish_gate.artifact_digest(edited)
+    assert publish_gate.feature_count(first) == 2
+
+
+def test_a_geopackage_is_digested_by_its_rows(tmp_path):
+    rows = [(1, b"\x01", "Ring Road"), (2, b"\x02", None)]
+    first = gpkg_zip(tmp_path, "a", rows, "2026-09-01T00:00:00Z")
+    again = gpkg_zip(tmp_path, "b", rows, "2026-10-01T00:00:00Z")
+    edited = gpkg_zip(tmp_path, "c", [*rows[:1], (2, b"\x02", "Araniko")], "2026-10-01")
+    assert publish_gate.artifact_digest(first) == publish_gate.artifact_digest(again)
+    assert publish_gate.artifact_digest(first) != publish_gate.artifact_digest(edited)
+
+
+def built_state(out_root, zips):
+    out_root.mkdir(parents=True)
+    categories = {
+        slug: {
+            "snapshot_label": "260901",
+            "built_utc": "2026-09-02T00:00:00Z",
+            "zip_paths": [str(path)],
+            "metadata_json_path": None,
+            "uploaded_utc": None,
+            "hdx_dataset": None,
+        }
+        for slug, path in zips.items()
+    }
+    state = {"schema_version": 1, "iso3": "BVT", "source": "osm", "categories": categories}
+    (out_root / ".state.json").write_text(json.dumps(state), encoding="utf-8")
+
+
+def test_only_changed_categories_are_left_to_publish(tmp_path):
+    out_root = tmp_path / "output" / "bvt" / "osm"
+    roads = shp_zip(tmp_path / "roads.zip")
+    water = shp_zip(tmp_path / "water.zip", features=b"new lake")
+    built_state(out_root, {"roads": roads, "water": water})
+    (tmp_path / "last").mkdir()
+    last = publish_gate.category_record([str(shp_zip(tmp_path / "last" / "roads.zip"))])
+    manifest = {"roads": {**last, "hdx_dataset": "hotosm_bvt_roads"}}
+    (out_root / publish_gate.MANIFEST_NAME).write_text(json.dumps(manifest), encoding="utf-8")
+
+    changed, unchanged = publish_gate.gate(out_root, "BVT", "osm", remove_after_upload=True)
+    assert (list(changed), unchanged) == (["water"], ["roads"])
+    state = json.loads((out_root / ".state.json").read_text(encoding="utf-8"))
+    assert state["categories"]["roads"]["hdx_dataset"] == "hotosm_bvt_roads"
+    assert state["categories"]["roads"]["uploaded_utc"]
+    assert state["categories"]["water"]["uploaded_utc"] is None
+    assert not roads.exists() and water.exists()
+
+
+def test_the_manifest_records_what_the_publish_uploaded(tmp_path):
+    out_root = tmp_path / "output" / "bvt" / "osm"
+    built_state(out_root, {"water": shp_zip(tmp_path / "water.zip")})
+    changed, _ = publish_gate.gate(out_root, "BVT", "osm", remove_after_upload=False)
+    publish_gate.record_published(out_root, changed)
+    assert json.loads((out_root / publish_gate.MANIFEST_NAME).read_text(encoding="utf-8")) == {}
+
+    state = json.loads((out_root / ".state.json").read_text(encoding="utf-8"))
+    state["categories"]["water"].update(uploaded_utc="2026-09-02T01:00:00Z", hdx_dataset="w")
+    (out_root / ".state.json").write_text(json.dumps(state), encoding="utf-8")
+    publish_gate.record_published(out_root, changed)
+    manifest = json.loads((out_root / publish_gate.MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert manifest["water"]["digest"] == changed["water"]["digest"]
+    assert manifest["water"]["hdx_dataset"] == "w"
+
+
+def test_the_publish_runs_at_the_snapshot_the_build_used(tmp_path):
+    out_root = tmp_path / "output" / "bvt" / "osm"
+    built_state(out_root, {"water": shp_zip(tmp_path / "water.zip")})
+    assert publish_gate.built_snapshot(out_root, ["water"]) == "260901"
+
+    config = tmp_path / "BVT.yaml"
+    config.write_text("iso3: BVT\nsource:\n  osm:\n    snapshot: latest\n", encoding="utf-8")
+    pinned = publish_gate.pinned_config(config, "osm", "260901")
+    raw = yaml.safe_load(pinned.read_text(encoding="utf-8"))
+    assert raw == {"iso3": "BVT", "source": {"osm": {"snapshot": "260901"}}}
+    assert "latest" in config.read_text(encoding="utf-8")
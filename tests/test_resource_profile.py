@@ -0,0 +1,106 @@
+import zlib
+
+import pbf
+import resource_profile
+import sweep
+import yaml
+from events import EventLog
+
+GB = 1024**3
+
+
+def field(number, payload):
+    """A length-delimited protobuf field; every length here fits two varint bytes."""
+    size = len(payload)
+    length = bytes([size]) if size < 0x80 else bytes([(size & 0x7F) | 0x80, size >> 7])
+    return bytes([number << 3 | 2]) + length + payload
+
+
+def write_pbf(path, *groups):
+    """A PBF of one header blob and a zlib data blob per group kind (2 dense, 3 ways),
+    each behind a string table longer than one read."""
+    framed = []
+    for kind, block in [(b"OSMHeader", b"header")] + [
+        (b"OSMData", field(1, field(1, b"x" * 9000)) + field(2, field(number, b"\x00")))
+        for number in groups
+    ]:
+        blob = bytes([0x10]) + bytes([len(block) & 0x7F | 0x80, len(block) >> 7])
+        blob += field(3, zlib.compress(block))
+        header = field(1, kind) + bytes([0x18, len(blob) & 0x7F | 0x80, len(blob) >> 7])
+        framed.append(len(header).to_bytes(4, "big") + header + blob)
+    path.write_bytes(b"".join(framed))
+    return path
+
+
+def test_blocks_are_counted_by_what_their_first_group_holds(tmp_path):
+    stats = pbf.stats(write_pbf(tmp_path / "npl.osm.pbf", 2, 2, 3))
+    assert (stats["nodes"], stats["ways"], stats["relations"]) == (16000, 8000, 0)
+    assert stats["other_blocks"] == 0
+
+
+def test_a_country_over_the_cap_is_flagged_and_gets_fewer_threads():
+    big = resource_profile.profile({"nodes": 500_000_000, "ways": 60_000_000}, 64, 16)
+    assert (big.memory_gb, big.threads, big.heavy) == (44, 12, True)
+    assert "belongs in heavy" in resource_profile.placement("normal", "IDN", big)
+    small = resource_profile.profile({"nodes": 8_000_000, "ways": 1_000_000}, 64, 16)
+    assert (small.memory_gb, small.threads, small.heavy) == (3, 16, False)
+    assert resource_profile.placement("normal", "NPL", small) is None
+    assert "need not be in heavy" in resource_profile.placement("heavy", "NPL", small)
+
+
+def test_the_merged_config_takes_parallel_from_a_measured_peak(tmp_path, monkeypatch):
+    monkeypatch.setenv("OEX_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    monkeypatch.setattr(sweep, "COUNTRY_CONFIG_DIR", tmp_path / "countries")
+    monkeypatch.setattr(resource_profile, "default_stats_file", lambda: tmp_path / "stats.json")
+    (tmp_path / "countries").mkdir()
+    (tmp_path / "countries" / "SDN.yaml").write_text("parallel:\n  memory_gb: 12\n", "utf-8")
+    for iso3 in ("npl", "sdn"):
+        pbf_dir = tmp_path / "data" / "osm" / "geofabrik" / iso3 / "_pbf"
+        pbf_dir.mkdir(parents=True)
+        write_pbf(pbf_dir / f"{iso3}-latest.osm.pbf", 2, 3)
+
+    merged = yaml.safe_load(sweep.country_config("NPL", "monthly", dry_run=True).read_text("utf-8"))
+    assert "memory_gb" not in merged["parallel"]
+    assert resource_profile.load(tmp_path / "stats.json") == {}
+
+    merged = yaml.safe_load(sweep.country_config("NPL", "monthly").read_text("utf-8"))
+    assert "memory_gb" not in merged["parallel"] and "threads" not in merged["parallel"]
+    merged = yaml.safe_load(sweep.country_config("SDN", "monthly").read_text("utf-8"))
+    assert merged["parallel"]["memory_gb"] == 12
+    assert set(resource_profile.load(tmp_path / "stats.json")) == {"NPL", "SDN"}
+
+    resource_profile.record_peaks(tmp_path / "stats.json", {"NPL": 4 * GB, "SDN": 30 * GB})
+    monkeypatch.setattr(sweep, "host_memory_gb", lambda: 64)
+    merged = yaml.safe_load(sweep.country_config("NPL", "monthly").read_text("utf-8"))
+    assert merged["parallel"]["memory_gb"] == 5 and merged["parallel"]["threads"] >= 1
+    merged = yaml.safe_load(sweep.country_config("SDN", "monthly").read_text("utf-8"))
+    assert merged["parallel"] == {"enabled": True, "memory_gb": 12}
+
+
+def test_the_peaks_come_from_whole_osm_exports(tmp_path):
+    log = EventLog(tmp_path / "sweep-1.jsonl", "sweep")
+    for name, command, iso3, parent, peak in [
+        ("priority/NPL", "osm", "NPL", None, 4 * GB),
+        ("priority/NPL/overture", "overture", "NPL", None, 9 * GB),
+        ("heavy/IND/shard-1", "osm", "IND", "heavy/IND", 20 * GB),
+    ]:
+        span = log.start(name, "export", command=command, iso3=iso3, parent=parent)
+        log.end(span, peak_rss=peak)
+    assert resource_profile.peaks([log.path]) == {"NPL": 4 * GB}
+
+
+def test_the_constants_are_fitted_once_enough_countries_have_a_peak():
+    stats = {
+        f"C{n}": {"nodes": n * 10_000_000, "ways": 0, "peak_rss": int((1 + 0.2 * n * 10) * GB)}
+        for n in range(1, 5)
+    }
+    assert resource_profile.calibrate(stats) == (
+        resource_profile.MEMORY_FLOOR_GB,
+        resource_profile.GB_PER_MILLION,
+    )
+    stats["C5"] = {"nodes": 50_000_000, "ways": 0, "peak_rss": 11 * GB}
+    floor, per_million = resource_profile.calibrate(stats)
+    assert round(floor, 3) == 1.25 and round(per_million, 3) == 0.25
+    unmeasured = resource_profile.profile({"nodes": 20_000_000}, 64, 16, (floor, per_million))
+    assert (unmeasured.memory_gb, unmeasured.measured) == (7, False)
@@ -0,0 +1,83 @@
+import subprocess
+import sys
+from dataclasses import replace
+
+import pytest
+import simulate
+import sweep
+from events import EventLog
+
+GB = 1024**3
+
+
+def job(job_id, frequency="monthly", parent=None, stage=0):
+    return sweep.Job(
+        id=job_id,
+        group=job_id.split("/")[0],
+        command="osm",
+        config=sweep.BASE_CONFIG,
+        iso3=None,
+        parent=parent,
+        stage=stage,
+        frequency=frequency,
+    )
+
+
+def test_history_keeps_the_latest_success_and_falls_back_to_the_group(tmp_path):
+    for name, peak_rss, ok in (("older", 1 * GB, True), ("newer", 3 * GB, True), ("x", GB, False)):
+        log = EventLog(tmp_path / f"sweep-{name}.jsonl", "sweep")
+        log.end(log.start("priority/NPL", "export", group="priority"), ok=ok, peak_rss=peak_rss)
+    logs = [tmp_path / f"sweep-{name}.jsonl" for name in ("older", "newer", "x")]
+    cost = simulate.history_model(simulate.history(logs))
+    assert cost(job("priority/NPL")).peak_rss == 3 * GB
+    assert cost(job("priority/SDN")).peak_rss == 3 * GB
+    assert cost(job("heavy/USA")) == simulate.Cost(simulate.DEFAULT_SECONDS, simulate.DEFAULT_RSS)
+
+
+def test_concurrency_is_held_back_by_memory_and_misses_are_reported():
+    jobs = [job("normal/A", "daily"), job("normal/B", "daily"), job("normal/C", "daily")]
+    costs = {
+        "normal/A": simulate.Cost(20 * 3600, 6 * GB),
+        "normal/B": simulate.Cost(10 * 3600, 6 * GB),
+        "normal/C": simulate.Cost(2 * 3600, 1 * GB),
+    }
+    units = sweep.units(jobs)
+    makespan, peak_rss, _, missed = simulate.replay(units, costs, 1, 16 * GB)
+    assert (makespan, peak_rss, missed) == (32 * 3600, 6 * GB, ["normal/B", "normal/C"])
+    makespan, peak_rss, idle, missed = simulate.replay(units, costs, 3, 16 * GB)
+    assert (makespan, peak_rss, missed) == (20 * 3600, 13 * GB, [])
+    assert idle == pytest.approx(1 - 32 / 60)
+    makespan, peak_rss, _, missed = simulate.replay(units, costs, 3, 8 * GB)
+    assert (makespan, peak_rss, missed) == (30 * 3600, 7 * GB, ["normal/B"])
+
+
+def test_a_unit_runs_its_stages_in_order_and_its_stage_side_by_side():
+    unit = [
+        job("heavy/USA/1of3", parent="heavy/USA"),
+        job("heavy/USA/2of3", parent="heavy/USA", stage=1),
+        job("heavy/USA/3of3", parent="heavy/USA", stage=1),
+    ]
+    costs = {j.id: simulate.Cost(3600, 2 * GB) for j in unit}
+    (outcome,) = simulate.simulate(
+        sweep.units(unit), lambda j: costs[j.id], [1], ["schedule"], 64 * GB
+    )
+    assert (outcome.makespan, outcome.peak_rss) == (7200, 4 * GB)
+
+
+def test_the_fake_cli_holds_its_memory_for_its_time():
+    process = subprocess.Popen(
+        [sys.executable, str(sweep.FAKE_SCRIPT), "osm", "--config", "x.yaml"],
+        env={"FAKE_OEX_SECONDS": "0.2", "FAKE_OEX_RSS": str(64 * 1024**2), "FAKE_OEX_EXIT": "3"},
+        stdout=subprocess.DEVNULL,
+    )
+    returncode, peak_rss = sweep.wait_with_usage(process, 30)
+    assert returncode == 3
+    assert peak_rss >= 64 * 1024**2
+
+
+def test_a_fake_run_leaves_the_real_work_dirs_alone(tmp_path):
+    extract = tmp_path / "_pbf"
+    real = replace(job("NPL/osm:0", parent="NPL/osm"), cleanup=(extract,))
+    (faked,) = simulate.fake_jobs([real], lambda j: simulate.Cost(1, 0), sweep.FAKE_SCRIPT, 1, 1)
+    assert faked.cleanup == ()
+    assert dict(faked.env)["FAKE_OEX_SECONDS"] == "1.000"
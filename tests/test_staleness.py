@@ -0,0 +1,67 @@
+import json
+
+import staleness
+import sweep
+from simulate import DAY
+
+NOW = 1_800_000_000.0
+RANKS = {"priority": 0, "normal": 1, "heavy": 2}
+
+
+def job(job_id, frequency="monthly", iso3=None, parent=None):
+    return sweep.Job(
+        id=job_id,
+        group=job_id.split("/")[0],
+        command="osm",
+        config=sweep.BASE_CONFIG,
+        iso3=iso3,
+        parent=parent,
+        frequency=frequency,
+    )
+
+
+def ids(ordered):
+    return [unit[0].parent or unit[0].id for unit, _ in ordered]
+
+
+def test_the_most_overdue_go_first_weighted_by_group():
+    units = [[job("priority/NPL")], [job("normal/SDN")], [job("normal/KEN", "weekly")]]
+    stamps = {
+        "priority/NPL": NOW - 28 * DAY,  # 1 period, weight 1
+        "normal/SDN": NOW - 84 * DAY,  # 3 periods, weight 1/2
+        "normal/KEN": NOW - 7 * DAY,  # 1 period, weight 1/2
+    }
+    ordered = staleness.order(units, stamps, RANKS, now=NOW)
+    assert ids(ordered) == ["normal/SDN", "priority/NPL", "normal/KEN"]
+    assert [periods for _, periods in ordered] == [3.0, 1.0, 1.0]
+
+
+def test_never_run_goes_first_and_as_needed_last_in_schedule_order():
+    units = [
+        [job("priority/NPL", "as needed")],
+        [job("normal/SDN")],
+        [job("heavy/USA/1of2", parent="heavy/USA"), job("heavy/USA/2of2", parent="heavy/USA")],
+        [job("normal/KEN")],
+    ]
+    # One shard of USA never succeeded, so the country has not.
+    stamps = {"normal/SDN": NOW - 56 * DAY, "heavy/USA/1of2": NOW}
+    ordered = staleness.order(units, stamps, RANKS, now=NOW)
+    assert ids(ordered) == ["heavy/USA", "normal/KEN", "normal/SDN", "priority/NPL"]
+
+
+def test_the_later_of_hdx_and_the_journals_counts(tmp_path):
+    for name, stamp in (("a", NOW - 10 * DAY), ("b", NOW - 2 * DAY)):
+        (tmp_path / f"{name}.json").write_text(json.dumps({"normal/SDN": stamp}))
+    stamps = staleness.last_successes([tmp_path / "a.json", tmp_path / "b.json"])
+    assert stamps == {"normal/SDN": NOW - 2 * DAY}
+    units = [
+        [job("normal/SDN", iso3="SDN")],
+        [job("normal/KEN", iso3="KEN")],
+        [job("normal/UGA", iso3="UGA")],
+    ]
+    # KEN was rebuilt unchanged, so not pushed: HDX's date is older than the sweep's.
+    stamps["normal/KEN"] = NOW - DAY
+    countries = {"KEN": NOW - 28 * DAY, "SDN": NOW - 14 * DAY, "UGA": NOW - 7 * DAY}
+    ordered = staleness.order(units, stamps, RANKS, countries, now=NOW)
+    assert ids(ordered) == ["normal/UGA", "normal/SDN", "normal/KEN"]
+    assert [round(periods * 28) for _, periods in ordered] == [7, 2, 1]
@@ -1,7 +1,13 @@
+import argparse
+import os
+import signal
+import subprocess
 from datetime import date
+from pathlib import Path
 
 import pytest
 import sweep
+import watchdog
 import yaml
 from oex.config.loader import load_config
 
@@ -95,6 +101,16 @@ def test_manual_jobs_run_when_asked_for_by_name():
     assert [job.iso3 for job in jobs] == ["NPL"]
 
 
+def test_only_the_countries_about_to_run_are_due(tmp_path):
+    schedule = countries_schedule({"NPL": "daily", "SDN": "monthly", "HTI": "disabled"})
+    schedule["priority"]["countries"]["HTI"] = {"frequency": "daily", "enabled": False}
+    schedule["groups"].append("tasking_manager")
+    schedule["tasking_manager"] = {"dir": str(tmp_path), "frequency": "daily"}
+    assert sweep.due_countries(schedule, None, "daily", TODAY) == ["NPL"]
+    assert sweep.due_countries(schedule, None, None, TODAY) == ["NPL", "SDN"]
+    assert sweep.due_countries(schedule, "tasking_manager", None, TODAY) == []
+
+
 def test_a_job_without_a_frequency_anywhere_is_an_error():
     with pytest.raises(sweep.ScheduleError):
         resolve(countries_schedule({"NPL": {"enabled": True}}))
@@ -259,13 +275,23 @@ def test_a_merged_country_config_loads_the_same_way_base_does(tmp_path, monkeypa
 
 
 class StubJob:
-    def __init__(self, job_id, argv):
+    def __init__(self, job_id, argv, group="test", parent=None, cleanup=(), stage=0):
         self.id = job_id
+        self.group = group
+        self.command = "osm"
+        self.iso3 = None
+        self.profile_dir = None
+        self.parent = parent
+        self.stage = stage
+        self.cleanup = cleanup
         self._argv = argv
 
     def argv(self):
         return self._argv
 
+    def environ(self):
+        return None
+
 
 def test_a_failing_job_is_reported_and_the_sweep_continues(capsys):
     jobs = [StubJob("a", ["false"]), StubJob("b", ["true"])]
@@ -278,6 +304,146 @@ def test_a_job_that_overruns_its_timeout_is_a_failure(capsys):
     assert "TIMEOUT" in capsys.readouterr().err
 
 
+def test_the_time_a_job_spends_paused_does_not_count_towards_its_timeout():
+    class Paused(sweep.Supervisor):
+        def paused_seconds(self, pgid):
+            return 5.0
+
+    process = subprocess.Popen(["sleep", "1.5"], start_new_session=True)
+    (outcome,) = sweep.wait_all([process], 1, Paused())
+    assert outcome[:2] == (0, 0)
+
+
+def running(pid_file):
+    stat = Path(f"/proc/{pid_file.read_text().strip()}/stat")
+    return stat.exists() and stat.read_text().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+
+
+def test_a_timed_out_job_is_ended_with_everything_it_started(tmp_path):
+    pid_file = tmp_path / "pid"
+    job = StubJob("slow", ["sh", "-c", f"sleep 60 & echo $! > {pid_file}; wait"])
+    assert sweep.run_jobs([job], timeout=1) == ["slow"]
+    assert not running(pid_file)
+
+
+def test_what_a_job_leaves_behind_is_ended_before_the_next_starts(tmp_path):
+    pid_file = tmp_path / "pid"
+    job = StubJob("leaky", ["sh", "-c", f"sleep 60 & echo $! > {pid_file}"])
+    assert sweep.run_jobs([job], timeout=30) == []
+    assert not running(pid_file)
+
+
+def test_a_job_spills_to_its_own_directory_which_goes_with_it(tmp_path):
+    seen = tmp_path / "seen"
+    job = StubJob(
+        "a/b",
+        [
+            "sh",
+            "-c",
+            f"echo $OEX_DUCKDB_TEMP > {seen}; head -c 65536 /dev/urandom > $TMPDIR/spill.tmp",
+        ],
+    )
+    progress = sweep.Progress([job], tmp_path / "sweep.prom")
+    assert sweep.run_jobs([job], 30, progress, spill_dir=tmp_path / "spill") == []
+    assert seen.read_text().strip() == str(tmp_path / "spill" / "a_b")
+    assert not (tmp_path / "spill" / "a_b").exists()
+    (line,) = [
+        line
+        for line in (tmp_path / "sweep.prom").read_text().splitlines()
+        if line.startswith("oex_sweep_job_spill_peak_bytes")
+    ]
+    assert int(float(line.split()[-1])) >= 65536
+
+
+def test_a_job_over_its_spill_quota_is_ended(tmp_path, capsys):
+    job = StubJob(
+        "big", ["sh", "-c", "head -c 1048576 /dev/urandom > $OEX_DUCKDB_TEMP/x; sleep 60"]
+    )
+    spill_dir = tmp_path / "spill"
+    assert sweep.run_jobs([job], 30, spill_dir=spill_dir, spill_quota=65536) == ["big"]
+    assert "big SPILL over" in capsys.readouterr().err
+    assert list(spill_dir.iterdir()) == []
+
+
+def test_only_spills_of_sweeps_no_longer_running_are_cleared(tmp_path):
+    gone, live = tmp_path / "sweep-999999999", sweep.spill_root(tmp_path)
+    for path in (gone, live):
+        path.mkdir()
+    assert sweep.clear_stale_spills(tmp_path) == [gone]
+    assert live.exists()
+
+
+@pytest.fixture
+def supervisor():
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGUSR1)}
+    supervisor = sweep.Supervisor()
+    supervisor.install()
+    yield supervisor
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+
+
+def test_sigusr1_lets_the_running_job_finish_and_starts_no_more(supervisor):
+    jobs = [
+        StubJob("a", ["sh", "-c", f"kill -USR1 {os.getpid()}; sleep 1"]),
+        StubJob("b", ["true"]),
+    ]
+    assert sweep.run_jobs(jobs, 30, supervisor=supervisor) == []
+    assert (supervisor.draining, supervisor.stopping, supervisor.left) == (True, False, 1)
+
+
+def test_sigterm_is_forwarded_to_the_running_job(supervisor, capsys):
+    jobs = [
+        StubJob("a", ["sh", "-c", f"kill -TERM {os.getpid()}; sleep 60"]),
+        StubJob("b", ["true"]),
+    ]
+    assert sweep.run_jobs(jobs, 30, supervisor=supervisor) == ["a"]
+    assert supervisor.left == 1
+    assert "a STOPPED" in capsys.readouterr().err
+
+
+def test_an_evicted_job_is_requeued_after_the_rest(tmp_path, monkeypatch, capsys):
+    psi = tmp_path / "memory"
+    psi.write_text("some avg10=40.00 avg60=40.00 avg300=40.00 total=1\n")
+    monkeypatch.setattr(watchdog, "PRESSURE_FILE", psi)
+    monkeypatch.setattr(watchdog, "WATCH_SECONDS", 0)
+    monkeypatch.setattr(watchdog, "COOLDOWN_SECONDS", 0)
+    monkeypatch.setattr(watchdog, "EVICT_AFTER", 0)
+    jobs = [
+        StubJob("priority/A", ["sleep", "3"], group="priority", parent="p"),
+        StubJob("normal/B", ["sleep", "1"], group="normal", parent="p"),
+        StubJob("normal/C", ["true"], group="normal"),
+    ]
+    dog = watchdog.Watchdog(tmp_path / "running", {"priority": 0, "normal": 1})
+    assert sweep.run_jobs(jobs, 30, supervisor=sweep.Supervisor(dog)) == []
+    captured = capsys.readouterr()
+    assert "pause normal/B" in captured.err
+    assert "normal/B REQUEUED" in captured.err
+    assert captured.out.index("normal/C:") < captured.out.index("[4/4] normal/B:")
+    assert list((tmp_path / "running").iterdir()) == []
+
+
+def test_progress_is_written_as_a_textfile_while_jobs_run(tmp_path):
+    jobs = [StubJob("a", ["false"]), StubJob("b", ["true"])]
+    progress = sweep.Progress(jobs, tmp_path / "sweep.prom", tmp_path / "last_success.json")
+    sweep.run_jobs(jobs, timeout=30, progress=progress)
+    m = progress.metrics
+    assert m.get("oex_sweep_jobs", group="test", state="queued") == 0
+    assert m.get("oex_sweep_jobs_finished_total", group="test", outcome="failed") == 1
+    assert m.get("oex_sweep_jobs_finished_total", group="test", outcome="succeeded") == 1
+    assert m.get("oex_sweep_job_peak_rss_bytes", job="b", group="test") > 0
+    text = (tmp_path / "sweep.prom").read_text(encoding="utf-8")
+    assert 'oex_sweep_last_success_timestamp_seconds{job="b"}' in text
+    assert 'job="a"}' not in text.split("oex_sweep_last_success_timestamp_seconds")[-1]
+
+
+def test_last_success_outlives_the_sweep_that_recorded_it(tmp_path):
+    successes = tmp_path / "last_success.json"
+    sweep.run_jobs([StubJob("b", ["true"])], 30, sweep.Progress([], None, successes))
+    later = sweep.Progress([StubJob("c", ["true"])], None, successes)
+    assert later.metrics.get("oex_sweep_last_success_timestamp_seconds", job="b") is not None
+
+
 def test_a_second_sweep_cannot_take_the_lock(tmp_path, monkeypatch):
     monkeypatch.setattr(sweep, "WORK_DIR", tmp_path)
     held = sweep.acquire_lock()
@@ -292,3 +458,237 @@ def test_the_shipped_schedule_resolves():
     jobs, _ = resolve(schedule, frequency="monthly")
     assert len(jobs) == 248
     assert all(job.command == "osm" for job in jobs)
+
+
+def test_a_sweep_records_a_span_per_job_and_reports_on_it(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path)
+    log = sweep.EventLog(tmp_path / "events" / "sweep-1.jsonl", "sweep")
+    jobs = [StubJob("a", ["true"], group="priority"), StubJob("b", ["false"], group="normal")]
+    with log.span("sweep", "sweep"):
+        sweep.run_jobs(jobs, 30, sweep.Progress(jobs, event_log=log))
+    assert sweep.report([]) == 0
+    out = capsys.readouterr().out
+    assert "export" in out
+    assert "priority" in out and "normal" in out
+    assert "failed: b" in out
+
+
+def test_profiling_applies_only_to_jobs_matching_the_glob(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    jobs, _ = resolve(countries_schedule({"NPL": "monthly", "NGA": "monthly"}))
+    profiled = sweep.with_profiling(jobs, "priority/NP*", "cprofile", tmp_path)
+    assert [job.profile_dir for job in profiled] == [tmp_path / "priority_NPL", None]
+    argv = profiled[0].argv()
+    assert argv[:5] == ["uv", "run", "python", str(sweep.PROFILE_SCRIPT), "--cprofile"]
+    assert argv[-4:] == ["--config", str(jobs[0].config), "--iso3", "NPL"]
+    assert profiled[1].argv()[:3] == ["uv", "run", "oex-cli"]
+
+
+def test_a_sampled_job_runs_the_wrapper_under_py_spy(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    jobs, _ = resolve(countries_schedule({"NPL": "monthly"}))
+    (job,) = sweep.with_profiling(jobs, "*", "py-spy", tmp_path)
+    argv = job.argv()
+    assert argv[:2] == ["py-spy", "record"]
+    assert argv[argv.index("--") + 1 :][:4] == ["uv", "run", "python", str(sweep.PROFILE_SCRIPT)]
+    assert "--cprofile" not in argv
+
+
+def test_a_sharded_country_splits_its_categories_round_robin(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    monkeypatch.delenv("OEX_MEMORY_GB", raising=False)
+    schedule = countries_schedule({"NPL": {"frequency": "monthly", "shards": 3}})
+    jobs, _ = resolve(schedule)
+    assert [job.id for job in jobs] == [f"priority/NPL/{n}of3" for n in (1, 2, 3)]
+    assert {job.parent for job in jobs} == {"priority/NPL"}
+
+    everything = sweep.config_categories(yaml.safe_load(sweep.BASE_CONFIG.read_text("utf-8")))
+    names = []
+    for job in jobs:
+        raw = yaml.safe_load(job.config.read_text(encoding="utf-8"))
+        assert "categories_file" not in raw
+        assert raw["source"]["osm"]["keep_pbf"] is True
+        names += [category["name"] for category in raw["categories"]]
+    assert sorted(names) == sorted(category["name"] for category in everything)
+    assert jobs[0].env == ()
+    assert dict(jobs[1].env)["OEX_MEMORY_GB"]
+    assert jobs[0].cleanup and jobs[0].cleanup[0].name == "_pbf"
+
+
+def test_a_group_level_shard_count_applies_to_every_country(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    schedule = countries_schedule({"NPL": "monthly", "SDN": "monthly"})
+    schedule["priority"]["shards"] = 2
+    jobs, _ = resolve(schedule)
+    assert [job.id for job in jobs] == [
+        "priority/NPL/1of2",
+        "priority/NPL/2of2",
+        "priority/SDN/1of2",
+        "priority/SDN/2of2",
+    ]
+
+
+def test_shards_after_the_first_run_side_by_side_then_clean_up(tmp_path, capsys):
+    cache = tmp_path / "_pbf"
+    cache.mkdir()
+    lead = ["sh", "-c", f"touch {tmp_path}/lead"]
+
+    def follower(mine, theirs):
+        # Each needs the lead to have finished and the other follower to be running.
+        wait = f"for i in $(seq 50); do test -e {tmp_path}/{theirs} && exit 0; sleep 0.1; done"
+        return ["sh", "-c", f"test -e {tmp_path}/lead && touch {tmp_path}/{mine} && {wait}; exit 1"]
+
+    jobs = [
+        StubJob("heavy/USA/1of3", lead, parent="heavy/USA", cleanup=(cache,)),
+        StubJob(
+            "heavy/USA/2of3", follower("b", "c"), parent="heavy/USA", cleanup=(cache,), stage=1
+        ),
+        StubJob(
+            "heavy/USA/3of3", follower("c", "b"), parent="heavy/USA", cleanup=(cache,), stage=1
+        ),
+    ]
+    assert sweep.run_jobs(jobs, timeout=30) == []
+    assert "heavy/USA: 3/3 job(s) complete" in capsys.readouterr().out
+    assert not cache.exists()
+
+
+def test_a_tiled_country_plans_exports_merges_and_publishes(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    schedule = countries_schedule({"NPL": {"frequency": "monthly", "tiles": 2, "shards": 4}})
+    jobs, _ = resolve(schedule)
+    assert [(job.id, job.stage) for job in jobs] == [
+        ("priority/NPL/plan", 0),
+        ("priority/NPL/tile1of2", 1),
+        ("priority/NPL/tile2of2", 1),
+        ("priority/NPL/merge", 2),
+        ("priority/NPL/publish", 3),
+    ]
+    plan, tile, _, merge, publish = (job.argv() for job in jobs)
+    assert plan[:5] == ["uv", "run", "python", str(sweep.TILE_SCRIPT), "plan"]
+    assert plan[-2:] == ["--tiles", "2"]
+    assert merge[4] == "merge"
+    assert tile[3] == "osm" and tile[5].endswith("NPL.tile1of2.yaml")
+    assert publish[3] == "file" and publish[5].endswith("NPL.tiled.yaml")
+    assert jobs[0].cleanup[0].parts[-2:] == ("tiles", "npl")
+
+
+def test_a_gated_country_builds_then_publishes_what_changed(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    schedule = countries_schedule({"BVT": {"frequency": "monthly", "gate": True}})
+    jobs, _ = resolve(schedule)
+    assert [(job.id, job.stage, job.parent) for job in jobs] == [
+        ("priority/BVT/build", 0, "priority/BVT"),
+        ("priority/BVT/publish", 1, "priority/BVT"),
+    ]
+    build, publish = (job.argv() for job in jobs)
+    assert build[:4] == ["uv", "run", "oex-cli", "osm"]
+    assert build[-2:] == ["--no-hdx-push", "--no-s3"]
+    assert publish[3:5] == [str(sweep.PUBLISH_SCRIPT), "osm"]
+
+    rehearsal, _ = sweep.resolve(schedule, None, None, TODAY, ("--no-hdx-push",))
+    assert [job.id for job in rehearsal] == ["priority/BVT"]
+
+
+def test_a_failed_stage_skips_the_stages_that_depend_on_it(tmp_path, capsys):
+    ran = tmp_path / "ran"
+    jobs = [
+        StubJob("heavy/USA/plan", ["false"], parent="heavy/USA"),
+        StubJob("heavy/USA/tile1of1", ["touch", str(ran)], parent="heavy/USA", stage=1),
+    ]
+    progress = sweep.Progress(jobs)
+    assert sweep.run_jobs(jobs, 30, progress) == ["heavy/USA/plan", "heavy/USA/tile1of1"]
+    assert not ran.exists()
+    assert "SKIPPED" in capsys.readouterr().err
+    m = progress.metrics
+    assert m.get("oex_sweep_jobs", group="test", state="queued") == 0
+    assert m.get("oex_sweep_jobs_finished_total", group="test", outcome="failed") == 2
+
+
+def test_preflight_problems_stop_the_sweep_with_the_full_list(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    jobs, _ = resolve(countries_schedule({"NPL": "monthly", "HKG": "monthly"}))
+    found = {"priority/NPL": [], "priority/HKG": ["geoBoundaries publishes no ADM0", "disk"]}
+    monkeypatch.setattr(sweep.preflight, "run", lambda targets: found)
+    assert sweep.run_preflight(jobs, sweep.EventLog(None, "sweep")) == 4
+    err = capsys.readouterr().err
+    assert "preflight priority/HKG: geoBoundaries publishes no ADM0" in err
+    assert "preflight priority/HKG: disk" in err
+    assert "1/2 job(s)" in err
+
+
+def test_preflight_skips_configs_an_earlier_stage_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "WORK_DIR", tmp_path / "work")
+    jobs, _ = resolve(countries_schedule({"NPL": {"frequency": "monthly", "tiles": 2}}))
+    seen = []
+    monkeypatch.setattr(sweep.preflight, "run", lambda targets: seen.extend(targets) or {})
+    assert sweep.run_preflight(jobs, sweep.EventLog(None, "sweep")) == 0
+    assert [name for name, _, _ in seen] == ["priority/NPL/plan", "priority/NPL/merge"]
+    assert {config for _, config, _ in seen} == {jobs[0].config}
+
+
+def sim_job(job_id, iso3=None, parent=None, stage=0):
+    return sweep.Job(
+        id=job_id,
+        group=job_id.split("/")[0],
+        command="osm",
+        config=sweep.BASE_CONFIG,
+        iso3=iso3,
+        parent=parent,
+        stage=stage,
+    )
+
+
+def test_shards_balance_cost_and_keep_a_country_together():
+    jobs = [
+        sim_job("priority/AFG", "AFG"),
+        sim_job("heavy/USA/1of3", "USA", "heavy/USA"),
+        sim_job("heavy/USA/2of3", "USA", "heavy/USA", 1),
+        sim_job("heavy/USA/3of3", "USA", "heavy/USA", 1),
+        sim_job("normal/ABW:osm", "ABW"),
+        sim_job("normal/ABW:overture", "ABW"),
+        sim_job("events/flood"),
+    ]
+    hours = {"heavy/USA/1of3": 5, "heavy/USA/2of3": 4, "heavy/USA/3of3": 3, "priority/AFG": 6}
+    cost = lambda job: sweep.simulate.Cost(hours.get(job.id, 1) * 3600, 0)
+    plan = sweep.shard_plan(jobs, 2, cost)
+    assert [[job.id for job in shard] for shard in plan] == [
+        [job.id for job in jobs[1:4]],
+        ["priority/AFG", "normal/ABW:osm", "normal/ABW:overture", "events/flood"],
+    ]
+    assert sweep.plan_digest(plan) == sweep.plan_digest(sweep.shard_plan(jobs, 2, cost))
+
+
+def test_one_country_stays_in_one_shard_across_groups():
+    jobs = [sim_job("priority/NPL", "NPL"), sim_job("events/NPL", "npl"), sim_job("normal/ABW")]
+    plan = sweep.shard_plan(jobs, 2, lambda job: sweep.simulate.Cost(3600, 0))
+    assert [[job.id for job in shard] for shard in plan] == [
+        ["priority/NPL", "events/NPL"],
+        ["normal/ABW"],
+    ]
+
+
+def test_every_runner_plans_from_the_first_cost_table(tmp_path, monkeypatch):
+    jobs = [sim_job("priority/AFG", "AFG"), sim_job("normal/ABW", "ABW")]
+    table = tmp_path / "costs.json"
+    local = {"priority/AFG": 5, "normal/ABW": 1}
+    monkeypatch.setattr(
+        sweep, "expected_cost", lambda: ("history", lambda j: sweep.simulate.Cost(local[j.id], 0))
+    )
+    basis, cost = sweep.shared_cost(table, jobs)
+    assert (basis, cost(jobs[0]).seconds) == ("costs.json", 5)
+    # Another runner, with other records, reads the table the first one wrote.
+    local = {"priority/AFG": 1, "normal/ABW": 9}
+    _, cost = sweep.shared_cost(table, jobs)
+    assert [cost(job).seconds for job in jobs] == [5, 1]
+    assert cost(sim_job("events/flood")).seconds == 5
+
+    table.write_text("[]", encoding="utf-8")
+    with pytest.raises(sweep.ScheduleError, match="not a cost table"):
+        sweep.shared_cost(table, jobs)
+
+
+def test_a_shard_that_does_not_exist_is_rejected():
+    assert sweep.parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "two"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            sweep.parse_shard(value)
@@ -0,0 +1,17 @@
+import sync_hdx_frequency
+
+
+def test_only_countries_whose_frequency_moved_are_checked():
+    pairs = [("NPL", "weekly"), ("SDN", "monthly"), ("KEN", "monthly")]
+    snapshot = {"NPL": "monthly", "SDN": "monthly"}
+    assert sync_hdx_frequency.changed(pairs, snapshot) == [("NPL", "weekly"), ("KEN", "monthly")]
+    assert sync_hdx_frequency.changed(pairs, dict(pairs)) == []
+
+
+def test_a_missing_or_broken_snapshot_means_every_country(tmp_path):
+    path = tmp_path / "hdx_frequency.json"
+    assert sync_hdx_frequency.load_snapshot(path) == {}
+    path.write_text("[not a map")
+    assert sync_hdx_frequency.load_snapshot(path) == {}
+    sync_hdx_frequency.save_snapshot(path, {"NPL": "weekly"})
+    assert sync_hdx_frequency.load_snapshot(path) == {"NPL": "weekly"}
@@ -0,0 +1,99 @@
+import json
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import tile_country
+import yaml
+from shapely.geometry import box, shape
+
+
+def test_tiles_share_the_weight_out_evenly():
+    # A dense column at i=0 and a sparse rest: the dense side gets cut more finely.
+    weights = {(i, j): (100 if i == 0 else 1) for i in range(8) for j in range(8)}
+    tiles = tile_country.balanced_tiles(weights, 8, 8, 4)
+    assert len(tiles) == 4
+    loads = [
+        sum(w for (i, j), w in weights.items() if i0 <= i < i1 and j0 <= j < j1)
+        for i0, j0, i1, j1 in tiles
+    ]
+    assert sum(loads) == sum(weights.values())
+    assert max(loads) < 2 * min(loads)
+
+
+def test_tiles_cover_the_grid_without_overlap():
+    weights = {(i, j): 1 for i in range(5) for j in range(3)}
+    tiles = tile_country.balanced_tiles(weights, 5, 3, 3)
+    cells = [(i, j) for i0, j0, i1, j1 in tiles for i in range(i0, i1) for j in range(j0, j1)]
+    assert sorted(cells) == sorted(weights)
+
+
+def test_more_tiles_than_cells_with_data_is_an_error():
+    with pytest.raises(tile_country.TileError):
+        tile_country.balanced_tiles({(0, 0): 5, (1, 0): 5}, 2, 1, 3)
+
+
+def test_every_planned_tile_is_a_piece_of_the_boundary():
+    boundary = box(80.0, 26.0, 88.0, 30.0)
+    density = {(0, 0): 10_000, (63, 31): 10_000}
+    planned = tile_country.plan_tiles(boundary, density, 4)
+    pieces = [shape(tile["geometry"]) for tile in planned]
+    assert all(piece.within(boundary.buffer(1e-9)) for piece in pieces)
+    assert sum(piece.area for piece in pieces) == pytest.approx(boundary.area)
+    assert sum(tile["nodes"] for tile in planned) == 20_000
+
+
+def test_column_names_come_from_each_select_alias():
+    select = ["feature_id AS id", "tags['name:en'] AS name_en", "osm_type", "length(x)"]
+    assert tile_country.column_names(select) == ["id", "name_en", "osm_type"]
+
+
+def test_a_tile_config_exports_its_own_pbf_to_geoparquet_only(tmp_path):
+    work = tmp_path / "tiles"
+    work.mkdir()
+    (work / "tile1.geojson").write_text(json.dumps({"type": "Point"}), encoding="utf-8")
+    config = tmp_path / "NPL.yaml"
+    raw = {
+        "categories": [{"name": "roads"}],
+        "hdx": {"push": True},
+        "source": {"osm": {"engine": "geofabrik"}, "pcodes": {"enabled": True}},
+    }
+    (written,) = tile_country.tile_configs(raw, config, work, [work / "tile1.osm.pbf"], 3.5)
+    assert written == tmp_path / "NPL.tile1of1.yaml"
+    tile = yaml.safe_load(written.read_text(encoding="utf-8"))
+    assert tile["source"]["osm"]["engine"] == "planet"
+    assert tile["source"]["osm"]["pbf_path"] == str(work / "tile1.osm.pbf")
+    assert tile["source"]["osm"]["planet_clip_to_boundary"] is False
+    assert tile["source"]["pcodes"]["enabled"] is True
+    assert tile["output"]["formats"] == ["geoparquet"]
+    assert tile["hdx"]["push"] is False
+    assert tile["parallel"]["memory_gb"] == 3
+    assert json.loads(tile["boundary"]["geom"]) == {"type": "Point"}
+    assert tile["categories"][0]["osm"]["select"] == ["feature_id AS tile_feature_id"]
+
+
+def test_a_tile_drops_only_the_features_an_earlier_tile_kept(tmp_path):
+    # Each feature is kept by the first tile that exported it. A way that only crosses
+    # a corner of tile 1's piece is not in tile 1's extract, so a later tile keeps it.
+    ids = {1: ["way/1", "node/2"], 2: ["way/1", "way/3"], 3: ["node/2", "way/3", "way/4"]}
+    parts = {}
+    for number, tile_ids in ids.items():
+        parts[number] = [tmp_path / f"tile{number}.parquet"]
+        table = pa.table(
+            {
+                "id": tile_ids,
+                tile_country.TILE_ID: tile_ids,
+                "geometry": [b"\x01"] * len(tile_ids),
+            }
+        )
+        pq.write_table(table, parts[number][0])
+    types = {"id": "VARCHAR", tile_country.TILE_ID: "VARCHAR", "geometry": "GEOMETRY"}
+    earlier, kept = [], []
+    for number in ids:
+        query = tile_country.tile_select(parts[number], types, earlier)
+        assert tile_country.TILE_ID not in query.split(" FROM ")[0]
+        kept += [row[0] for row in duckdb.sql(query).fetchall()]
+        earlier += parts[number]
+    assert kept == ["way/1", "node/2", "way/3", "way/4"]
+    assert "ST_Intersects" not in query
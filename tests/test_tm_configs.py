@@ -1,7 +1,10 @@
 import json
+import subprocess
+import sys
 
 import pytest
 import tm_configs
+from events import EventLog
 from omegaconf import OmegaConf
 from upath import UPath
 
@@ -106,9 +109,35 @@ def test_the_template_is_never_mutated_between_projects():
     assert OmegaConf.to_yaml(TEMPLATE, resolve=False) == before
 
 
-def test_an_interval_beyond_the_api_cap_is_rejected():
+def test_an_interval_beyond_the_api_cap_is_rejected(tmp_path):
     with pytest.raises(tm_configs.TaskingManagerError, match="interval"):
-        tm_configs.fetch_active_projects(48, sandbox=False, timeout=1)
+        tm_configs.fetch_active_projects(48, sandbox=False, timeout=1, aoi_dir=tmp_path)
+
+
+def test_features_are_parsed_one_at_a_time_across_reads(monkeypatch):
+    import io
+
+    monkeypatch.setattr(tm_configs, "READ_SIZE", 7)
+    features = [feature(1, [2]), feature(2, ["Roads"], {**GEOM, "name": "Pokhara – east"})]
+    payload = json.dumps({"type": "FeatureCollection", "features": features}, ensure_ascii=False)
+    parsed = list(tm_configs.iter_features(io.BytesIO(payload.encode())))
+    assert parsed == features
+
+
+def test_a_truncated_response_is_an_error():
+    import io
+
+    payload = json.dumps({"features": [feature(1, [2]), feature(2, [2])]})[:-40]
+    with pytest.raises(tm_configs.TaskingManagerError, match="truncated"):
+        list(tm_configs.iter_features(io.BytesIO(payload.encode())))
+
+
+def test_a_spooled_polygon_is_read_back_from_its_file(tmp_path):
+    spooled = tm_configs.spool_feature(feature(7, [2]), tmp_path)
+    assert "geometry" not in spooled
+    assert json.loads((tmp_path / "7.geojson").read_text(encoding="utf-8")) == GEOM
+    cfg = tm_configs.build_config(TEMPLATE, spooled, False)
+    assert json.loads(cfg.boundary.geom) == GEOM
 
 
 def test_sync_writes_new_configs(tmp_path):
@@ -154,11 +183,38 @@ def test_the_osmium_config_holds_one_extract_per_project(tmp_path):
     assert set(outputs) == {"1", "2"}
 
 
+def test_extract_passes_are_bounded_by_count_and_memory():
+    features = [feature(n, [2]) for n in range(1, 11)]
+    by_count = tm_configs.plan_extract_batches(features, 4, memory_gb=64, mb_per_extract=300)
+    assert [len(batch) for batch in by_count] == [4, 3, 3]
+    by_memory = tm_configs.plan_extract_batches(features, 50, memory_gb=1.5, mb_per_extract=300)
+    assert [len(batch) for batch in by_memory] == [5, 5]
+    assert [f for batch in by_memory for f in batch] == features
+
+
+def test_passes_run_side_by_side_only_as_memory_allows(monkeypatch):
+    monkeypatch.setattr(tm_configs.os, "cpu_count", lambda: 16)
+    batches = [[feature(n, [2])] * 5 for n in range(4)]
+    assert tm_configs.extract_workers(batches, memory_gb=3, mb_per_extract=300) == 2
+    assert tm_configs.extract_workers(batches, memory_gb=64, mb_per_extract=300) == 4
+    assert tm_configs.extract_workers(batches, memory_gb=1, mb_per_extract=300) == 1
+
+
 def test_each_extract_gets_its_own_polygon_file(tmp_path):
     tm_configs.write_osmium_config([feature(1, [2])], tmp_path)
     assert json.loads((tmp_path / "1.geojson").read_text(encoding="utf-8")) == GEOM
 
 
+def test_polygons_left_beside_the_extracts_are_pruned(tmp_path):
+    for name in ("1.geojson", "22.geojson", "22.osm.pbf", "area.geojson"):
+        (tmp_path / name).write_text("{}", encoding="utf-8")
+    assert sorted(p.name for p in tm_configs.prune_polygons(tmp_path)) == [
+        "1.geojson",
+        "22.geojson",
+    ]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["22.osm.pbf", "area.geojson"]
+
+
 def test_extract_needs_the_source_pbf_in_the_environment(tmp_path, monkeypatch):
     monkeypatch.delenv(tm_configs.PBF_ENV, raising=False)
     with pytest.raises(tm_configs.TaskingManagerError, match=tm_configs.PBF_ENV):
@@ -192,7 +248,10 @@ def test_a_local_source_is_not_copied(tmp_path):
     assert tm_configs.ensure_local_pbf(str(local), tmp_path / "cache") == local
 
 
-def test_a_remote_source_is_downloaded_once_and_then_reused(tmp_path, memory_exports, capsys):
+def test_a_remote_source_is_downloaded_once_and_then_reused(
+    tmp_path, memory_exports, capsys, monkeypatch
+):
+    monkeypatch.setenv("OEX_DATA_DIR", str(tmp_path))
     remote = f"{memory_exports}/2026-08-06/sandbox-export.pbf"
     first = tm_configs.ensure_local_pbf(remote, tmp_path)
     assert first.read_bytes() == b"PBFDATA"
@@ -212,3 +271,208 @@ def test_sandbox_extract_reads_its_own_source_variable(tmp_path, monkeypatch):
     monkeypatch.delenv(tm_configs.SANDBOX_PBF_ENV, raising=False)
     with pytest.raises(tm_configs.TaskingManagerError, match=tm_configs.SANDBOX_PBF_ENV):
         tm_configs.cut_project_extracts([feature(1, [2])], sandbox=True, pbf_dir=tmp_path)
+
+
+def circle(vertices=2000, radius=0.01):
+    import math
+
+    ring = [
+        [
+            85.3 + radius * math.cos(2 * math.pi * i / vertices),
+            27.7 + radius * math.sin(2 * math.pi * i / vertices),
+        ]
+        for i in range(vertices)
+    ]
+    return {"type": "Polygon", "coordinates": [ring + [ring[0]]]}
+
+
+def test_simplification_drops_vertices_but_never_shrinks_the_polygon():
+    from shapely.geometry import shape
+
+    dense = circle()
+    prepared = tm_configs.prepare_geometry(dense, tolerance_m=20, precision=6)
+    assert tm_configs.vertex_count(prepared) < tm_configs.vertex_count(dense) / 10
+    assert shape(prepared).covers(shape(dense))
+
+
+def test_precision_trims_coordinates():
+    prepared = tm_configs.prepare_geometry(circle(50), tolerance_m=0, precision=5)
+    for x, y in prepared["coordinates"][0]:
+        assert round(x, 5) == x and round(y, 5) == y
+
+
+def test_an_invalid_ring_is_repaired():
+    from shapely.geometry import shape
+
+    bowtie = {"type": "Polygon", "coordinates": [[[0, 0], [1, 1], [1, 0], [0, 1], [0, 0]]]}
+    prepared = tm_configs.prepare_geometry(bowtie, tolerance_m=0, precision=None)
+    assert shape(prepared).is_valid
+    assert shape(prepared).area > 0
+
+
+def test_preparing_every_feature_reports_the_vertex_reduction(capsys):
+    features = [feature(1, [2], geom=circle()), feature(2, [2], geom=GEOM)]
+    before, after = tm_configs.prepare_geometries(features, 20, 6)
+    assert before > after
+    assert features[0]["geometry"] != circle()
+    assert "fewer" in capsys.readouterr().out
+
+
+def test_the_tag_filter_is_the_union_of_the_template_categories():
+    assert tm_configs.tag_filter_expressions(TEMPLATE) == [
+        "nwr/building",
+        "nwr/highway",
+        "nwr/landuse",
+        "nwr/natural=bay,water,wetland",
+        "nwr/water",
+        "nwr/waterway",
+    ]
+
+
+def test_the_seagrass_template_filters_on_its_one_tag():
+    seagrass = OmegaConf.create(
+        (tm_configs.REPO_ROOT / "configs" / "seagrass_extract.yaml").read_text(encoding="utf-8")
+    )
+    assert tm_configs.tag_filter_expressions(seagrass) == ["nwr/seamark:type=seagrass"]
+
+
+def test_any_value_wins_over_a_value_list_for_the_same_key():
+    template = OmegaConf.create(
+        {
+            "categories": [
+                {"name": "a", "osm": {"filter": {"building": ["school"]}}},
+                {"name": "b", "osm": {"filter": {"building": True}}},
+            ]
+        }
+    )
+    assert tm_configs.tag_filter_expressions(template) == ["nwr/building"]
+
+
+def test_a_category_without_a_filter_disables_prefiltering():
+    template = OmegaConf.create({"categories": [{"name": "all", "osm": {"select": ["*"]}}]})
+    assert tm_configs.tag_filter_expressions(template) is None
+
+
+@pytest.fixture
+def fake_osmium(tmp_path, monkeypatch):
+    """An `osmium` on PATH that writes its -o argument and logs each call."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "osmium"
+    script.write_text(
+        '#!/bin/sh\necho "$@" >> "$(dirname "$0")/calls"\n'
+        'while [ $# -gt 0 ]; do [ "$1" = "-o" ] && echo filtered > "$2"; shift; done\n',
+        encoding="utf-8",
+    )
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{tm_configs.os.environ['PATH']}")
+    return bin_dir / "calls"
+
+
+def test_the_prefiltered_source_is_cut_once_and_then_reused(tmp_path, fake_osmium):
+    source = tmp_path / "planet.osm.pbf"
+    source.write_bytes(b"pbf")
+    first = tm_configs.prefilter_source(source, ["nwr/building"], tmp_path)
+    second = tm_configs.prefilter_source(source, ["nwr/building"], tmp_path)
+    assert first == second
+    assert first.read_text(encoding="utf-8") == "filtered\n"
+    assert len(fake_osmium.read_text(encoding="utf-8").splitlines()) == 1
+
+
+def test_a_new_filter_replaces_the_old_prefiltered_file(tmp_path, fake_osmium):
+    source = tmp_path / "planet.osm.pbf"
+    source.write_bytes(b"pbf")
+    old = tm_configs.prefilter_source(source, ["nwr/building"], tmp_path)
+    new = tm_configs.prefilter_source(source, ["nwr/highway"], tmp_path)
+    assert new != old
+    assert not old.exists()
+
+
+def pbf(path, header, *blocks):
+    """A PBF's framing around opaque blobs: one OSMHeader, then OSMData."""
+
+    def framed(kind, blob):
+        header_msg = bytes([0x0A, len(kind)]) + kind + bytes([0x18, len(blob)])
+        return len(header_msg).to_bytes(4, "big") + header_msg + blob
+
+    data = framed(b"OSMHeader", header) + b"".join(framed(b"OSMData", b) for b in blocks)
+    path.write_bytes(data)
+    return path
+
+
+def test_an_extract_digest_ignores_the_header_block(tmp_path):
+    today = pbf(tmp_path / "a.osm.pbf", b"replication 2026-09-01", b"nodes", b"ways")
+    tomorrow = pbf(tmp_path / "b.osm.pbf", b"replication 2026-09-02", b"nodes", b"ways")
+    edited = pbf(tmp_path / "c.osm.pbf", b"replication 2026-09-02", b"nodes", b"ways, one more")
+    assert tm_configs.extract_digest(today) == tm_configs.extract_digest(tomorrow)
+    assert tm_configs.extract_digest(today) != tm_configs.extract_digest(edited)
+
+
+def test_unchanged_projects_are_not_exported_again(tmp_path, capsys):
+    config = tmp_path / "4242.yaml"
+    config.write_text("dataset_name: Tasking Manager Project 4242\n", encoding="utf-8")
+    extract = pbf(tmp_path / "4242.osm.pbf", b"header", b"nodes")
+    fingerprint = tm_configs.export_fingerprint(config, extract)
+    exported = tmp_path / "exported.json"
+    exported.write_text(json.dumps({"4242": fingerprint}), encoding="utf-8")
+
+    assert tm_configs.export_fingerprint(config, None) is None
+    assert (
+        tm_configs.export_configs([config], None, None, None, {config: fingerprint}, exported) == 0
+    )
+    out = capsys.readouterr().out
+    assert "skip" in out and "export complete 0/0, 1 unchanged skipped" in out
+
+
+def test_a_failing_project_does_not_stop_its_batch(tmp_path, monkeypatch):
+    import oex.config.loader
+    import oex.exporter
+    import tm_export_batch
+
+    class Exporter:
+        def __init__(self, cfg, runner):
+            self.cfg = cfg
+
+        def run(self):
+            if self.cfg.name == "1.yaml":
+                raise RuntimeError("geofabrik is down")
+            return type("Result", (), {"failed": 0})()
+
+    monkeypatch.setattr(oex.config.loader, "load_config", lambda path: path)
+    monkeypatch.setattr(oex.exporter, "Exporter", Exporter)
+    results = tmp_path / "results.jsonl"
+    argv = ["tm_export_batch.py", "--results", str(results), "1.yaml", "2.yaml"]
+    monkeypatch.setattr("sys.argv", argv)
+    assert tm_export_batch.main() == 1
+    records = [json.loads(line) for line in results.read_text(encoding="utf-8").splitlines()]
+    assert [(r["project"], r["ok"]) for r in records] == [("1", False), ("2", True)]
+
+
+def test_a_hung_project_fails_alone(tmp_path, monkeypatch):
+    script = tmp_path / "batch.py"
+    script.write_text(
+        "import json, pathlib, sys, time\n"
+        "results = pathlib.Path(sys.argv[2])\n"
+        "for path in sys.argv[3:]:\n"
+        "    if pathlib.Path(path).stem == '2':\n"
+        "        time.sleep(60)\n"
+        "    with results.open('a') as out:\n"
+        "        record = {'project': pathlib.Path(path).stem, 'ok': True}\n"
+        "        out.write(json.dumps({**record, 'seconds': 0, 'peak_rss': 0}) + '\\n')\n",
+        encoding="utf-8",
+    )
+    popen = subprocess.Popen
+    monkeypatch.setattr(
+        tm_configs.subprocess,
+        "Popen",
+        lambda argv, **kwargs: popen([sys.executable, str(script), *argv[4:]], **kwargs),
+    )
+    monkeypatch.setattr(tm_configs, "WORK_DIR", tmp_path / "work")
+    monkeypatch.setattr(tm_configs, "BATCH_POLL_SECONDS", 0.05)
+    paths = [tmp_path / f"{n}.yaml" for n in (1, 2, 3)]
+    outcomes = tm_configs._export_batches(paths, 3, EventLog(None, "tm"), project_timeout=1)
+    assert [(path.stem, ok) for path, ok, _, _ in outcomes] == [
+        ("1", True),
+        ("2", False),
+        ("3", True),
+    ]
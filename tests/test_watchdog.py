@@ -0,0 +1,71 @@
+import os
+import subprocess
+
+import watchdog
+from watchdog import Entry
+
+GB = 1024**3
+
+
+def entry(pgid, rank, rss, paused_at=None, requeue=True):
+    return Entry(pgid, f"job{pgid}", f"group{rank}", rank, os.getpid(), requeue, paused_at, rss)
+
+
+def test_pressure_is_read_from_the_some_line(tmp_path):
+    psi = tmp_path / "memory"
+    psi.write_text(
+        "some avg10=31.50 avg60=2.00 avg300=0.10 total=99\n"
+        "full avg10=12.00 avg60=1.00 avg300=0.00 total=42\n"
+    )
+    assert watchdog.pressure(psi) == 31.5
+    assert watchdog.pressure(tmp_path / "absent") is None
+
+
+def test_the_latest_group_is_paused_first_and_the_last_job_only_when_critical():
+    priority, normal, big = entry(1, 0, 9 * GB), entry(2, 2, GB), entry(3, 2, 4 * GB)
+    assert watchdog.decide([priority, normal, big], 50, 0) == ("pause", big)
+    assert watchdog.decide([priority], 50, 0) is None
+    assert watchdog.decide([priority], watchdog.CRITICAL_AT, 0) == ("pause", priority)
+    requeued = entry(4, 0, GB, requeue=False)
+    assert watchdog.decide([requeued], watchdog.CRITICAL_AT, 0) is None
+    assert watchdog.decide([priority, normal, big], 10, 0) is None
+
+
+def test_a_job_paused_long_enough_is_evicted_once_and_the_best_resumes():
+    priority = entry(1, 0, GB)
+    paused = entry(2, 2, GB, paused_at=0)
+    twice = entry(3, 1, GB, paused_at=0, requeue=False)
+    assert watchdog.decide([priority, paused, twice], 50, watchdog.EVICT_AFTER) == (
+        "evict",
+        paused,
+    )
+    assert watchdog.decide([priority, paused, twice], 50, 1) is None
+    assert watchdog.decide([priority, paused, twice], 1, 1) == ("resume", twice)
+
+
+def test_group_rss_counts_a_job_s_whole_group():
+    process = subprocess.Popen(["sh", "-c", "sleep 5 & sleep 5"], start_new_session=True)
+    try:
+        assert watchdog.group_rss().get(process.pid, 0) > 0
+    finally:
+        os.killpg(process.pid, 9)
+        process.wait()
+
+
+def test_a_pause_is_counted_until_the_job_resumes(tmp_path, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(watchdog.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(watchdog, "pressure", lambda: 50.0)
+    monkeypatch.setattr(watchdog, "_signal", lambda pgid, sig: None)
+    monkeypatch.setattr(watchdog, "group_rss", lambda: {1: GB, 2: 2 * GB})
+    dog = watchdog.Watchdog(tmp_path, {"a": 0, "b": 1})
+    dog.track(1, "job1", "a", True)
+    dog.track(2, "job2", "b", True)
+    dog.poll({1, 2})
+    clock[0] += 30
+    assert dog.paused_seconds(2) == 30 and dog.paused_seconds(1) == 0
+
+    monkeypatch.setattr(watchdog, "pressure", lambda: 1.0)
+    dog.poll({1, 2})
+    clock[0] += 30
+    assert dog.paused_seconds(2) == 30